@@ -0,0 +1,470 @@
+import math
+import time
+from bisect import insort
+from collections import OrderedDict, deque
+from typing import Collection, Dict, Hashable, Iterable, NamedTuple, Optional
+
+
+class RunningStats:
+    """
+    Count, mean, variance, min and max of a stream of values in constant memory.
+
+    Uses Welford's online algorithm, so the variance stays accurate over long runs where
+    the naive sum of squares would lose precision. Two instances can be merged.
+    """
+
+    __slots__ = ('count', 'mean', '_m2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean  = 0.0
+        self._m2   = 0.0
+        self.min   = None
+        self.max   = None
+
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2  += delta * (value - self.mean)
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+
+    def merge(self, other: 'RunningStats') -> None:
+        '''
+        Add all the values summarized by another instance (Chan et al. parallel variance).
+        '''
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2, self.min, self.max = other.count, other.mean, other._m2, other.min, other.max
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2  += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    @property
+    def variance(self) -> float | None:
+        """
+        Sample variance, None with less than two values.
+        """
+        return self._m2 / (self.count - 1) if self.count > 1 else None
+
+
+    @property
+    def stddev(self) -> float | None:
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'variance': self.variance,
+            'min': self.min,
+            'max': self.max,
+        }
+
+
+class P2Quantile:
+    """
+    Approximate quantile of a stream of values in constant memory.
+
+    Implements the P-square algorithm (Jain & Chlamtac, 1985): five markers track the
+    minimum, the maximum, the quantile and two points half way to it, and are moved
+    with a piecewise parabolic fit as values arrive. Exact for the first five values.
+
+    Args:
+        p (float): Quantile to estimate, between 0 and 1
+    """
+
+    __slots__ = ('p', '_heights', '_positions', '_desired', '_increments')
+
+    def __init__(self, p: float):
+        if not 0 < p < 1:
+            raise ValueError("p must be between 0 and 1")
+
+        self.p           = p
+        self._heights    = []
+        self._positions  = [1, 2, 3, 4, 5]
+        self._desired    = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+
+    def add(self, value: float) -> None:
+        heights, positions = self._heights, self._positions
+
+        if len(heights) < 5:
+            insort(heights, value)
+            return
+
+        # find the cell of the value and stretch the extreme markers if needed
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.__parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self.__linear(i, d)
+                heights[i] = height
+                positions[i] += d
+
+
+    def __parabolic(self, i: int, d: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+
+
+    def __linear(self, i: int, d: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+
+
+    @property
+    def value(self) -> float | None:
+        """
+        Current estimate, None if no value was added.
+        """
+        if not self._heights:
+            return None
+        if len(self._heights) < 5: # not enough values for the markers yet, exact nearest rank
+            return self._heights[min(len(self._heights) - 1, int(self.p * len(self._heights)))]
+        return self._heights[2]
+
+
+class RollingWindow:
+    """
+    Count, mean, variance, min and max of the values added in the last seconds.
+
+    Values are added in batches (one per tick) and expire together. The window keeps one
+    entry of sums per batch, adding and expiring a batch is O(1) amortized, min and max
+    are kept with monotonic queues. Memory is bounded by the number of batches in the window.
+
+    Args:
+        seconds (float): Length of the window
+    """
+
+    __slots__ = ('seconds', '_batches', '_count', '_sum', '_sumsq', '_mins', '_maxs')
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("seconds can not be zero or negative")
+
+        self.seconds  = seconds
+        self._batches = deque() # (time, count, sum, sum of squares), oldest first
+        self._count   = 0
+        self._sum     = 0.0
+        self._sumsq   = 0.0
+        self._mins    = deque() # (time, min), increasing mins
+        self._maxs    = deque() # (time, max), decreasing maxs
+
+
+    def add(self, stats: RunningStats, now: float) -> None:
+        '''
+        Add a batch of values summarized by stats, at time now (time.monotonic()).
+        '''
+        if stats.count == 0:
+            return
+
+        total = stats.mean * stats.count
+        sumsq = stats._m2 + stats.mean * total
+        self._batches.append((now, stats.count, total, sumsq))
+        self._count += stats.count
+        self._sum   += total
+        self._sumsq += sumsq
+
+        while self._mins and self._mins[-1][1] >= stats.min:
+            self._mins.pop()
+        self._mins.append((now, stats.min))
+        while self._maxs and self._maxs[-1][1] <= stats.max:
+            self._maxs.pop()
+        self._maxs.append((now, stats.max))
+
+
+    def expire(self, now: float) -> None:
+        '''
+        Drop the batches older than the window.
+        '''
+        oldest = now - self.seconds
+        while self._batches and self._batches[0][0] <= oldest:
+            _, count, total, sumsq = self._batches.popleft()
+            self._count -= count
+            self._sum   -= total
+            self._sumsq -= sumsq
+        while self._mins and self._mins[0][0] <= oldest:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] <= oldest:
+            self._maxs.popleft()
+        if not self._batches: # drop the float noise of the subtractions
+            self._count, self._sum, self._sumsq = 0, 0.0, 0.0
+
+
+    def as_dict(self, now: float = None) -> Dict:
+        """
+        Statistics of the window at time now.
+
+        Args:
+            now (float, optional): time.monotonic() value. Defaults to the current time.
+
+        Returns:
+            Dict: count, mean, variance, min, max and ticks (batches in the window)
+        """
+        self.expire(time.monotonic() if now is None else now)
+        count = self._count
+        mean = self._sum / count if count else None
+        variance = None
+        if count > 1:
+            variance = max(0.0, (self._sumsq - self._sum * mean) / (count - 1))
+        return {
+            'count': count,
+            'mean': mean,
+            'variance': variance,
+            'min': self._mins[0][1] if self._mins else None,
+            'max': self._maxs[0][1] if self._maxs else None,
+            'ticks': len(self._batches),
+        }
+
+
+class TickResult(NamedTuple):
+    """
+    The outcome of one sampling tick, as yielded by CalculateAveragePM25.ticks().
+
+    Attributes:
+        name (str): Tick name, e.g. "Tick-60s"
+        index (int): Position of the tick in the run
+        state (str): DONE or FAILED
+        values (Dict[Hashable, float]): PM2.5 value of every station that answered, by station id
+        stats (Dict): count, mean, variance, min and max of the tick's values
+        windows (Dict[float, Dict]): Rolling window statistics after the tick, by window seconds
+        late (int): Stations left out because they missed the tick's time limit
+    """
+    name: str
+    index: int
+    state: str
+    values: Dict[Hashable, float]
+    stats: Dict
+    windows: Dict[float, Dict]
+    late: int = 0
+
+
+class StreamingAggregator:
+    """
+    Incremental statistics of the PM2.5 samples of a run.
+
+    Every sampling tick is added once with the values of the stations that answered. Overall,
+    per station and per tick statistics are updated as ticks arrive and can be read in O(1)
+    without keeping the samples. Memory is bounded by the number of stations, the optional
+    quantile estimators and the last tick_history ticks. Optional rolling windows give the
+    statistics of the last minutes of a run while it is still going.
+
+    Any object with the same add_tick/reset/mean/count members can be used in its place,
+    see CalculateAveragePM25.set_aggregator.
+
+    Args:
+        quantiles (Iterable[float], optional): Quantiles to estimate, e.g. (0.5, 0.95). Defaults to none.
+        tick_history (int, optional): Number of most recent ticks to keep statistics for. Defaults to 1440.
+        windows (Iterable[float], optional): Lengths in seconds of rolling windows to maintain,
+            e.g. (300, 900, 3600). Defaults to none.
+    """
+
+    def __init__(self, quantiles: Iterable[float] = (), tick_history: int = 1440, windows: Iterable[float] = ()):
+
+        if tick_history < 0:
+            raise ValueError("tick_history can not be negative")
+
+        self.quantiles    = tuple(quantiles)
+        self.tick_history = tick_history
+        self.window_sizes = tuple(windows)
+        self.reset()
+
+
+    def reset(self) -> None:
+        '''
+        Drop all statistics.
+        '''
+        self.overall      = RunningStats()
+        self.per_station  = {}            # station id -> RunningStats
+        self.per_tick     = OrderedDict() # tick -> RunningStats, oldest first
+        self.reused       = 0             # samples that repeated a station's previous measurement
+        self.__tick_reused = {}           # tick -> reused samples, same ticks as per_tick
+        self.__estimators = {p: P2Quantile(p) for p in self.quantiles}
+        self.windows      = {seconds: RollingWindow(seconds) for seconds in self.window_sizes}
+
+
+    def add_tick(self, tick: Hashable, values: Dict[Hashable, float], reused: Collection[Hashable] = ()) -> None:
+        """
+        Add the values of one sampling tick.
+
+        Args:
+            tick (Hashable): Tick identifier, e.g. the scheduler's tick name
+            values (Dict[Hashable, float]): PM2.5 value of every station that answered, by station id
+            reused (Collection[Hashable], optional): Stations of values whose value is their last
+                fetched one, because they can not have published a new measurement yet
+        """
+        tick_stats = self.__tick_stats(tick, len(reused))
+
+        for station, value in values.items():
+            self.overall.add(value)
+            tick_stats.add(value)
+
+            station_stats = self.per_station.get(station)
+            if station_stats is None:
+                station_stats = self.per_station[station] = RunningStats()
+            station_stats.add(value)
+
+            for estimator in self.__estimators.values():
+                estimator.add(value)
+
+        if self.windows:
+            added = RunningStats()
+            for value in values.values():
+                added.add(value)
+            now = time.monotonic()
+            for window in self.windows.values():
+                window.add(added, now)
+
+
+    def add_stats(self, tick: Hashable, stats: RunningStats, reused: int = 0) -> None:
+        """
+        Add the summary of the values of one sampling tick, e.g. merged from worker processes.
+        Per station statistics and quantiles need the values themselves and are not updated.
+
+        Args:
+            tick (Hashable): Tick identifier, e.g. the scheduler's tick name
+            stats (RunningStats): Summary of the values of the tick
+            reused (int, optional): Number of values that repeated a station's last measurement
+        """
+        self.__tick_stats(tick, reused).merge(stats)
+        self.overall.merge(stats)
+
+        now = time.monotonic()
+        for window in self.windows.values():
+            window.add(stats, now)
+
+
+    def __tick_stats(self, tick: Hashable, reused: int) -> RunningStats:
+        '''
+        Statistics of a tick, created (and the oldest dropped) for a new tick. Counts the reused values.
+        '''
+        tick_stats = self.per_tick.get(tick)
+        if tick_stats is None:
+            tick_stats = RunningStats()
+            if self.tick_history:
+                self.per_tick[tick] = tick_stats
+                self.__tick_reused[tick] = 0
+                while len(self.per_tick) > self.tick_history:
+                    del self.__tick_reused[self.per_tick.popitem(last=False)[0]]
+
+        self.reused += reused
+        if tick in self.__tick_reused:
+            self.__tick_reused[tick] += reused
+        return tick_stats
+
+
+    @property
+    def count(self) -> int:
+        return self.overall.count
+
+
+    def mean(self) -> float | None:
+        """
+        Mean of all the samples, None if there are none.
+        """
+        return self.overall.mean if self.overall.count else None
+
+
+    def quantile(self, p: float) -> float | None:
+        """
+        Approximate quantile of all the samples.
+
+        Args:
+            p (float): One of the quantiles given to the constructor
+
+        Returns:
+            float: The estimate or None if there are no samples
+        """
+        estimator = self.__estimators.get(p)
+        if estimator is None:
+            raise KeyError(f"quantile {p} is not tracked, pass it to the constructor")
+        return estimator.value
+
+
+    def stats(self) -> Dict:
+        """
+        Overall statistics.
+
+        Returns:
+            Dict: count, mean, variance, min, max, reused and one p<N> entry per tracked quantile (e.g. p95)
+        """
+        stats = self.overall.as_dict()
+        stats['reused'] = self.reused
+        for p, estimator in self.__estimators.items():
+            stats[f"p{p * 100:g}"] = estimator.value
+        return stats
+
+
+    def window_stats(self, seconds: float) -> Dict:
+        """
+        Statistics of the values added in the last seconds.
+
+        Args:
+            seconds (float): One of the windows given to the constructor
+
+        Returns:
+            Dict: count, mean, variance, min, max and ticks, see RollingWindow.as_dict
+        """
+        window = self.windows.get(seconds)
+        if window is None:
+            raise KeyError(f"window {seconds} is not tracked, pass it to the constructor")
+        return window.as_dict()
+
+
+    def station_stats(self, station: Hashable) -> Optional[Dict]:
+        """
+        Statistics of one station, None if it never answered.
+        """
+        stats = self.per_station.get(station)
+        return stats.as_dict() if stats is not None else None
+
+
+    def tick_stats(self, tick: Hashable) -> Optional[Dict]:
+        """
+        Statistics of one tick, None if unknown or older than tick_history.
+        """
+        stats = self.per_tick.get(tick)
+        if stats is None:
+            return None
+        stats = stats.as_dict()
+        stats['reused'] = self.__tick_reused[tick]
+        return stats
@@ -1,15 +1,37 @@
-import requests
-from threading import Thread, Timer, Lock, current_thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Optional, Tuple, Dict
+import queue
+import time
+from datetime import datetime
+from threading import Lock
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Callable, Iterator, List, Optional, Set, Tuple, Dict
 import logging
 
-logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+from .transport import HTTPTransport, request_errors
+from .station_cache import StationCache
+from .aggregator import RunningStats, StreamingAggregator, TickResult
+from .ratelimit import TokenBucket, AdaptiveConcurrency
+from .retry import RetryPolicy, HedgePolicy
+from .freshness import FreshnessTracker
+from .metrics import MetricsHook, MAP_ENDPOINT, GEO_ENDPOINT, UID_ENDPOINT
+from .response_cache import ResponseCache
+from .decoding import ResponseDecoder, FeedDecoder
+from .sample_store import SampleStore
+from .scheduler import Tick, TickScheduler, sampling_interval, tick_count, SKIP, OVERRUN_POLICIES
+from .stations import Station, Tiling, split_bounds, is_truncated, merge_stations, station_key
 
 
 # API URLs
+API_BASE = "https://api.waqi.info"
 MAP_API = "https://api.waqi.info/v2/map/bounds?latlng={lat1},{lng1},{lat2},{lng2}&networks=all&token={token}"
 GEO_API = "https://api.waqi.info/feed/geo:{lat};{lon}/?token={token}"
+UID_API = "https://api.waqi.info/feed/@{uid}/?token={token}"
+
+# Sampling modes
+STATION_MODE = 'station' # one feed request per station per tick
+MAP_MODE     = 'map'     # one map query per tick, values are the stations' map AQI
+HYBRID_MODE  = 'hybrid'  # map query, feed requests only for stations without a map value
 
 class CalculateAveragePM25:
     """
@@ -18,6 +40,7 @@ class CalculateAveragePM25:
     This class enables periodic sampling of PM2.5 data from multiple air quality monitoring 
     stations within a defined geographical area. It uses threading to efficiently collect data 
     from multiple stations concurrently and supports configurable sampling periods and rates.
+    Sampling ticks are fired by a single scheduler thread at monotonic deadlines.
 
     Attributes:
         state (str): Current state of the sampling process. Possible values:
@@ -34,11 +57,20 @@ class CalculateAveragePM25:
         longitude_1 (float): First longitude coordinate of the bounding box
         latitude_2 (float): Second latitude coordinate of the bounding box
         longitude_2 (float): Second longitude coordinate of the bounding box
-        sampling_period (int, optional): Total duration of sampling in minutes. Defaults to 5.
-        sampling_rate (int, optional): Number of samples to collect per minute. Defaults to 1.
+        sampling_period (float, optional): Total duration of sampling in minutes, None to sample
+            until stop_sampling is called. Defaults to 5.
+        sampling_rate (float, optional): Number of samples to collect per minute, can be fractional
+            or above 60. Defaults to 1.
+        transport (HTTPTransport, optional): Pooled HTTP session to use for API calls. Can be shared
+            between analyzers. Defaults to a private transport with a pool sized to thread_cnt.
+        station_cache (StationCache, optional): Cache of discovered stations, can be shared between
+            analyzers and processes. Defaults to None (stations are discovered once per analyzer).
+        aggregator (StreamingAggregator, optional): Receives the values of every tick. Defaults to a
+            StreamingAggregator without quantiles.
     """
 
-    def __init__(self, latitude_1, longitude_1, latitude_2, longitude_2, sampling_period=5, sampling_rate=1):
+    def __init__(self, latitude_1, longitude_1, latitude_2, longitude_2, sampling_period=5, sampling_rate=1,
+                 transport=None, station_cache=None, aggregator=None):
 
         self.logger = logging.getLogger(self.__class__.__name__)
         self.set_logger_level('info')
@@ -59,19 +91,47 @@ class CalculateAveragePM25:
             raise ValueError("sampling_rate can not be zero or negative")
         
 
-        self.__sampling_period = sampling_period
-        self.__sampling_rate   = sampling_rate
-        self._thread_timeout   = sampling_period * 60 + 5 # 5 seconds extra if needed
-
-        self.__stations = [] # holds station coordinates
-        self.pm25data   = []
-
-        self.__timer_threads = {}
-        self.__lock = Lock()
+        self._sampling_period = sampling_period
+        self._sampling_rate   = sampling_rate
+        self._thread_timeout  = None if sampling_period is None else sampling_period * 60 + 5 # 5 seconds extra if needed
+
+        self._stations = [] # holds station coordinates
+        self.aggregator = aggregator if aggregator is not None else StreamingAggregator()
+
+        self._scheduler   = None
+        self._tick_total  = None      # ticks planned for the run, None if open-ended
+        self._tick_states = Counter() # number of fired ticks in each state
+        self._lock = Lock()
+        self._future         = None # Future of the current run, see the future property
+        self._tick_callbacks = []
+        self._done_callbacks = []
+        self._subscribers    = [] # queues of the ticks() iterators of the current run
         self.thread_cnt      = 8 # can be adjusted for performance
-        
 
-    def __handle_api_error(self, error: dict) -> None:
+        self.__transport      = transport
+        self.__owns_transport = transport is None
+        self.station_cache    = station_cache
+        self.tiling           = None # single map query for the whole box
+        self.sampling_mode    = STATION_MODE
+        self.rate_limiter        = None # TokenBucket, shared by all ticks
+        self.concurrency_limiter = None # AdaptiveConcurrency, fixed thread_cnt if None
+        self.retry_policy        = None # RetryPolicy, failed requests are not retried if None
+        self.hedge_policy        = None # HedgePolicy, slow requests are not hedged if None
+        self.freshness           = None # FreshnessTracker, every station is fetched every tick if None
+        self.api_base            = None # scheme and host replacing API_BASE, e.g. a local stand-in
+        self.metrics             = None # MetricsHook, nothing is measured if None
+        self.response_cache      = None # ResponseCache, identical concurrent requests are all sent if None
+        self.decoder             = FeedDecoder() # turns response bodies into JSON data
+        self.overrun_policy      = SKIP # what happens to the ticks due while a tick overruns
+        self.max_backlog         = 1    # overdue ticks kept by the QUEUE policy
+        self.tick_timeout        = None # seconds after its deadline a tick stops waiting for stations
+        self.sample_store        = None # SampleStore, samples are not kept after the run if None
+        self._coords             = {}   # (lat, lon) of the stations by station id
+        self.__hedge_executor    = None
+        self.__fetch_pool        = None # station requests of the current run, see _fetch_values
+        self.__fetching          = {}   # station key -> request still running in the fetch pool
+
+    def _handle_api_error(self, error: dict) -> None:
         """
         Handle API errors and print the message.
         
@@ -88,31 +148,28 @@ class CalculateAveragePM25:
         Returns:
             float: Average PM2.5 value
         """
-        if self.pm25data == []:
-            return None
-
-        return sum(self.pm25data) / len(self.pm25data)
+        return self.aggregator.mean()
 
 
-    def __extract_stations(self, json_data: dict) -> List[Tuple[float, float]] | None:
+    def _extract_stations(self, json_data: dict) -> List[Station] | None:
         """
-        Extract all the coordinates from Map Query's Json result.
+        Extract all the stations from Map Query's Json result.
     
         Args:
             json_data (dict): JSON data containing station information
         
         Returns:
-            List[Tuple[float, float]]: List of tuples containing lat, lon or None
+            List[Station]: List of stations with lat, lon and uid or None
         """
         if json_data is None: # In case of failed request
             return None
 
         # Check status first
         if json_data.get('status') != 'ok':
-            self.__handle_api_error(json_data)
+            self._handle_api_error(json_data)
             return None
         
-        coordinates = []
+        stations = []
         try:
             for station in json_data.get('data', []):
                 lat = station.get('lat')
@@ -120,14 +177,63 @@ class CalculateAveragePM25:
                 
                 # Only add if we have both coordinates
                 if lat is not None and lon is not None:
-                    coordinates.append((lat, lon))
-        except (TypeError, ValueError): # In case of missing keys or invalid conversion
+                    stations.append(Station(lat, lon, station.get('uid'), self.__extract_map_aqi(station)))
+        except (TypeError, ValueError, AttributeError): # In case of missing keys or invalid conversion
             return None
         
-        return coordinates
+        return stations
     
     
-    def __extract_pm25(self, json_data: dict) -> float | None:
+    def _extract_station_id(self, json_data: dict):
+        """
+        Extract the id of the station that answered from a feed JSON.
+
+        Args:
+            json_data (dict): JSON data containing station and air quality information
+
+        Returns:
+            int: Station id (idx) or None if missing
+        """
+        try:
+            return json_data.get('data', {}).get('idx')
+        except AttributeError: # In case of failed request or unexpected data
+            return None
+
+
+    def _extract_measured_at(self, json_data: dict) -> float | None:
+        """
+        Extract the measurement time from a feed JSON.
+
+        Args:
+            json_data (dict): JSON data containing station and air quality information
+
+        Returns:
+            float: Measurement time as a unix timestamp or None if missing or not parsable
+        """
+        try:
+            return datetime.fromisoformat(json_data['data']['time']['iso']).timestamp()
+        except (KeyError, TypeError, ValueError): # In case of failed request or unexpected data
+            return None
+
+
+    def __extract_map_aqi(self, station: dict) -> float | None:
+        """
+        Extract the AQI value of one station entry of Map Query's Json result.
+
+        Args:
+            station (dict): One element of the map query's data list
+
+        Returns:
+            Optional[float]: AQI value or None if missing or not a number (the API sends "-")
+        """
+        try:
+            aqi = float(station.get('aqi'))
+        except (TypeError, ValueError):
+            return None
+        return aqi if aqi == aqi else None # drop NaN
+
+
+    def _extract_pm25(self, json_data: dict) -> float | None:
         """
         Extract PM2.5 value from AQI station data JSON.
         
@@ -142,7 +248,7 @@ class CalculateAveragePM25:
         
         # Check status first
         if json_data.get('status') != 'ok':
-            self.__handle_api_error(json_data)
+            self._handle_api_error(json_data)
             return None
         
         try:
@@ -153,174 +259,861 @@ class CalculateAveragePM25:
             return None
 
 
-    def __get_map_bound(self) -> Dict | None:
+    def _bounds(self) -> Tuple[float, float, float, float]:
+        return (self.latitude_1, self.longitude_1, self.latitude_2, self.longitude_2)
+
+
+    def _cached_stations(self, refresh: bool = False, bbox: Tuple[float, float, float, float] = None) -> List[Station] | None:
         """
-        Get all the stations bounded by input lat and lon using Map Query API.
+        Get the stations of a bounding box from the station cache.
+
+        Args:
+            refresh (bool): If True, drop the cached entry and report a miss.
+            bbox (Tuple[float, float, float, float], optional): Defaults to the analyzer's box.
 
         Returns:
-            Dict: JSON data containing all stations within the bounds.
+            List[Station]: Cached stations or None if not cached
+        """
+        if self.station_cache is None:
+            return None
+
+        bbox = self._bounds() if bbox is None else bbox
+        if refresh:
+            self.station_cache.invalidate(bbox)
+            return None
+
+        return self.station_cache.get(bbox)
+
+
+    def _cache_stations(self, stations: List[Station] | None, bbox: Tuple[float, float, float, float] = None) -> None:
+        """
+        Store freshly discovered stations in the station cache, failed discoveries are not cached.
         """
-        url = MAP_API.format(lat1=self.latitude_1, lng1=self.longitude_1, 
-                             lat2=self.latitude_2, lng2=self.longitude_2,
-                             token=self.TOKEN)
+        if self.station_cache is not None and stations is not None:
+            self.station_cache.put(self._bounds() if bbox is None else bbox, stations)
 
+
+    def _load_stations(self, refresh: bool = False, bbox: Tuple[float, float, float, float] = None) -> List[Station] | None:
+        """
+        Get the stations of a bounding box from the station cache, or discover and cache them.
+
+        Args:
+            refresh (bool): If True, discover the stations even if they are cached.
+            bbox (Tuple[float, float, float, float], optional): Defaults to the analyzer's box.
+
+        Returns:
+            List[Station]: Stations within the bounds or None if the discovery failed
+        """
+        stations = self._cached_stations(refresh, bbox)
+        if stations is None:
+            stations = self.__discover_stations(bbox)
+            self._cache_stations(stations, bbox)
+        return stations
+
+
+    def __get_transport(self) -> HTTPTransport:
+        """
+        Get the HTTP transport, creating a private one sized to thread_cnt if none was given.
+
+        Returns:
+            HTTPTransport: The transport used for all API calls
+        """
+        if self.__transport is None:
+            self.__transport = HTTPTransport(pool_size=self.thread_cnt)
+        return self.__transport
+
+
+    def __retry_after(self, response) -> float | None:
+        """
+        Seconds asked for by a Retry-After header, None if missing or not in seconds.
+        """
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"{e}")
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError, AttributeError):
             return None
 
 
-    def __get_station(self, lat: float, lon: float) -> Dict | None:
+    def __send(self, url: str, endpoint: str) -> Tuple[Dict | None, bool, float | None]:
         """
-        Get data for a specific station using its lat,lon with Geolocalized API.
+        Send one GET request through the rate and concurrency limiters and decode its JSON body.
 
         Args:
-            lat (float): Latitude of the station
-            lon (float): Longitude of the station
-        
+            url (str): Full URL including the query string
+            endpoint (str): Endpoint of the url for the metrics hook
+
         Returns:
-            Dict: JSON data containing station and air quality information
+            Tuple[Dict | None, bool, float | None]: JSON data or None if the request failed, whether
+            the failure may be retried, and the wait asked for by the API if any
         """
-        url = GEO_API.format(lat=lat, lon=lon, token=self.TOKEN)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.acquire()
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.request_started(endpoint)
 
+        healthy, status = False, None
+        start = time.monotonic()
         try:
-            response = requests.get(url)
+            response = self.__get_transport().get(url)
+            status = response.status_code
+            # 429 and 5xx mean the API is overloaded, other errors are about the request
+            healthy = response.status_code != 429 and response.status_code < 500
             if response.status_code == 200:
-                return response.json()
-            else:
-                return None
-        except requests.exceptions.RequestException as e:
+                try:
+                    data = self.decoder.decode(response.content, endpoint)
+                except ValueError as e: # not JSON, e.g. an error page of a proxy
+                    self.logger.error(f"Invalid JSON response: {e}")
+                    return None, False, None
+                if self.hedge_policy is not None:
+                    self.hedge_policy.observe(time.monotonic() - start)
+                return data, False, None
+            elif response.status_code == 429:
+                self.logger.warning("Request throttled by the API (429).")
+            retryable = self.retry_policy is not None and self.retry_policy.retry_status(response.status_code)
+            return None, retryable, self.__retry_after(response)
+        except request_errors() as e:
             self.logger.error(f"{e}")
-            return None
+            return None, self.retry_policy is not None and self.retry_policy.retry_exception(e), None
+        finally:
+            latency = time.monotonic() - start
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.release(healthy, latency)
+            if metrics is not None:
+                metrics.request_finished(endpoint, status, latency)
+
+
+    def __send_hedged(self, url: str, endpoint: str) -> Tuple[Dict | None, bool, float | None]:
+        """
+        Send a request and, if it is still running after the hedge policy's latency quantile,
+        a duplicate of it. The first successful response wins, the other one is dropped.
+
+        Returns:
+            Tuple[Dict | None, bool, float | None]: Same as __send
+        """
+        delay = self.hedge_policy.hedge_delay() if self.hedge_policy is not None else None
+        if delay is None:
+            return self.__send(url, endpoint)
+
+        # the caller only waits here, requests of both the original and the hedge run on this pool
+        executor = self.__open_hedge_pool()
+        if executor is None: # a late request of a finished run
+            return self.__send(url, endpoint)
+        try:
+            primary = executor.submit(self.__send, url, endpoint)
+        except RuntimeError: # the pool was shut down, the run is over
+            return self.__send(url, endpoint)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.hedge_policy.try_hedge():
+            return primary.result()
+
+        try:
+            hedge = executor.submit(self.__send, url, endpoint)
+        except RuntimeError: # the pool was shut down, the run is over
+            return primary.result()
+        if self.metrics is not None:
+            self.metrics.request_hedged(endpoint)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        result = first.result()
+        if result[0] is None: # the first one failed, give the other one its chance
+            return (hedge if first is primary else primary).result()
+        return result
+
+
+    def __get_json(self, url: str, endpoint: str, deadline: float = None) -> Dict | None:
+        """
+        GET a url and decode its JSON body, through the response cache if one is set.
+
+        Args:
+            url (str): Full URL including the query string
+            endpoint (str): MAP_ENDPOINT, GEO_ENDPOINT or UID_ENDPOINT
+            deadline (float, optional): time.monotonic() after which no retry is started,
+                the tick's time limit. Defaults to None (no limit).
+
+        Returns:
+            Dict: JSON data or None if the request failed
+        """
+        if self.response_cache is not None:
+            return self.response_cache.fetch(url, lambda: self.__request_json(url, endpoint, deadline))
+        return self.__request_json(url, endpoint, deadline)
+
+
+    def __request_json(self, url: str, endpoint: str, deadline: float = None) -> Dict | None:
+        """
+        GET a url and decode its JSON body, retrying transient failures if a retry policy is set.
+        A retry whose backoff would end past the deadline is not made, its answer would be late.
+
+        Returns:
+            Dict: JSON data or None if the request failed
+        """
+        attempt = 1
+        while True:
+            data, retryable, retry_after = self.__send_hedged(url, endpoint)
+            if not retryable or attempt >= self.retry_policy.max_attempts:
+                return data
+
+            delay = self.retry_policy.delay(attempt, retry_after)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                self.logger.info("Not retrying the request, the tick's time limit is reached.")
+                return data
+            self.logger.info(f"Retrying request in {delay:.2f}s (attempt {attempt + 1}).")
+            if self.metrics is not None:
+                self.metrics.request_retried(endpoint)
+            time.sleep(delay)
+            attempt += 1
+
+
+    def __get_map_bound(self, bbox: Tuple[float, float, float, float]) -> Dict | None:
+        """
+        Get all the stations bounded by a box using Map Query API.
+
+        Args:
+            bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2 of the box
+
+        Returns:
+            Dict: JSON data containing all stations within the bounds.
+        """
+        return self.__get_json(self._map_url(bbox), MAP_ENDPOINT)
+
+
+    def __discover_stations(self, bbox: Tuple[float, float, float, float] = None) -> List[Station] | None:
+        """
+        Find all the stations of a bounding box, with one map query or with concurrent
+        queries over a grid of tiles if tiling is set. Tiles that look truncated are split
+        again, stations found in more than one tile are kept once.
+
+        Args:
+            bbox (Tuple[float, float, float, float], optional): Defaults to the analyzer's box.
+
+        Returns:
+            List[Station]: Stations within the bounds or None if any query failed
+        """
+        bbox = self._bounds() if bbox is None else bbox
+        if self.tiling is None:
+            return self._extract_stations(self.__get_map_bound(bbox))
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.thread_cnt) as executor:
+            pending = {executor.submit(self.__get_map_bound, tile): (tile, 0)
+                       for tile in split_bounds(bbox, self.tiling.rows, self.tiling.cols)}
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tile, depth = pending.pop(future)
+                    stations = self._extract_stations(future.result())
+
+                    if stations is None: # one missing tile would silently bias the average
+                        for other in pending:
+                            other.cancel()
+                        return None
+
+                    if is_truncated(stations, self.tiling, depth):
+                        self.logger.info(f"tile {tile} returned {len(stations)} stations, splitting it.")
+                        for sub_tile in split_bounds(tile, self.tiling.rows, self.tiling.cols):
+                            pending[executor.submit(self.__get_map_bound, sub_tile)] = (sub_tile, depth + 1)
+                    else:
+                        results.append(stations)
+
+        return merge_stations(results)
+
+
+    def _map_url(self, bbox: Tuple[float, float, float, float]) -> str:
+        """
+        Map Query URL of a bounding box given as lat1, lng1, lat2, lng2.
+        """
+        return self._api_url(MAP_API.format(lat1=bbox[0], lng1=bbox[1], 
+                                            lat2=bbox[2], lng2=bbox[3],
+                                            token=self.TOKEN))
+
+
+    def _station_url(self, station: Station) -> str:
+        """
+        Feed URL of a station: by uid if known, otherwise the Geolocalized API which returns
+        the station nearest to the coordinates.
+        """
+        if station.uid is not None:
+            return self._api_url(UID_API.format(uid=station.uid, token=self.TOKEN))
+        return self._api_url(GEO_API.format(lat=station.lat, lon=station.lon, token=self.TOKEN))
+
+
+    def _api_url(self, url: str) -> str:
+        """
+        Send an API URL to api_base instead of API_BASE if one is set.
+        """
+        if self.api_base is not None and url.startswith(API_BASE):
+            return self.api_base + url[len(API_BASE):]
+        return url
+
+
+    def __get_station(self, station: Station, deadline: float = None) -> Dict | None:
+        """
+        Get data for a specific station by its uid, or its lat,lon if it has none.
+
+        Args:
+            station (Station): The station to query
+            deadline (float, optional): time.monotonic() after which no retry is started. Defaults to None.
+        
+        Returns:
+            Dict: JSON data containing station and air quality information
+        """
+        return self.__get_json(self._station_url(station), UID_ENDPOINT if station.uid is not None else GEO_ENDPOINT,
+                               deadline)
     
     
-    def __get_pm25(self, station: Tuple[float, float]) -> Optional[float]:
+    def __get_pm25(self, station: Station, deadline: float = None) -> Tuple[object, Optional[float], Optional[float]]:
         """
         Get PM2.5 value for a specific station.
 
         Args:
-            station (Tuple[float, float]): Tuple containing lat, lon of the station
+            station (Station): The station to query
+            deadline (float, optional): time.monotonic() after which no retry is started. Defaults to None.
 
         Returns:
-            Optional[float]: PM2.5 value if found, None otherwise
+            Tuple[object, Optional[float], Optional[float]]: Id of the station that answered, its PM2.5
+            value if found and the measurement time of the value if known, None otherwise
         """
-        station_data = self.__get_station(*station)
-        pm25_val = self.__extract_pm25(station_data)
-        return pm25_val
+        station_data = self.__get_station(station, deadline)
+        pm25_val = self._extract_pm25(station_data)
+        return (self._extract_station_id(station_data) or station_key(station), pm25_val,
+                self._extract_measured_at(station_data))
 
 
-    def __set_state(self, thread_state: str, thread_obj: Thread):
+    def _set_state(self, tick_state: str, tick: Tick):
         '''
-        Set the state of each thread and update the object state with thread safety.
+        Set the state of a tick and update the object state with thread safety.
+        Ticks that have not fired yet count as IDLE.
         '''
-        with self.__lock:
-            self.__timer_threads[thread_obj] = thread_state
+        with self._lock:
+            if tick.state != self.IDLE:
+                self._tick_states[tick.state] -= 1
+            tick.state = tick_state
+            self._tick_states[tick_state] += 1
 
-            self.logger.info(f"{thread_obj.name} state: {self.__timer_threads[thread_obj]}")
+            self.logger.info(f"{tick.name} state: {tick_state}")
 
-            if any([state == self.RUNNING for state in self.__timer_threads.values()]):
+            if self._tick_states[self.RUNNING]:
                 self.state = self.RUNNING
 
-            elif all([state == self.DONE for state in self.__timer_threads.values()]):
+            elif self._tick_total is not None and self._tick_states[self.DONE] == self._tick_total:
                 self.state = self.DONE
 
-            elif all([state == self.FAILED for state in self.__timer_threads.values()]):
+            elif self._tick_total is not None and self._tick_states[self.FAILED] == self._tick_total:
                 self.state = self.FAILED
 
             else:
                 self.state = self.IDLE
                
 
-    def __smapler(self):
+    def _fetch_values(self, stations: List[Station], tick: Tick = None) -> Tuple[Dict[object, Tuple[object, float]], Set[object]]:
         '''
-        Run multiple threads to get PM2.5 values for all stations.
+        Run multiple threads to get PM2.5 values for the given stations. With a freshness
+        tracker, stations that can not have published a new measurement yet are not requested
+        and their last value is used again. With a tick timeout, stations that did not answer
+        by the tick's time limit are dropped and counted in tick.late.
+
+        Returns:
+            Tuple[Dict[object, Tuple[object, float]], Set[object]]: (id of the station that
+            answered, value) of the stations that answered by station key, and the keys whose
+            value was reused
         '''
-        results = []
-        self.__set_state(self.RUNNING , current_thread())
+        fetched, reused = {}, set()
+        if not stations:
+            return fetched, reused
+
+        freshness = self.freshness
+        pending = []
+        for st in merge_stations([stations]):
+            last = freshness.last(station_key(st)) if freshness is not None else None
+            if last is not None and not freshness.due(station_key(st)):
+                fetched[station_key(st)] = last
+                reused.add(station_key(st))
+            else:
+                pending.append(st)
 
-        with ThreadPoolExecutor(max_workers=self.thread_cnt) as executor:
-            thread_dict = {executor.submit(self.__get_pm25, st): st for st in self.__stations}
+        if not pending:
+            return fetched, reused
 
-            for thread in as_completed(thread_dict):
+        cutoff = None
+        if tick is not None and self.tick_timeout is not None:
+            cutoff = tick.deadline + self.tick_timeout
 
-                station = thread_dict[thread]
-                try:
-                    pm25_val = thread.result()
-                    if pm25_val is not None: # ignore failed requests
-                        results.append(pm25_val)
+        # a station whose request of an earlier tick is still running is not requested again
+        idle, busy = [], 0
+        for st in pending:
+            thread = self.__fetching.get(station_key(st))
+            if thread is not None and not thread.done():
+                busy += 1
+            else:
+                idle.append(st)
+        if busy:
+            if tick is not None:
+                tick.late += busy
+            self.logger.warning(f"{busy} station(s) still answering an earlier request, skipped.")
+            if self.metrics is not None:
+                self.metrics.stations_late(busy)
+
+        executor = self.__open_fetch_pool()
+        if executor is None: # the run is over
+            return fetched, reused
+
+        thread_dict = {}
+        try:
+            for st in idle:
+                thread = executor.submit(self.__get_pm25, st, cutoff)
+                thread_dict[thread] = st
+                self.__fetching[station_key(st)] = thread
+        except RuntimeError: # the pool was shut down, the run is over
+            pass
+
+        done, late = set(), 0
+        try:
+            for thread in as_completed(thread_dict, None if cutoff is None else max(0.0, cutoff - time.monotonic())):
+                done.add(thread)
+                self.__record_pm25(thread, thread_dict[thread], fetched)
 
-                except Exception as exc:
-                    self.logger.error(f"station at lat,lng {station} generated Error: {exc}")
-        
-        if results:
-            with self.__lock:
-                self.pm25data.extend(results)
-            self.__set_state(self.DONE, current_thread())
-        else:
-            self.__set_state(self.FAILED, current_thread())
+        except FuturesTimeoutError:
+            for thread, station in thread_dict.items():
+                if thread not in done and thread.done(): # finished while the wait timed out
+                    done.add(thread)
+                    self.__record_pm25(thread, station, fetched)
+
+            late = len(thread_dict) - len(done)
+            tick.late += late
+            self.logger.warning(f"{tick.name} timed out, {late} station(s) late.")
+            if self.metrics is not None:
+                self.metrics.stations_late(late)
+
+        finally:
+            # queued stations are dropped, running requests finish in the background on the
+            # run's bounded pool
+            for thread in thread_dict:
+                if thread not in done:
+                    thread.cancel()
+
+        return fetched, reused
+
+
+    def __open_fetch_pool(self) -> ThreadPoolExecutor | None:
+        '''
+        The pool of thread_cnt threads sending the station requests of the run, created by
+        start_sampling or on first use outside of a run (e.g. by a ShardedAnalyzer worker).
+        None once the run is over.
+        '''
+        with self._lock:
+            if self.__fetch_pool is None:
+                if self._future is not None and self._future.done():
+                    return None
+                self.__fetch_pool = ThreadPoolExecutor(max_workers=self.thread_cnt,
+                                                       thread_name_prefix=f"{self.__class__.__name__}-fetch")
+                self.__fetching   = {}
+            return self.__fetch_pool
+
+
+    def __open_hedge_pool(self) -> ThreadPoolExecutor | None:
+        '''
+        The pool of 2 * thread_cnt threads sending hedged requests and their hedges, created
+        by start_sampling or on first use outside of a run. None once the run is over, the
+        requests still finishing are not hedged.
+        '''
+        with self._lock:
+            if self.__hedge_executor is None:
+                if self._future is not None and self._future.done():
+                    return None
+                self.__hedge_executor = ThreadPoolExecutor(max_workers=2 * self.thread_cnt,
+                                                           thread_name_prefix=f"{self.__class__.__name__}-hedge")
+            return self.__hedge_executor
+
+
+    def __close_pools(self) -> None:
+        with self._lock:
+            pool, self.__fetch_pool = self.__fetch_pool, None
+            fetching, self.__fetching = self.__fetching, {}
+            hedge_pool, self.__hedge_executor = self.__hedge_executor, None
+        if pool is not None:
+            # queued requests are cancelled here rather than by shutdown(cancel_futures=True), which
+            # drops them without waking a tick waiting on them; running ones finish in the background
+            for thread in fetching.values():
+                thread.cancel()
+            pool.shutdown(wait=False)
+        if hedge_pool is not None:
+            hedge_pool.shutdown(wait=False) # dropped hedges finish in the background
+
+
+    def __record_pm25(self, thread: Future, station: Station, fetched: Dict[object, Tuple[object, float]]) -> None:
+        '''
+        Add the outcome of a station request to fetched, the freshness tracker and the metrics.
+        '''
+        try:
+            station_id, pm25_val, measured_at = thread.result()
+            if pm25_val is not None: # ignore failed requests
+                fetched[station_key(station)] = (station_id, pm25_val)
+                self._coords[station_id] = (station.lat, station.lon)
+            if self.freshness is not None:
+                self.freshness.record(station_key(station), station_id, pm25_val, measured_at)
+            if self.metrics is not None:
+                self.metrics.station_fetched(pm25_val is not None)
+
+        except Exception as exc:
+            self.logger.error(f"station at lat,lng {station} generated Error: {exc}")
+            if self.metrics is not None:
+                self.metrics.station_fetched(False)
+
+
+    def _station_values(self, fetched: Dict[object, Tuple[object, float]], reused: Set[object],
+                        keys=None) -> Tuple[Dict[object, float], Set[object]]:
+        '''
+        Turn the output of _fetch_values into values by station id, optionally restricted to
+        some station keys. Every physical station is counted once, even if several
+        coordinates resolved to it.
+
+        Returns:
+            Tuple[Dict[object, float], Set[object]]: Values by station id and the reused ids
+        '''
+        keys = fetched.keys() if keys is None else keys
+        results, reused_ids = {}, set()
+        for key in keys:
+            entry = fetched.get(key)
+            if entry is None:
+                continue
+            results[entry[0]] = entry[1]
+            if key in reused:
+                reused_ids.add(entry[0])
+        return results, reused_ids
+
+
+    def __fetch_stations(self, stations: List[Station], tick: Tick = None) -> Tuple[Dict[object, float], Set[object]]:
+        '''
+        Get PM2.5 values for the given stations, see _fetch_values.
+
+        Returns:
+            Tuple[Dict[object, float], Set[object]]: Values of the stations that answered by
+            station id, and the ids whose value was reused
+        '''
+        return self._station_values(*self._fetch_values(stations, tick))
+
+
+    def _plan_tick(self, snapshot: List[Station] | None) -> Tuple[Dict[object, float], List[Station]]:
+        '''
+        Decide what a tick samples in the current sampling mode: the values taken from the
+        map query and the stations to request one by one. Shared by the threaded and the
+        asyncio analyzers, which only differ in how they send the requests.
+
+        Args:
+            snapshot (List[Station] | None): Stations of this tick's map query, None if it
+                failed or was not made (station mode)
+
+        Returns:
+            Tuple[Dict[object, float], List[Station]]: Values by station id and the stations to fetch
+        '''
+        if self.sampling_mode == STATION_MODE:
+            return {}, self._stations
+
+        if snapshot is None and self.sampling_mode == HYBRID_MODE:
+            self.logger.error("Map query failed, falling back to station requests.")
+            return {}, self._stations
+        elif snapshot is None:
+            self.logger.error("Map query failed.")
+            return {}, []
+
+        results = {station_key(st): st.aqi for st in snapshot if st.aqi is not None}
+        self._coords.update((station_key(st), (st.lat, st.lon)) for st in snapshot)
+        if self.sampling_mode == HYBRID_MODE:
+            return results, [st for st in snapshot if st.aqi is None]
+        return results, []
+
+
+    def _collect_tick(self, tick: Tick) -> Tuple[Dict[object, float], Set[object]]:
+        '''
+        Get PM2.5 values for all stations, per station or from the map query depending on
+        the sampling mode, see _plan_tick.
+
+        Returns:
+            Tuple[Dict[object, float], Set[object]]: Values by station id and the reused ids
+        '''
+        snapshot = self.__discover_stations() if self.sampling_mode != STATION_MODE else None
+        results, stations = self._plan_tick(snapshot)
+        if not stations:
+            return results, set()
+
+        fetched, reused = self.__fetch_stations(stations, tick)
+        results.update(fetched)
+        return results, reused
+
+
+    def __smapler(self, tick: Tick):
+        '''
+        Run one tick: collect the values, add them to the aggregator and publish the tick.
+        The values of a tick that outlives its run (see stop_sampling) are dropped.
+        '''
+        future = self._future
+        self._set_state(self.RUNNING , tick)
+        started, sampled_at = time.monotonic(), time.time()
+
+        results, reused = self._collect_tick(tick)
+
+        if future is not self._future or future.done():
+            self.logger.warning(f"{tick.name} finished after its run was stopped, dropping its values.")
+            return
+
+        added = self._record_tick(tick, sampled_at, results, reused)
+        self._set_state(self.DONE if added else self.FAILED, tick)
+
+        if self.metrics is not None:
+            self.metrics.tick_finished(tick.state, time.monotonic() - started, started - tick.deadline, added)
+        self._notify_tick(tick, results)
 
 
-    def start_sampling(self, blocking=False) -> None:
+    def _prepare_run(self) -> bool:
+        '''
+        Called once the stations are known, before the first tick of a run.
+
+        Returns:
+            bool: False to fail the run
+        '''
+        return True
+
+
+    def _record_tick(self, tick: Tick, sampled_at: float, results: Dict[object, float], reused: Set[object]) -> int:
+        '''
+        Add the values of a tick to the aggregator and the sample store.
+
+        Returns:
+            int: Number of values added, 0 makes the tick FAILED
+        '''
+        if not results:
+            return 0
+        with self._lock:
+            self.aggregator.add_tick(tick.name, results, reused)
+        self._store_samples(sampled_at, results)
+        return len(results)
+
+
+    def _store_samples(self, sampled_at: float, results: Dict[object, float]) -> None:
+        '''
+        Append the values of a tick to the sample store, if any. A failing store is logged
+        and does not stop the run.
+        '''
+        if self.sample_store is None:
+            return
+        try:
+            self.sample_store.append(sampled_at, results, self._coords)
+        except OSError as exc:
+            self.logger.error(f"Storing the samples failed: {exc}")
+
+
+    def _new_run(self) -> Future:
+        '''
+        Create the Future of a run, with the registered done callbacks attached.
+        '''
+        future = Future()
+        for callback in self._done_callbacks:
+            future.add_done_callback(callback)
+        with self._lock:
+            self._future      = future
+            self._subscribers = []
+        return future
+
+
+    def _finish_run(self, future: Future, cancelled: bool = False) -> None:
+        '''
+        Resolve the Future of a run with its average PM2.5, or cancel it if the run was stopped.
+        '''
+        if not future.done():
+            if cancelled:
+                future.cancel()
+                future.set_running_or_notify_cancel() # wakes up wait()
+            else:
+                self.__settle_state()
+                future.set_result(self.aggregator.mean())
+        if future is self._future: # after resolving it, late requests see the run is over
+            self.__close_pools()
+
+
+    def __settle_state(self) -> None:
+        '''
+        Set the final state of a run from the ticks that fired, ticks dropped by the overrun
+        policy do not count.
+        '''
+        with self._lock:
+            fired = self._tick_states[self.DONE] + self._tick_states[self.FAILED]
+            if not fired or self._tick_states[self.RUNNING]:
+                return
+            if self._tick_states[self.DONE] == fired:
+                self.state = self.DONE
+            elif self._tick_states[self.FAILED] == fired:
+                self.state = self.FAILED
+
+
+    def _notify_tick(self, tick: Tick, results: Dict[object, float]) -> None:
+        '''
+        Publish a tick to the ticks() iterators and call the tick callbacks. A failing
+        callback is logged and does not stop the run.
+        '''
+        if self._subscribers:
+            result = self._tick_result(tick, results)
+            with self._lock:
+                for subscriber in self._subscribers:
+                    subscriber.put_nowait(result)
+
+        for callback in self._tick_callbacks:
+            try:
+                callback(tick, results)
+            except Exception:
+                self.logger.exception(f"tick callback {callback!r} failed.")
+
+
+    def _tick_result(self, tick: Tick, results: Dict[object, float]) -> TickResult:
+        stats = RunningStats()
+        for value in results.values():
+            stats.add(value)
+        with self._lock:
+            windows = {seconds: self.aggregator.window_stats(seconds)
+                       for seconds in getattr(self.aggregator, 'windows', ())}
+        return TickResult(tick.name, tick.index, tick.state, results, stats.as_dict(), windows, tick.late)
+
+
+    def _subscribe(self, subscriber) -> Future | None:
+        '''
+        Register a queue for the tick results of the current run, the run's end puts None in it.
+        Returns the run's Future, None if no run is going.
+        '''
+        with self._lock:
+            future = self._future
+            if future is None or future.done():
+                return None
+            self._subscribers.append(subscriber)
+        future.add_done_callback(lambda _: subscriber.put_nowait(None))
+        return future
+
+
+    def _unsubscribe(self, subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+
+    def ticks(self, timeout: float = None) -> Iterator[TickResult]:
+        '''
+        Iterate over the ticks of the current run as they complete, until the run is over.
+        Ticks that completed before the call are not included.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for a tick. Defaults to None (no limit).
+
+        Returns:
+            Iterator[TickResult]: Aggregate of every completed tick, in completion order
+
+        Raises:
+            TimeoutError: if no tick completed within timeout
+        '''
+        subscriber = queue.Queue()
+        future = self._subscribe(subscriber)
+        return self.__drain(subscriber, future, timeout)
+
+
+    def __drain(self, subscriber: queue.Queue, future: Future | None, timeout: float | None) -> Iterator[TickResult]:
+        if future is None:
+            return
+        try:
+            while True:
+                try:
+                    result = subscriber.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"no tick completed within {timeout}s") from None
+                if result is None:
+                    return
+                yield result
+        finally:
+            self._unsubscribe(subscriber)
+
+
+    def start_sampling(self, blocking=False, refresh_stations=False) -> None:
         '''
         Start sampling PM2.5 values with multiple threads.
 
         Args:
             blocking (bool): If True, the function will block until all threads are finished.
+            refresh_stations (bool): If True, discover stations again instead of using the
+                ones from the previous run or the station cache.
         '''
 
         # clear previous run data
         self.clean_up()
+        future = self._new_run()
 
         if not self.TOKEN: # if token is not set
             self.logger.error("Error: Token is not set.")
             self.state = self.FAILED
+            self._finish_run(future)
             return
 
-        if not self.__stations: # if stations are not already extracted
-            self.__stations = self.__extract_stations(self.__get_map_bound())
+        if self.__owns_transport and self.__transport is not None:
+            self.__transport.resize(self.thread_cnt) # thread_cnt may have been changed since last run
+
+        if refresh_stations:
+            self._stations = []
+
+        if not self._stations: # if stations are not already extracted
+            self._stations = self._load_stations(refresh_stations)
 
-            if self.__stations is None:
+            if self._stations is None:
                 self.logger.error("Request to get stations failed.")
                 self.state = self.FAILED
+                self._finish_run(future)
                 return
 
-            elif self.__stations == []:
+            elif self._stations == []:
                 self.logger.error("No stations found in the given bounds.")
                 self.state = self.DONE
+                self._finish_run(future)
                 return
 
-        for delay in range(0, self.__sampling_period * 60, 60 // self.__sampling_rate):
-            # Non-blocking timers threads to run worker threads on sampling intervals
-            timer_thread = Timer(delay, self.__smapler)
-            timer_thread.setName(f"Timer-{delay}s")
-            self.__timer_threads[timer_thread] = self.IDLE
-            
-        for thread in self.__timer_threads.keys():
-            thread.start()
+        if not self._prepare_run():
+            self.state = self.FAILED
+            self._finish_run(future)
+            return
+
+        self.__open_fetch_pool()
+        if self.hedge_policy is not None:
+            self.__open_hedge_pool()
+
+        # one non-blocking scheduler thread runs the ticks on sampling intervals
+        self._tick_total = tick_count(self._sampling_period, self._sampling_rate)
+        self._scheduler  = TickScheduler(sampling_interval(self._sampling_rate), self.__smapler,
+                                         self._tick_total, name=f"{self.__class__.__name__}-scheduler",
+                                         on_finish=lambda scheduler: self._finish_run(future, scheduler.cancelled),
+                                         overrun=self.overrun_policy, max_backlog=self.max_backlog,
+                                         logger=self.logger.getChild('scheduler'))
+        self._scheduler.start()
 
         if blocking:
-            for thread in self.__timer_threads.keys():
-                thread.join(self._thread_timeout)                
+            self._scheduler.join(self._thread_timeout)
 
     
-    def stop_sampling(self) -> None:
+    def stop_sampling(self, timeout: float = None) -> None:
         '''
         Stop the sampling process. Clean up data.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the running tick. A tick still
+                running after that is abandoned: the run's Future is cancelled and the tick's values
+                are dropped when its requests come back. Defaults to None (wait for the tick).
         '''
 
-        # wait for Running Timer threads to finish and cancel the rest
-        for thread,state in self.__timer_threads.items():
-            if state == self.RUNNING:
-                self.logger.info(f"Waiting for {thread.name} to finish.")
-                thread.join()
-            elif state == self.IDLE or thread.is_alive():
-                self.__timer_threads[thread] = self.STOPPED
-                thread.cancel()
+        # cancel the coming ticks and wait for the running one to finish
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            if self._tick_states[self.RUNNING]:
+                self.logger.info("Waiting for the running tick to finish.")
+            self._scheduler.join(timeout)
+
+            if self._scheduler.is_alive():
+                self.logger.warning(f"Running tick did not finish within {timeout}s, abandoning it.")
+                self._finish_run(self._future, cancelled=True)
 
         self.state = self.STOPPED
 
@@ -330,6 +1123,61 @@ class CalculateAveragePM25:
         self.clean_up()
         
 
+    def wait(self, timeout: float = None) -> bool:
+        '''
+        Block until the current run is finished or stopped.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Defaults to None (no limit).
+
+        Returns:
+            bool: True if the run is over (or none was started), False on timeout
+        '''
+        future = self._future
+        if future is None:
+            return True
+        done, _ = wait([future], timeout=timeout)
+        return bool(done)
+
+
+    @property
+    def future(self) -> Future | None:
+        '''
+        concurrent.futures.Future of the current run, None before the first start_sampling.
+        Its result is the average PM2.5 of the run (None without samples), it is cancelled if
+        the run is stopped. The analyzer itself can be awaited for the same result.
+        '''
+        return self._future
+
+
+    def __await__(self):
+        if self._future is None:
+            raise RuntimeError("sampling was not started")
+        import asyncio # only needed to await the analyzer
+        return asyncio.wrap_future(self._future).__await__()
+
+
+    def add_tick_callback(self, callback: Callable[[Tick, Dict[object, float]], None]) -> None:
+        '''
+        Call a function after every tick of every run, on the thread that ran the tick.
+
+        Args:
+            callback (Callable[[Tick, Dict[object, float]], None]): Gets the tick (name, index
+                and final state) and the values it added by station id
+        '''
+        self._tick_callbacks.append(callback)
+
+
+    def add_done_callback(self, callback: Callable[[Future], None]) -> None:
+        '''
+        Call a function when each following run is over, with the run's Future.
+
+        Args:
+            callback (Callable[[Future], None]): Gets the Future, see the future property
+        '''
+        self._done_callbacks.append(callback)
+
+
     def sampling_status(self) -> str:
         '''
         Get the status of the sampling process.
@@ -340,15 +1188,26 @@ class CalculateAveragePM25:
         return self.state
 
 
-    def avg_pm25_all_sites(self) -> float | None:
+    def _sampling_alive(self) -> bool:
+        '''
+        Check if ticks are still being fired.
+        '''
+        return self._scheduler is not None and self._scheduler.is_alive()
+
+
+    def avg_pm25_all_sites(self, partial: bool = False) -> float | None:
         '''
         Get the average PM2.5 value from all the sites if the sampling is done.
 
+        Args:
+            partial (bool, optional): If True, return the average of the ticks done so far
+                while the run is still going. Defaults to False.
+
         Returns:
             float: Average PM2.5 value
         '''
 
-        if self.state == self.DONE or not any(thread.is_alive() for thread in self.__timer_threads):
+        if partial or self.state == self.DONE or not self._sampling_alive():
                 return self.__calculate_avg_pm25()
         else:
             return None
@@ -369,12 +1228,238 @@ class CalculateAveragePM25:
             return
 
 
+    def set_transport(self, transport: HTTPTransport) -> None:
+        '''
+        Set the HTTP transport used for API calls, e.g. to share one connection pool
+        between several analyzers or to change timeouts.
+
+        Args:
+            transport (HTTPTransport): The transport to use
+        '''
+        if self.__transport is not None and self.__owns_transport:
+            self.__transport.close()
+
+        self.__transport = transport
+        self.__owns_transport = False
+
+
+    def set_api_base(self, api_base: str) -> None:
+        '''
+        Send API requests to another server with the same paths, e.g. a mirror or the local
+        stand-in of air_quality_analyzer.stub_server.
+
+        Args:
+            api_base (str): Scheme and host such as "http://127.0.0.1:8000", or None for api.waqi.info
+        '''
+        self.api_base = api_base.rstrip('/') if api_base is not None else None
+
+
+    def set_rate_limiter(self, rate_limiter: TokenBucket) -> None:
+        '''
+        Limit the rate of API requests. Pass the same TokenBucket to several analyzers to
+        keep all of them within one token's quota.
+
+        Args:
+            rate_limiter (TokenBucket): The limiter to use, or None for no limit
+        '''
+        self.rate_limiter = rate_limiter
+
+
+    def set_concurrency_limiter(self, concurrency_limiter: AdaptiveConcurrency) -> None:
+        '''
+        Adapt the number of concurrent requests to the health of the API instead of always
+        running thread_cnt of them. thread_cnt is raised to the limiter's maximum, the limiter
+        decides how many of those threads send requests at a time.
+
+        Args:
+            concurrency_limiter (AdaptiveConcurrency): The limiter to use, or None for a fixed thread_cnt
+        '''
+        self.concurrency_limiter = concurrency_limiter
+        if concurrency_limiter is not None:
+            self.thread_cnt = concurrency_limiter.maximum
+
+
+    def set_retry_policy(self, retry_policy: RetryPolicy) -> None:
+        '''
+        Retry requests that failed with a transient error (connection error, timeout,
+        429 or 5xx) with an exponential, jittered backoff.
+
+        Args:
+            retry_policy (RetryPolicy): The policy to use, or None to not retry
+        '''
+        self.retry_policy = retry_policy
+
+
+    def set_hedge_policy(self, hedge_policy: HedgePolicy) -> None:
+        '''
+        Send a duplicate of requests slower than the recent latency quantile (p95 by default)
+        and keep the first response, so one slow upstream response does not hold up a tick.
+
+        Args:
+            hedge_policy (HedgePolicy): The policy to use, or None to not hedge
+        '''
+        self.hedge_policy = hedge_policy
+
+
+    def set_freshness_tracker(self, freshness: FreshnessTracker) -> None:
+        '''
+        Only request stations that may have published a new measurement since their last
+        fetch, the others keep their last value (counted as reused by the aggregator).
+        Applies to station requests; None requests every station every tick.
+
+        Args:
+            freshness (FreshnessTracker): The tracker, can be shared between runs
+        '''
+        self.freshness = freshness
+
+
+    def set_metrics(self, metrics: MetricsHook) -> None:
+        '''
+        Report requests, retries, station results and ticks to a hook, e.g. a MetricsRegistry
+        that can be exported to Prometheus. Without a hook the sampler does not measure anything.
+
+        Args:
+            metrics (MetricsHook): The hook to call, or None
+        '''
+        self.metrics = metrics
+
+
+    def set_response_cache(self, response_cache: ResponseCache) -> None:
+        '''
+        Coalesce identical concurrent requests into one and reuse responses for a short time.
+        Applies to map queries and station feeds. Pass the same ResponseCache to several
+        analyzers to share requests between them.
+
+        Args:
+            response_cache (ResponseCache): The cache to use, or None to send every request
+        '''
+        self.response_cache = response_cache
+
+
+    def set_decoder(self, decoder: ResponseDecoder) -> None:
+        '''
+        Set how response bodies are decoded. The default FeedDecoder only decodes the
+        fields of station feeds the analyzer reads, ResponseDecoder decodes whole bodies.
+        Both use orjson when it is installed.
+
+        Args:
+            decoder (ResponseDecoder): The decoder to use
+        '''
+        self.decoder = decoder
+
+
+    def set_sample_store(self, sample_store: SampleStore) -> None:
+        '''
+        Append the raw samples of every tick (time, station id, lat, lon and PM2.5) to an
+        on-disk store. Unlike the aggregator, the store is not cleared between runs.
+
+        Args:
+            sample_store (SampleStore): The store to append to, or None to keep nothing
+        '''
+        self.sample_store = sample_store
+
+
+    def set_overrun_policy(self, policy: str, max_backlog: int = 1) -> None:
+        '''
+        Set what happens to the ticks that become due while a tick is still running. Ticks
+        never overlap, whatever the policy. Applies from the next start_sampling.
+
+        Args:
+            policy (str): 'skip' (default) drops them and waits for the next deadline, 'coalesce'
+                fires one tick right away for all of them, 'queue' fires them back to back.
+            max_backlog (int, optional): Most overdue ticks the 'queue' policy keeps, the oldest
+                are dropped. Defaults to 1.
+        '''
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"policy must be one of {OVERRUN_POLICIES}")
+        if max_backlog < 1:
+            raise ValueError("max_backlog can not be less than one")
+
+        self.overrun_policy = policy
+        self.max_backlog    = max_backlog
+
+
+    def set_tick_timeout(self, timeout: float) -> None:
+        '''
+        Limit how long a tick waits for station requests. Stations that did not answer
+        timeout seconds after the tick's deadline are left out of the tick and counted as
+        late; requests not sent yet are cancelled. Requests already sent are not interrupted,
+        they end in the background within the transport timeouts.
+
+        Args:
+            timeout (float): Seconds after the tick's deadline, e.g. the sampling interval,
+                or None to wait for every station
+        '''
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout can not be zero or negative")
+
+        self.tick_timeout = timeout
+
+
+    def set_sampling_mode(self, mode: str) -> None:
+        '''
+        Set how values are collected on every sampling tick.
+
+        Args:
+            mode (str): 'station' (default) requests every station's feed, 'map' uses the AQI
+                values of one map query (or one per tile), 'hybrid' uses the map values and
+                requests the feed only of stations without a usable map value.
+        '''
+        if mode not in (STATION_MODE, MAP_MODE, HYBRID_MODE):
+            raise ValueError(f"mode must be one of '{STATION_MODE}', '{MAP_MODE}', '{HYBRID_MODE}'")
+
+        self.sampling_mode = mode
+
+
+    def set_tiling(self, rows: int = 2, cols: int = 2, max_depth: int = 2, station_limit: int = 1000) -> None:
+        '''
+        Discover stations with concurrent map queries over a grid of tiles instead of one
+        query for the whole box. Useful for province or country sized boxes where a single
+        response is slow and gets truncated by the API.
+
+        Args:
+            rows (int): Number of tiles along the latitude
+            cols (int): Number of tiles along the longitude
+            max_depth (int): How many times a truncated tile may be split again
+            station_limit (int): Station count at which a tile is considered truncated
+        '''
+        if rows <= 0 or cols <= 0 or station_limit <= 0 or max_depth < 0:
+            raise ValueError("rows, cols and station_limit must be positive, max_depth not negative")
+
+        self.tiling = Tiling(rows, cols, max_depth, station_limit)
+
+
+    def set_aggregator(self, aggregator: StreamingAggregator) -> None:
+        '''
+        Set the aggregator receiving the values of every tick, e.g. a StreamingAggregator
+        tracking quantiles. Any object with add_tick(tick, values, reused), reset(), mean() and count works.
+
+        Args:
+            aggregator (StreamingAggregator): The aggregator to use
+        '''
+        self.aggregator = aggregator
+
+
+    def set_station_cache(self, station_cache: StationCache) -> None:
+        '''
+        Set the cache used to skip station discovery, e.g. a cache shared by many workers.
+
+        Args:
+            station_cache (StationCache): The cache to use, or None to disable caching
+        '''
+        self.station_cache = station_cache
+
+
     def clean_up(self):
         '''
         Clean up the object.
         '''
-        self.pm25data.clear()
-        self.__timer_threads.clear()
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            self._scheduler = None
+        self.__close_pools()
+        self.aggregator.reset()
+        self._tick_states.clear()
         self.state = self.STOPPED
 
 
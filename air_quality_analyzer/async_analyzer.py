@@ -0,0 +1,476 @@
+import asyncio
+import time
+import aiohttp
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .aggregator import TickResult
+from .analyzer import CalculateAveragePM25, STATION_MODE
+from .metrics import MAP_ENDPOINT, GEO_ENDPOINT, UID_ENDPOINT
+from .scheduler import Tick, sampling_interval, tick_count, after_tick
+from .stations import Station, split_bounds, is_truncated, merge_stations, station_key
+from .transport import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+
+
+class AsyncCalculateAveragePM25(CalculateAveragePM25):
+    """
+    Asyncio version of CalculateAveragePM25.
+
+    Station fetches run as coroutines on a single event loop instead of blocking threads,
+    the number of in-flight requests is only bounded by the concurrency semaphore. Sampling
+    ticks are fired by a single scheduler task at monotonic deadlines and go through the same
+    states as the threaded analyzer (IDLE/RUNNING/DONE/FAILED/STOPPED).
+
+    The rate limiter is applied; adaptive concurrency, retries, hedged requests, the
+    freshness tracker and the response cache are not supported and their setters raise
+    ValueError.
+
+    Requires aiohttp (pip install 'air_quality_analyzer[async]').
+
+    Args:
+        latitude_1 (float): First latitude coordinate of the bounding box
+        longitude_1 (float): First longitude coordinate of the bounding box
+        latitude_2 (float): Second latitude coordinate of the bounding box
+        longitude_2 (float): Second longitude coordinate of the bounding box
+        sampling_period (int, optional): Total duration of sampling in minutes. Defaults to 5.
+        sampling_rate (int, optional): Number of samples to collect per minute. Defaults to 1.
+        concurrency (int, optional): Maximum number of in-flight station requests. Defaults to 100.
+        session (aiohttp.ClientSession, optional): Session to use for API calls, can be shared
+            between analyzers. Defaults to a private session created on start_sampling.
+        station_cache (StationCache, optional): Cache of discovered stations. Defaults to None.
+        aggregator (StreamingAggregator, optional): Receives the values of every tick.
+    """
+
+    def __init__(self, latitude_1, longitude_1, latitude_2, longitude_2, sampling_period=5, sampling_rate=1,
+                 concurrency=100, session=None, station_cache=None, aggregator=None):
+
+        super().__init__(latitude_1, longitude_1, latitude_2, longitude_2, sampling_period, sampling_rate,
+                         station_cache=station_cache, aggregator=aggregator)
+
+        if concurrency <= 0:
+            raise ValueError("concurrency can not be zero or negative")
+
+        self.concurrency = concurrency
+        self.timeout     = aiohttp.ClientTimeout(sock_connect=DEFAULT_CONNECT_TIMEOUT, sock_read=DEFAULT_READ_TIMEOUT)
+
+        self.__session      = session
+        self.__owns_session = session is None
+        self.__semaphore    = None
+        self.__runner       = None
+        self.__stopped      = None
+
+
+    async def __get_json(self, url: str, endpoint: str) -> Dict | None:
+        """
+        GET a url and decode its JSON body, limited by the rate limiter if set and the
+        concurrency semaphore.
+
+        Args:
+            url (str): Full URL including the query string
+            endpoint (str): MAP_ENDPOINT, GEO_ENDPOINT or UID_ENDPOINT
+
+        Returns:
+            Dict: JSON data or None if the request failed
+        """
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+        async with self.__semaphore:
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.request_started(endpoint)
+
+            status = None
+            start = time.monotonic()
+            try:
+                async with self.__session.get(url) as response:
+                    status = response.status
+                    if response.status == 200:
+                        return self.decoder.decode(await response.read(), endpoint)
+                    elif response.status == 429:
+                        self.logger.warning("Request throttled by the API (429).")
+                    return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(f"{e!r}")
+                return None
+            except ValueError as e: # not JSON, e.g. an error page of a proxy
+                self.logger.error(f"Invalid JSON response: {e}")
+                return None
+            finally:
+                if metrics is not None:
+                    metrics.request_finished(endpoint, status, time.monotonic() - start)
+
+
+    async def __get_map_bound(self, bbox: Tuple[float, float, float, float]) -> Dict | None:
+        """
+        Get all the stations bounded by a box using Map Query API.
+
+        Args:
+            bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2 of the box
+
+        Returns:
+            Dict: JSON data containing all stations within the bounds.
+        """
+        return await self.__get_json(self._map_url(bbox), MAP_ENDPOINT)
+
+
+    async def __discover_stations(self) -> List[Station] | None:
+        """
+        Find all the stations of the bounding box, over a grid of concurrent tile queries if
+        tiling is set. See CalculateAveragePM25.set_tiling.
+
+        Returns:
+            List[Station]: Stations within the bounds or None if any query failed
+        """
+        if self.tiling is None:
+            return self._extract_stations(await self.__get_map_bound(self._bounds()))
+
+        results = []
+        pending = {asyncio.create_task(self.__get_map_bound(tile)): (tile, 0)
+                   for tile in split_bounds(self._bounds(), self.tiling.rows, self.tiling.cols)}
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tile, depth = pending.pop(task)
+                stations = self._extract_stations(task.result())
+
+                if stations is None: # one missing tile would silently bias the average
+                    for other in pending:
+                        other.cancel()
+                    return None
+
+                if is_truncated(stations, self.tiling, depth):
+                    self.logger.info(f"tile {tile} returned {len(stations)} stations, splitting it.")
+                    for sub_tile in split_bounds(tile, self.tiling.rows, self.tiling.cols):
+                        pending[asyncio.create_task(self.__get_map_bound(sub_tile))] = (sub_tile, depth + 1)
+                else:
+                    results.append(stations)
+
+        return merge_stations(results)
+
+
+    async def __get_pm25(self, station: Station) -> Tuple[object, Optional[float]]:
+        """
+        Get PM2.5 value for a specific station, by uid if known.
+
+        Args:
+            station (Station): The station to query
+
+        Returns:
+            Tuple[object, Optional[float]]: Id of the station that answered and its PM2.5 value
+            if found, None otherwise
+        """
+        station_data = await self.__get_json(self._station_url(station),
+                                             UID_ENDPOINT if station.uid is not None else GEO_ENDPOINT)
+        return self._extract_station_id(station_data) or station_key(station), self._extract_pm25(station_data)
+
+
+    async def __fetch_stations(self, stations: List[Station], tick: Tick) -> Dict[object, float]:
+        '''
+        Get PM2.5 values for the given stations concurrently. Every physical station is
+        counted once, even if several coordinates resolved to it. With a tick timeout, the
+        requests still going at the tick's time limit are cancelled and counted in tick.late.
+
+        Returns:
+            Dict[object, float]: Values of the stations that answered by station id
+        '''
+        results = {}
+        stations = merge_stations([stations])
+        if not stations:
+            return results
+
+        tasks = [asyncio.ensure_future(self.__get_pm25(st)) for st in stations]
+        timeout = None
+        if self.tick_timeout is not None:
+            timeout = max(0.0, tick.deadline + self.tick_timeout - asyncio.get_running_loop().time())
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+        except asyncio.CancelledError: # the run is stopped, stop its requests too
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if pending:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            tick.late += len(pending)
+            self.logger.warning(f"{tick.name} timed out, {len(pending)} station(s) late.")
+            if self.metrics is not None:
+                self.metrics.stations_late(len(pending))
+
+        for station, task in zip(stations, tasks):
+            if task in pending:
+                continue
+            result = task.exception() or task.result()
+            if isinstance(result, Exception):
+                self.logger.error(f"station at lat,lng {station} generated Error: {result}")
+            elif result[1] is not None: # ignore failed requests
+                results[result[0]] = result[1]
+                self._coords[result[0]] = (station.lat, station.lon)
+            if self.metrics is not None:
+                self.metrics.station_fetched(not isinstance(result, Exception) and result[1] is not None)
+        return results
+
+
+    async def __smapler(self, tick: Tick):
+        '''
+        Get PM2.5 values for all stations, per station or from the map query depending on
+        the sampling mode, see CalculateAveragePM25._plan_tick. The values of a tick that
+        outlives its run are dropped.
+        '''
+        future = self._future
+        self._set_state(self.RUNNING, tick)
+        started, sampled_at = time.monotonic(), time.time()
+
+        snapshot = await self.__discover_stations() if self.sampling_mode != STATION_MODE else None
+        results, stations = self._plan_tick(snapshot)
+        if stations:
+            results.update(await self.__fetch_stations(stations, tick))
+
+        if future is not self._future or future.done():
+            self.logger.warning(f"{tick.name} finished after its run was stopped, dropping its values.")
+            return
+
+        added = self._record_tick(tick, sampled_at, results, ())
+        self._set_state(self.DONE if added else self.FAILED, tick)
+
+        if self.metrics is not None:
+            self.metrics.tick_finished(tick.state, time.monotonic() - started, started - tick.deadline, added)
+        self._notify_tick(tick, results)
+
+
+    async def __schedule(self, interval: float, count: Optional[int], stopped: asyncio.Event, future: Future):
+        '''
+        Fire ticks at monotonic deadlines until count ticks ran or stopped is set, then resolve
+        the run's future and release the private session. Same schedule as scheduler.TickScheduler: deadlines are absolute
+        and the overrun policy decides which ticks still fire after a tick ran past their deadline.
+        '''
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        index = 0
+        try:
+            while count is None or index < count:
+                deadline = start + index * interval
+                try:
+                    await asyncio.wait_for(stopped.wait(), timeout=max(0.0, deadline - loop.time()))
+                    return
+                except asyncio.TimeoutError:
+                    pass
+
+                await self.__smapler(Tick(index, interval, deadline))
+
+                following, dropped = after_tick(start, interval, index, loop.time(),
+                                                self.overrun_policy, self.max_backlog)
+                if dropped:
+                    self.logger.warning(f"tick {index} overran, skipping {dropped} tick(s).")
+                index = following
+        finally:
+            self._finish_run(future, stopped.is_set())
+            await self.__close_session()
+
+
+    async def __close_session(self):
+        if self.__owns_session and self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+
+    async def start_sampling(self, blocking=False, refresh_stations=False) -> None:
+        '''
+        Start sampling PM2.5 values as tasks on the running event loop.
+
+        Args:
+            blocking (bool): If True, the coroutine will not return until all ticks are finished.
+            refresh_stations (bool): If True, discover stations again instead of using the
+                ones from the previous run or the station cache.
+        '''
+
+        # stop a previous scheduler task and let its running tick finish before clearing its data
+        if self.__stopped is not None:
+            self.__stopped.set()
+        await self.wait()
+        self.clean_up()
+        future = self._new_run()
+
+        if not self.TOKEN: # if token is not set
+            self.logger.error("Error: Token is not set.")
+            self.state = self.FAILED
+            self._finish_run(future)
+            return
+
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(timeout=self.timeout,
+                                                   connector=aiohttp.TCPConnector(limit=self.concurrency))
+        self.__semaphore = asyncio.Semaphore(self.concurrency)
+
+        if refresh_stations:
+            self._stations = []
+
+        if not self._stations: # if stations are not already extracted
+            self._stations = self._cached_stations(refresh_stations)
+
+            if self._stations is None:
+                self._stations = await self.__discover_stations()
+                self._cache_stations(self._stations)
+
+            if self._stations is None:
+                self.logger.error("Request to get stations failed.")
+                self.state = self.FAILED
+                self._finish_run(future)
+                await self.__close_session()
+                return
+
+            elif self._stations == []:
+                self.logger.error("No stations found in the given bounds.")
+                self.state = self.DONE
+                self._finish_run(future)
+                await self.__close_session()
+                return
+
+        if not self._prepare_run():
+            self.state = self.FAILED
+            self._finish_run(future)
+            await self.__close_session()
+            return
+
+        # one scheduler task runs the ticks on sampling intervals
+        self._tick_total = tick_count(self._sampling_period, self._sampling_rate)
+        self.__stopped   = asyncio.Event()
+        self.__runner    = asyncio.create_task(self.__schedule(sampling_interval(self._sampling_rate),
+                                                               self._tick_total, self.__stopped, future),
+                                               name=f"{self.__class__.__name__}-scheduler")
+
+        if blocking:
+            await self.wait()
+
+
+    async def wait(self, timeout: float = None) -> bool:
+        '''
+        Wait until all sampling ticks are finished or stopped.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait. Defaults to None (no limit).
+
+        Returns:
+            bool: True if the run is over (or none was started), False on timeout
+        '''
+        if self.__runner is None:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self.__runner), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+    def ticks(self) -> AsyncIterator[TickResult]:
+        '''
+        Iterate with async for over the ticks of the current run as they complete, until the
+        run is over. Ticks that completed before the call are not included.
+
+        Returns:
+            AsyncIterator[TickResult]: Aggregate of every completed tick, in completion order
+        '''
+        subscriber = asyncio.Queue()
+        future = self._subscribe(subscriber)
+        return self.__drain(subscriber, future)
+
+
+    async def __drain(self, subscriber: asyncio.Queue, future: Future | None) -> AsyncIterator[TickResult]:
+        if future is None:
+            return
+        try:
+            while (result := await subscriber.get()) is not None:
+                yield result
+        finally:
+            self._unsubscribe(subscriber)
+
+
+    async def stop_sampling(self, timeout: float = None) -> None:
+        '''
+        Stop the sampling process. Clean up data.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the running tick, which is
+                cancelled after that. Defaults to None (wait for the tick).
+        '''
+
+        # cancel the coming ticks and wait for the running one to finish
+        if self.__stopped is not None:
+            self.__stopped.set()
+            if self._tick_states[self.RUNNING]:
+                self.logger.info("Waiting for the running tick to finish.")
+            if not await self.wait(timeout):
+                self.logger.warning(f"Running tick did not finish within {timeout}s, cancelling it.")
+                self.__runner.cancel()
+                await asyncio.gather(self.__runner, return_exceptions=True)
+
+        self.state = self.STOPPED
+
+        self.logger.info("Sampling stopped.")
+
+        # clean up for next run
+        self.clean_up()
+
+
+    def __unsupported(self, setting: str, value) -> None:
+        if value is not None:
+            raise ValueError(f"{self.__class__.__name__} does not support {setting}")
+
+
+    def set_concurrency_limiter(self, concurrency_limiter) -> None:
+        self.__unsupported("an adaptive concurrency limiter, use the concurrency argument", concurrency_limiter)
+        super().set_concurrency_limiter(concurrency_limiter)
+
+
+    def set_retry_policy(self, retry_policy) -> None:
+        self.__unsupported("retries", retry_policy)
+        super().set_retry_policy(retry_policy)
+
+
+    def set_hedge_policy(self, hedge_policy) -> None:
+        self.__unsupported("hedged requests", hedge_policy)
+        super().set_hedge_policy(hedge_policy)
+
+
+    def set_freshness_tracker(self, freshness) -> None:
+        self.__unsupported("a freshness tracker", freshness)
+        super().set_freshness_tracker(freshness)
+
+
+    def set_response_cache(self, response_cache) -> None:
+        self.__unsupported("a response cache", response_cache)
+        super().set_response_cache(response_cache)
+
+
+    def _sampling_alive(self) -> bool:
+        return self.__runner is not None and not self.__runner.done()
+
+
+    def clean_up(self):
+        '''
+        Clean up the object. A running scheduler task stops before its next tick.
+        '''
+        if self.__stopped is not None:
+            self.__stopped.set()
+        super().clean_up()
+
+
+    async def close(self) -> None:
+        '''
+        Stop any ongoing sampling and close the private session.
+        '''
+        await self.stop_sampling()
+        await self.__close_session()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
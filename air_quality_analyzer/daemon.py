@@ -0,0 +1,392 @@
+"""
+Long-running sampler serving the averages of its regions to local clients.
+
+Samples the configured regions continuously with one MultiRegionAnalyzer and serves the
+current and windowed averages, the station lists and the run status as JSON over local
+HTTP and/or a Unix socket. Clients read the last published snapshot from memory, so
+any number of them share one sampler without sending a single request upstream.
+
+    air-quality-daemon --token TOKEN --region vancouver=49.3,-123.3,49.0,-122.7 --rate 2 --port 8765
+    air-quality-daemon --config daemon.json --unix-socket /run/air-quality.sock
+
+Endpoints:
+    GET /status               state, tick counts, last tick, stations and runs
+    GET /averages             statistics of all the regions and of every region
+    GET /averages/<region>    statistics of one region
+    GET /stations             stations of every region with their last value
+    GET /stations/<region>    stations of one region
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socketserver
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, RLock, Thread, Timer
+from typing import Dict, Hashable, Iterable, List, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .aggregator import StreamingAggregator
+from .metrics import MetricsExporter, MetricsRegistry
+from .multi_region import MultiRegionAnalyzer
+from .scheduler import Tick
+from .stations import station_key
+
+
+DEFAULT_PORT    = 8765
+DEFAULT_WINDOWS = (300, 3600) # 5 minutes and 1 hour
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, clients poll
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        payload = self.server.sampler.payload(unquote(urlsplit(self.path).path))
+        if payload is None:
+            payload = b'{"error": "not found"}'
+            self.send_response(404)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnixQueryHandler(_QueryHandler):
+    disable_nagle_algorithm = False # TCP only
+
+
+class _HTTPQueryServer(ThreadingHTTPServer):
+    daemon_threads     = True
+    request_queue_size = 1024
+
+
+class _UnixQueryServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads     = True
+    request_queue_size = 1024
+
+
+class SamplingDaemon:
+    """
+    Runs an analyzer until stopped and serves what it measured from memory.
+
+    The analyzer should sample with no end (sampling_period None), see build_analyzer.
+    After every tick the daemon encodes a snapshot of every endpoint once, requests are
+    answered with those bytes without touching the analyzer. A run that ends (e.g. station
+    discovery failed) is started again after restart_delay seconds.
+
+    Attributes:
+        analyzer (MultiRegionAnalyzer): The sampler
+        runs (int): Runs started
+
+    Args:
+        analyzer (MultiRegionAnalyzer): Configured analyzer, not started. Give its regions
+            aggregators with windows to serve windowed averages.
+        host (str, optional): Address of the HTTP endpoint, None for no HTTP endpoint. Defaults to "127.0.0.1".
+        port (int, optional): Port of the HTTP endpoint, 0 for a free one. Defaults to 8765.
+        unix_socket (str, optional): Path of a Unix socket endpoint. Defaults to None.
+        restart_delay (float, optional): Seconds before a finished run is started again. Defaults to 30.
+    """
+
+    def __init__(self, analyzer: MultiRegionAnalyzer, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 unix_socket: str = None, restart_delay: float = 30):
+
+        if host is None and unix_socket is None:
+            raise ValueError("an HTTP address or a Unix socket is needed")
+        if restart_delay < 0:
+            raise ValueError("restart_delay can not be negative")
+
+        self.analyzer      = analyzer
+        self.host          = host
+        self.port          = port
+        self.unix_socket   = unix_socket
+        self.restart_delay = restart_delay
+        self.runs          = 0
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.__payloads  = {}   # path -> encoded JSON, replaced as a whole
+        self.__latest    = {}   # last value by station key
+        self.__last_tick = None
+        self.__started   = None # Unix time of start()
+        self.__servers   = []
+        self.__threads   = []
+        self.__restart   = None # Timer of the next run
+        self.__stopping  = Event()
+        self.__lock      = RLock() # a failed start_sampling calls __on_run_end on the same thread
+
+        analyzer.add_tick_callback(self.__on_tick)
+        analyzer.add_done_callback(self.__on_run_end)
+
+
+    def start(self) -> 'SamplingDaemon':
+        '''
+        Open the endpoints and start sampling.
+        '''
+        self.__started = time.time()
+        self.__stopping.clear()
+
+        if self.host is not None:
+            server = _HTTPQueryServer((self.host, self.port), _QueryHandler)
+            self.port = server.server_address[1]
+            self.__serve(server)
+            self.logger.info(f"Serving on http://{self.host}:{self.port}")
+        if self.unix_socket is not None:
+            if os.path.exists(self.unix_socket):
+                os.unlink(self.unix_socket) # left by a daemon that was killed
+            self.__serve(_UnixQueryServer(self.unix_socket, _UnixQueryHandler))
+            self.logger.info(f"Serving on {self.unix_socket}")
+
+        self.__publish()
+        self.__start_run()
+        return self
+
+
+    def __serve(self, server) -> None:
+        server.sampler = self
+        thread = Thread(target=server.serve_forever, name=f"{self.__class__.__name__}-{len(self.__servers)}",
+                        daemon=True)
+        thread.start()
+        self.__servers.append(server)
+        self.__threads.append(thread)
+
+
+    def __start_run(self) -> None:
+        with self.__lock: # stop() waits for the station discovery
+            if self.__stopping.is_set():
+                return
+            self.runs += 1
+            self.analyzer.start_sampling()
+        self.__publish()
+
+
+    def __on_run_end(self, future) -> None:
+        self.__publish()
+        if self.__stopping.is_set() or future.cancelled():
+            return
+        self.logger.warning(f"Sampling run ended ({self.analyzer.sampling_status()}), "
+                            f"starting again in {self.restart_delay}s.")
+        with self.__lock:
+            if self.__stopping.is_set():
+                return
+            # not from this thread: the run's scheduler calls the done callbacks
+            self.__restart = Timer(self.restart_delay, self.__start_run)
+            self.__restart.daemon = True
+            self.__restart.start()
+
+
+    def __on_tick(self, tick: Tick, values: Dict[Hashable, float]) -> None:
+        # values are by feed idx, stations without a uid are known by their coordinates
+        keys = {station_key(st) for st in self.analyzer._stations or []}
+        coords = self.analyzer._coords
+        self.__latest.update((key if key in keys else coords.get(key, key), value) for key, value in values.items())
+        self.__last_tick = {'index': tick.index, 'state': tick.state, 'late': tick.late,
+                            'values': len(values), 'at': time.time()}
+        self.__publish()
+
+
+    def stop(self, timeout: float = None) -> None:
+        '''
+        Stop sampling and close the endpoints.
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the running tick, see
+                CalculateAveragePM25.stop_sampling. Defaults to None.
+        '''
+        with self.__lock:
+            self.__stopping.set()
+            if self.__restart is not None:
+                self.__restart.cancel()
+
+        self.analyzer.stop_sampling(timeout)
+        for server in self.__servers:
+            server.shutdown()
+            server.server_close()
+        for thread in self.__threads:
+            thread.join()
+        self.__servers, self.__threads = [], []
+
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+        self.analyzer.clean_up()
+
+
+    def __enter__(self) -> 'SamplingDaemon':
+        return self.start()
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+    def payload(self, path: str) -> bytes | None:
+        """
+        Encoded JSON response of an endpoint path, from the last snapshot.
+
+        Returns:
+            bytes: The response body, None for an unknown path
+        """
+        return self.__payloads.get(path.rstrip('/') or '/')
+
+
+    def __publish(self) -> None:
+        '''
+        Encode every endpoint from the analyzer's current state and swap them in at once.
+        '''
+        analyzer = self.analyzer
+        now = time.time()
+        with analyzer._lock:
+            averages = {name: _aggregator_stats(region.aggregator) for name, region in analyzer.regions.items()}
+            overall  = _aggregator_stats(analyzer.aggregator)
+            ticks    = dict(analyzer._tick_states)
+
+        known = analyzer._stations or [] # None after a failed discovery
+        stations = {}
+        for name, region in analyzer.regions.items():
+            stations[name] = [{'uid': st.uid, 'lat': st.lat, 'lon': st.lon,
+                               'pm25': self.__latest.get(station_key(st))}
+                              for st in known if station_key(st) in region.keys]
+
+        status = {
+            'state': analyzer.sampling_status(),
+            'sampling': analyzer._sampling_alive(),
+            'sampling_rate': analyzer._sampling_rate,
+            'ticks': ticks,
+            'last_tick': self.__last_tick,
+            'stations': len(known),
+            'regions': [str(name) for name in analyzer.regions],
+            'runs': self.runs,
+            'started_at': self.__started,
+            'updated_at': now,
+        }
+
+        payloads = {
+            '/status': status,
+            '/averages': {'updated_at': now, 'all': overall, 'regions': {str(k): v for k, v in averages.items()}},
+            '/stations': {'updated_at': now, 'regions': {str(k): v for k, v in stations.items()}},
+        }
+        for name in analyzer.regions:
+            payloads[f'/averages/{name}'] = {'updated_at': now, 'region': str(name), **averages[name]}
+            payloads[f'/stations/{name}'] = {'updated_at': now, 'region': str(name), 'stations': stations[name]}
+
+        self.__payloads = {path: json.dumps(body).encode() for path, body in payloads.items()}
+
+
+def _aggregator_stats(aggregator: StreamingAggregator) -> Dict:
+    return {'stats': aggregator.stats(),
+            'windows': {f"{seconds:g}": aggregator.window_stats(seconds)
+                        for seconds in getattr(aggregator, 'windows', ())}}
+
+
+def _parse_region(text: str) -> Tuple[str, Tuple[float, float, float, float]]:
+    '''
+    "name=lat1,lng1,lat2,lng2" to (name, bbox).
+    '''
+    name, sep, bounds = text.partition('=')
+    try:
+        bbox = tuple(float(v) for v in bounds.split(','))
+    except ValueError:
+        bbox = ()
+    if not sep or not name or len(bbox) != 4:
+        raise argparse.ArgumentTypeError(f"expected name=lat1,lng1,lat2,lng2, got {text!r}")
+    return name, bbox
+
+
+def _load_config(path: str) -> Dict:
+    '''
+    Defaults of the command line options from a JSON file, keyed like the options
+    (e.g. "rate", "unix_socket"), with "regions" as {name: [lat1, lng1, lat2, lng2]}.
+    '''
+    with open(path) as f:
+        config = json.load(f)
+    if 'regions' in config:
+        config['regions'] = [(name, tuple(bbox)) for name, bbox in config['regions'].items()]
+    return config
+
+
+def build_analyzer(regions: List[Tuple[str, Tuple[float, float, float, float]]], sampling_rate: float,
+                   windows: Iterable[float] = DEFAULT_WINDOWS) -> MultiRegionAnalyzer:
+    """
+    An open-ended MultiRegionAnalyzer whose aggregators keep rolling windows.
+
+    Args:
+        regions (List[Tuple[str, Tuple[float, float, float, float]]]): (name, bbox) of every region
+        sampling_rate (float): Samples per minute
+        windows (Iterable[float], optional): Window lengths in seconds. Defaults to 5 minutes and 1 hour.
+    """
+    windows = tuple(windows)
+    analyzer = MultiRegionAnalyzer(dict(regions), sampling_period=None, sampling_rate=sampling_rate,
+                                   aggregator=StreamingAggregator(windows=windows))
+    for name, bbox in regions:
+        analyzer.add_region(name, bbox, StreamingAggregator(windows=windows))
+    return analyzer
+
+
+def main(argv: List[str] = None):
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config", help="JSON file with defaults for the options below")
+    known, _ = pre.parse_known_args(argv)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     parents=[pre])
+    parser.add_argument("--region", dest="regions", action="append", type=_parse_region, default=[],
+                        metavar="NAME=LAT1,LNG1,LAT2,LNG2", help="region to sample, repeatable")
+    parser.add_argument("--token", default=os.environ.get("WAQI_TOKEN"), help="WAQI token, defaults to $WAQI_TOKEN")
+    parser.add_argument("--rate", type=float, default=1, help="samples per minute")
+    parser.add_argument("--window", dest="windows", type=float, action="append",
+                        help="rolling window in seconds, repeatable (default: 300 and 3600)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--host", default="127.0.0.1", help="HTTP address, 'none' to only serve the Unix socket")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket")
+    parser.add_argument("--restart-delay", type=float, default=30)
+    parser.add_argument("--api-base", help="scheme and host replacing https://api.waqi.info")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument("--log-level", default="info", choices=("info", "error", "critical"))
+    if known.config:
+        parser.set_defaults(**_load_config(known.config))
+    args = parser.parse_args(argv)
+
+    if not args.regions:
+        parser.error("at least one --region is needed")
+    if not args.token:
+        parser.error("a token is needed, use --token or $WAQI_TOKEN")
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=args.log_level.upper())
+
+    analyzer = build_analyzer(args.regions, args.rate, args.windows or DEFAULT_WINDOWS)
+    analyzer.set_token(args.token)
+    analyzer.set_logger_level(args.log_level)
+    analyzer.set_api_base(args.api_base)
+    analyzer.thread_cnt = args.threads
+
+    exporter = None
+    if args.metrics_port is not None:
+        registry = MetricsRegistry()
+        analyzer.set_metrics(registry)
+        # metrics stay local when the TCP endpoint is off
+        exporter = MetricsExporter(registry, args.metrics_port, args.host if args.host != 'none' else "127.0.0.1")
+
+    stopped = Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    sampler = SamplingDaemon(analyzer, None if args.host == 'none' else args.host, args.port,
+                             args.unix_socket, args.restart_delay).start()
+    try:
+        while not stopped.wait(1):
+            pass
+    finally:
+        sampler.stop(timeout=10)
+        if exporter is not None:
+            exporter.close()
+
+
+if __name__ == "__main__":
+    main()
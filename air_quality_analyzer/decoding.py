@@ -0,0 +1,131 @@
+import json
+import re
+from typing import Any, Dict
+
+from .metrics import GEO_ENDPOINT, UID_ENDPOINT
+
+try:
+    import orjson
+except ImportError: # optional, pip install '.[fast]'
+    orjson = None
+
+
+SMALL_BODY = 1024 # bytes, decoded in full: scanning them is not faster
+
+def loads(content: bytes | str) -> Any:
+    """
+    Decode a JSON document with orjson if it is installed, the json module otherwise.
+
+    Raises:
+        ValueError: If the document is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class ResponseDecoder:
+    """
+    Turns the body of an API response into the JSON data the analyzer reads, the decoder
+    used for every response (see CalculateAveragePM25.set_decoder). This one decodes the
+    whole body with the fastest available backend, override decode to change that.
+    """
+
+    def decode(self, content: bytes, endpoint: str) -> Any:
+        """
+        Decode a response body.
+
+        Args:
+            content (bytes): Body of a 200 response
+            endpoint (str): MAP_ENDPOINT, GEO_ENDPOINT or UID_ENDPOINT
+
+        Returns:
+            Any: The decoded data
+
+        Raises:
+            ValueError: If the body is not valid JSON
+        """
+        return loads(content)
+
+
+# JSON read member by member: a key, then its value. Containers are skipped whole by the
+# value pattern, up to _MAX_DEPTH levels of nesting (a feed's forecast has 4).
+_MAX_DEPTH = 5
+_STRING    = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+def _container(depth: int) -> bytes:
+    inner = rb'[^"{}\[\]]+(?=["{}\[\]])|' + _STRING # whole runs of scalars, never split
+    if depth > 1:
+        inner += rb'|' + _container(depth - 1)
+    return rb'[{\[](?:' + inner + rb')*[}\]]'
+
+_KEY    = rb'\s*(' + _STRING + rb')\s*:\s*'
+_VALUE  = rb'(' + _STRING + rb'|' + _container(_MAX_DEPTH) + rb'|[^"{}\[\],\s]+)\s*,?'
+_MEMBER = re.compile(_KEY + _VALUE)
+_KEY    = re.compile(_KEY)
+_VALUE  = re.compile(_VALUE)
+_OPEN  = re.compile(rb'\s*\{')
+_CLOSE = re.compile(rb'\s*\}')
+
+_DATA_FIELDS = (b'"idx"', b'"iaqi"', b'"time"')
+
+def _feed_fields(content: bytes) -> Dict[bytes, bytes] | None:
+    '''
+    Raw values of status, data.idx, data.iaqi and data.time, read from the top of the
+    document until all of them are found. Only the members of the document and of data
+    are read, so keys of the same name in nested objects are never mistaken for them.
+
+    Returns:
+        Dict[bytes, bytes]: Raw value by quoted key, None if the document could not be read
+        this way (not JSON, or values nested deeper than _MAX_DEPTH)
+    '''
+    fields = {}
+    root = _OPEN.match(content)
+    if root is None:
+        return None
+    pos = root.end()
+    while (key := _KEY.match(content, pos)) is not None:
+        if key[1] == b'"data"' and (data := _OPEN.match(content, key.end())) is not None:
+            pos = data.end()
+            while (member := _MEMBER.match(content, pos)) is not None:
+                if member[1] in _DATA_FIELDS:
+                    fields[member[1]] = member[2]
+                    if len(fields) == len(_DATA_FIELDS) + 1:
+                        return fields
+                pos = member.end()
+            return fields if _CLOSE.match(content, pos) is not None else None
+
+        value = _VALUE.match(content, key.end())
+        if value is None:
+            return None
+        if key[1] == b'"status"':
+            fields[key[1]] = value[1]
+        pos = value.end()
+    return fields if _CLOSE.match(content, pos) is not None else None
+
+
+class FeedDecoder(ResponseDecoder):
+    """
+    Decodes only the fields of station feeds the analyzer reads: status, data.idx,
+    data.iaqi and data.time. A feed is mostly a multi-day forecast that is never used;
+    the needed objects are found in the raw bytes and only they are decoded, into a
+    document of the same shape. Only the members of the document and of data are read,
+    so a key of the same name in a nested object (city, forecast, ...) is never mistaken
+    for them. Error responses, feeds without iaqi, small bodies, map queries and feeds
+    that can not be read this way are decoded in full.
+    """
+
+    def decode(self, content: bytes, endpoint: str) -> Any:
+        if endpoint not in (GEO_ENDPOINT, UID_ENDPOINT) or len(content) < SMALL_BODY:
+            return loads(content)
+
+        fields = _feed_fields(content)
+        if fields is None or fields.get(b'"status"') != b'"ok"' or not fields.get(b'"iaqi"', b'').startswith(b'{'):
+            return loads(content)
+
+        data = {'iaqi': loads(fields[b'"iaqi"'])}
+        if b'"idx"' in fields:
+            data['idx'] = loads(fields[b'"idx"'])
+        if b'"time"' in fields:
+            data['time'] = loads(fields[b'"time"'])
+        return {'status': 'ok', 'data': data}
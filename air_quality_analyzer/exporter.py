@@ -0,0 +1,51 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from .metrics import MetricsRegistry
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsExporter(ThreadingHTTPServer):
+    """
+    Serves a MetricsRegistry at /metrics for Prometheus to scrape, from a daemon thread.
+
+    Args:
+        registry (MetricsRegistry): The metrics to serve
+        port (int, optional): Port to listen on, 0 for a free one. Defaults to 9108.
+        host (str, optional): Address to listen on. Defaults to all interfaces.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9108, host: str = ""):
+        super().__init__((host, port), _ExporterHandler)
+        self.registry = registry
+        self.__thread = Thread(target=self.serve_forever, name=self.__class__.__name__, daemon=True)
+        self.__thread.start()
+
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+    def close(self) -> None:
+        self.shutdown()
+        self.__thread.join()
+        self.server_close()
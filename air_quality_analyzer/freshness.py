@@ -0,0 +1,117 @@
+import time
+from threading import Lock
+from typing import Hashable, Optional, Tuple
+
+
+class _StationFreshness:
+
+    __slots__ = ('result_key', 'value', 'measured_at', 'interval', 'next_check')
+
+    def __init__(self, interval: float):
+        self.result_key  = None
+        self.value       = None
+        self.measured_at = None
+        self.interval    = interval
+        self.next_check  = 0.0
+
+
+class FreshnessTracker:
+    """
+    Predicts when a station publishes its next measurement so unchanged stations are not
+    requested again.
+
+    WAQI stations usually publish once an hour. After each fetch the measurement time of the
+    feed is recorded and the next fetch is due at measured_at + interval + publish_delay.
+    The interval starts at update_interval and follows the gap between the measurements seen
+    for the station (exponential moving average). A fetch that returns the same measurement
+    again means the prediction was early, the station is then checked every recheck seconds.
+
+    Times are wall clock (time.time()) since measurement times come from the API.
+
+    Args:
+        update_interval (float, optional): Expected seconds between two measurements. Defaults to 3600.
+        publish_delay (float, optional): Seconds between a measurement time and its availability. Defaults to 300.
+        recheck (float, optional): Seconds between checks of an overdue station. Defaults to 300.
+        smoothing (float, optional): Weight of the newest gap in the interval average. Defaults to 0.3.
+    """
+
+    def __init__(self, update_interval=3600.0, publish_delay=300.0, recheck=300.0, smoothing=0.3):
+
+        if update_interval <= 0 or recheck <= 0:
+            raise ValueError("update_interval and recheck can not be zero or negative")
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing must be between 0 and 1")
+
+        self.update_interval = update_interval
+        self.publish_delay   = publish_delay
+        self.recheck         = recheck
+        self.smoothing       = smoothing
+
+        self.__stations = {} # station key -> _StationFreshness
+        self.__lock     = Lock()
+
+
+    def due(self, station: Hashable, now: float = None) -> bool:
+        """
+        Check if a station may have published a new measurement since its last fetch.
+
+        Args:
+            station (Hashable): Station key
+            now (float, optional): Current wall clock time. Defaults to time.time().
+
+        Returns:
+            bool: True if the station should be fetched, always True for unknown stations
+        """
+        now = time.time() if now is None else now
+        with self.__lock:
+            entry = self.__stations.get(station)
+            return entry is None or entry.value is None or now >= entry.next_check
+
+
+    def last(self, station: Hashable) -> Optional[Tuple[Hashable, float]]:
+        """
+        Last value fetched for a station.
+
+        Returns:
+            Tuple[Hashable, float]: (id of the station that answered, value) or None if unknown
+        """
+        with self.__lock:
+            entry = self.__stations.get(station)
+            if entry is None or entry.value is None:
+                return None
+            return entry.result_key, entry.value
+
+
+    def record(self, station: Hashable, result_key: Hashable, value: Optional[float],
+               measured_at: Optional[float], now: float = None) -> None:
+        """
+        Record the outcome of a fetch and predict the next measurement.
+
+        Args:
+            station (Hashable): Station key
+            result_key (Hashable): Id of the station that answered
+            value (float): Fetched value, None if the fetch failed
+            measured_at (float): Measurement time of the feed as a unix timestamp, None if unknown
+            now (float, optional): Current wall clock time. Defaults to time.time().
+        """
+        now = time.time() if now is None else now
+        with self.__lock:
+            entry = self.__stations.get(station)
+            if entry is None:
+                entry = self.__stations[station] = _StationFreshness(self.update_interval)
+
+            if value is None or measured_at is None: # nothing to predict from, fetch again next tick
+                entry.value = None
+                return
+
+            if entry.measured_at is not None and measured_at > entry.measured_at:
+                gap = measured_at - entry.measured_at
+                entry.interval += self.smoothing * (gap - entry.interval)
+
+            entry.result_key  = result_key
+            entry.value       = value
+            entry.measured_at = measured_at
+
+            predicted = measured_at + entry.interval + self.publish_delay
+            entry.next_check = predicted if predicted > now else now + self.recheck
+
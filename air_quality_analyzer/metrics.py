@@ -0,0 +1,247 @@
+import math
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Iterable, Tuple
+
+
+# Endpoints of the request hooks
+MAP_ENDPOINT = 'map' # Map Query API
+GEO_ENDPOINT = 'geo' # Geolocalized feed
+UID_ENDPOINT = 'uid' # Feed by station id
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TICK_BUCKETS    = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class MetricsHook:
+    """
+    Receives the events of a sampling run. All methods do nothing, override the ones you need.
+
+    Hooks are called from the threads doing the work (worker threads for requests, the
+    scheduler thread for ticks), so implementations must be thread-safe and fast. When no
+    hook is set the analyzer skips the calls entirely.
+    """
+
+    def request_started(self, endpoint: str) -> None:
+        '''
+        A request to endpoint (MAP_ENDPOINT, GEO_ENDPOINT or UID_ENDPOINT) is being sent.
+        '''
+
+
+    def request_finished(self, endpoint: str, status: int | None, latency: float) -> None:
+        '''
+        A request ended with an HTTP status, or None if it failed before getting a response.
+        '''
+
+
+    def request_retried(self, endpoint: str) -> None:
+        pass
+
+
+    def request_hedged(self, endpoint: str) -> None:
+        pass
+
+
+    def station_fetched(self, success: bool) -> None:
+        '''
+        A station request gave a PM2.5 value, or not.
+        '''
+
+
+    def stations_late(self, count: int) -> None:
+        '''
+        count station requests missed the time limit of their tick and were left out.
+        '''
+
+
+    def tick_finished(self, state: str, duration: float, lag: float, values: int) -> None:
+        '''
+        A tick ended in state (DONE or FAILED) after duration seconds, lag seconds after its
+        deadline, with values station values added to the aggregator.
+        '''
+
+
+class _Histogram:
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+class MetricsRegistry(MetricsHook):
+    """
+    A MetricsHook keeping counters, gauges and histograms of a run in memory, readable as a
+    dict with snapshot() or in the Prometheus text format with render().
+
+    One registry can be shared by several analyzers, their metrics add up.
+
+    Metrics (with the namespace prefix):
+        requests_total{endpoint,status}: Requests by HTTP status, "error" without a response
+        request_duration_seconds{endpoint}: Histogram of request latencies
+        requests_in_flight{endpoint}: Requests currently sent
+        throttled_total{endpoint}: 429 responses
+        retries_total{endpoint}, hedges_total{endpoint}: Requests sent again
+        station_fetches_total{result}: Station requests with ("ok") or without ("failed") a value,
+            or that missed the tick's time limit ("late")
+        ticks_total{state}: Finished ticks by state
+        tick_duration_seconds: Histogram of tick durations
+        tick_values: Values added by the last tick
+        scheduler_lag_seconds: Delay between the deadline and the start of the last tick
+
+    Args:
+        namespace (str, optional): Prefix of the metric names. Defaults to "air_quality".
+        latency_buckets (Iterable[float], optional): Upper bounds of the request latency buckets in seconds.
+        tick_buckets (Iterable[float], optional): Upper bounds of the tick duration buckets in seconds.
+    """
+
+    def __init__(self, namespace: str = "air_quality", latency_buckets: Iterable[float] = LATENCY_BUCKETS,
+                 tick_buckets: Iterable[float] = TICK_BUCKETS):
+
+        self.namespace       = namespace
+        self.latency_buckets = tuple(sorted(latency_buckets))
+        self.tick_buckets    = tuple(sorted(tick_buckets))
+
+        self.__lock = Lock()
+        self.reset()
+
+
+    def reset(self) -> None:
+        '''
+        Drop all the values.
+        '''
+        with self.__lock:
+            self.__counters   = {} # (name, labels) -> value
+            self.__gauges     = {} # (name, labels) -> value
+            self.__histograms = {} # (name, labels) -> _Histogram
+
+
+    def __add(self, name: str, labels: Tuple = (), value: float = 1) -> None:
+        key = (name, labels)
+        self.__counters[key] = self.__counters.get(key, 0) + value
+
+
+    def __observe(self, name: str, labels: Tuple, value: float, buckets: Tuple[float, ...]) -> None:
+        histogram = self.__histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.__histograms[(name, labels)] = _Histogram(buckets)
+        histogram.observe(value)
+
+
+    def request_started(self, endpoint: str) -> None:
+        key = ('requests_in_flight', (('endpoint', endpoint),))
+        with self.__lock:
+            self.__gauges[key] = self.__gauges.get(key, 0) + 1
+
+
+    def request_finished(self, endpoint: str, status: int | None, latency: float) -> None:
+        labels = (('endpoint', endpoint),)
+        with self.__lock:
+            key = ('requests_in_flight', labels)
+            self.__gauges[key] = self.__gauges.get(key, 0) - 1
+            self.__add('requests_total', labels + (('status', str(status) if status is not None else 'error'),))
+            self.__observe('request_duration_seconds', labels, latency, self.latency_buckets)
+            if status == 429:
+                self.__add('throttled_total', labels)
+
+
+    def request_retried(self, endpoint: str) -> None:
+        with self.__lock:
+            self.__add('retries_total', (('endpoint', endpoint),))
+
+
+    def request_hedged(self, endpoint: str) -> None:
+        with self.__lock:
+            self.__add('hedges_total', (('endpoint', endpoint),))
+
+
+    def station_fetched(self, success: bool) -> None:
+        with self.__lock:
+            self.__add('station_fetches_total', (('result', 'ok' if success else 'failed'),))
+
+
+    def stations_late(self, count: int) -> None:
+        with self.__lock:
+            self.__add('station_fetches_total', (('result', 'late'),), count)
+
+
+    def tick_finished(self, state: str, duration: float, lag: float, values: int) -> None:
+        with self.__lock:
+            self.__add('ticks_total', (('state', state),))
+            self.__observe('tick_duration_seconds', (), duration, self.tick_buckets)
+            self.__gauges[('tick_values', ())] = values
+            self.__gauges[('scheduler_lag_seconds', ())] = lag
+
+
+    def snapshot(self) -> Dict:
+        """
+        Current values.
+
+        Returns:
+            Dict: {"counters": ..., "gauges": ..., "histograms": ...}, each keyed by
+            (name, labels) where labels is a tuple of (label, value) pairs. Histograms are
+            dicts with buckets, counts (one more than buckets, the last one is +Inf), sum and count.
+        """
+        with self.__lock:
+            return {
+                'counters': dict(self.__counters),
+                'gauges': dict(self.__gauges),
+                'histograms': {key: {'buckets': h.buckets, 'counts': list(h.counts), 'sum': h.sum, 'count': h.count}
+                               for key, h in self.__histograms.items()},
+            }
+
+
+    def render(self) -> str:
+        """
+        All the metrics in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, values in (('counter', snapshot['counters']), ('gauge', snapshot['gauges'])):
+            for name in sorted({name for name, _ in values}):
+                lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{self.namespace}_{name}{_labels(labels)} {_number(value)}")
+
+        histograms = snapshot['histograms']
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {self.namespace}_{name} histogram")
+            for (metric, labels), h in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(h['buckets'] + (math.inf,), h['counts']):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else _number(bound)
+                    lines.append(f"{self.namespace}_{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{self.namespace}_{name}_sum{_labels(labels)} {_number(h['sum'])}")
+                lines.append(f"{self.namespace}_{name}_count{_labels(labels)} {h['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def __getattr__(name: str):
+    # the exporter needs http.server, imported only when it is used
+    if name == 'MetricsExporter':
+        from .exporter import MetricsExporter
+        return MetricsExporter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
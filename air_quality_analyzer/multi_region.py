@@ -0,0 +1,161 @@
+from typing import Dict, Hashable, List, Tuple, Set
+
+from .aggregator import StreamingAggregator
+from .analyzer import CalculateAveragePM25, STATION_MODE
+from .scheduler import Tick
+from .stations import BBox, Station, merge_stations, station_key
+
+
+class _Region:
+
+    __slots__ = ('bbox', 'aggregator', 'keys')
+
+    def __init__(self, bbox: BBox, aggregator: StreamingAggregator):
+        self.bbox       = bbox
+        self.aggregator = aggregator
+        self.keys       = set() # station keys found in the region
+
+
+class MultiRegionAnalyzer(CalculateAveragePM25):
+    """
+    Samples many bounding boxes with one scheduler, one worker pool, one session and one
+    rate budget.
+
+    Stations are discovered per region (through the station cache if set), then merged: a
+    station in several overlapping regions is requested once per tick and its value is
+    added to the aggregator of every region it belongs to. The analyzer's own aggregator
+    gets the values of all the distinct stations. All the configuration of
+    CalculateAveragePM25 (transport, rate limiter, retries, metrics, callbacks...) applies
+    to all regions at once. Only the 'station' sampling mode is supported.
+
+    Attributes:
+        regions (Dict[Hashable, _Region]): Regions by name, see region_aggregator
+
+    Args:
+        regions (Dict[Hashable, Tuple[float, float, float, float]]): Bounding box
+            (lat1, lng1, lat2, lng2) of every region by name
+        sampling_period (float, optional): Total duration of sampling in minutes, None to sample
+            until stop_sampling is called. Defaults to 5.
+        sampling_rate (float, optional): Number of samples to collect per minute. Defaults to 1.
+        transport (HTTPTransport, optional): Pooled HTTP session to use for API calls.
+        station_cache (StationCache, optional): Cache of discovered stations, one entry per region.
+        aggregator (StreamingAggregator, optional): Receives the values of all the regions.
+        rate_limiter (TokenBucket, optional): Request budget shared by all the regions.
+    """
+
+    def __init__(self, regions: Dict[Hashable, BBox], sampling_period=5, sampling_rate=1, transport=None,
+                 station_cache=None, aggregator=None, rate_limiter=None):
+
+        if not regions:
+            raise ValueError("at least one region is needed")
+
+        self.regions = {}
+
+        lats = [lat for bbox in regions.values() for lat in (bbox[0], bbox[2])]
+        lngs = [lng for bbox in regions.values() for lng in (bbox[1], bbox[3])]
+        super().__init__(min(lats), min(lngs), max(lats), max(lngs), sampling_period, sampling_rate,
+                         transport=transport, station_cache=station_cache, aggregator=aggregator)
+
+        for name, bbox in regions.items():
+            self.add_region(name, bbox)
+        self.set_rate_limiter(rate_limiter)
+
+
+    def add_region(self, name: Hashable, bbox: BBox, aggregator: StreamingAggregator = None) -> None:
+        '''
+        Add or replace a region. Stations are discovered again on the next start_sampling.
+
+        Args:
+            name (Hashable): Name of the region
+            bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2 of the region
+            aggregator (StreamingAggregator, optional): Receives the values of the region's stations.
+                Defaults to a StreamingAggregator without quantiles.
+        '''
+        if self._sampling_alive():
+            raise RuntimeError("regions can not be changed while sampling")
+
+        self.regions[name] = _Region(tuple(bbox), aggregator if aggregator is not None else StreamingAggregator())
+        self._stations = []
+
+
+    def remove_region(self, name: Hashable) -> None:
+        if self._sampling_alive():
+            raise RuntimeError("regions can not be changed while sampling")
+
+        del self.regions[name]
+        self._stations = []
+
+
+    def region_aggregator(self, name: Hashable) -> StreamingAggregator:
+        return self.regions[name].aggregator
+
+
+    def avg_pm25(self, name: Hashable, partial: bool = False) -> float | None:
+        '''
+        Get the average PM2.5 value of a region if the sampling is done.
+
+        Args:
+            name (Hashable): Name of the region
+            partial (bool, optional): If True, return the average of the ticks done so far.
+                Defaults to False.
+
+        Returns:
+            float: Average PM2.5 value of the region's stations
+        '''
+        if partial or self.state == self.DONE or not self._sampling_alive():
+            return self.regions[name].aggregator.mean()
+        return None
+
+
+    def _load_stations(self, refresh: bool = False, bbox: BBox = None) -> List[Station] | None:
+        """
+        Get the stations of every region and merge them, see CalculateAveragePM25._load_stations.
+
+        Returns:
+            List[Station]: Distinct stations of all the regions or None if any discovery failed
+        """
+        if bbox is not None:
+            return super()._load_stations(refresh, bbox)
+
+        station_lists = []
+        for name, region in self.regions.items():
+            stations = super()._load_stations(refresh, region.bbox)
+            if stations is None:
+                self.logger.error(f"Request to get the stations of region {name!r} failed.")
+                return None
+
+            region.keys = {station_key(st) for st in stations}
+            station_lists.append(stations)
+
+        return merge_stations(station_lists)
+
+
+    def _collect_tick(self, tick: Tick) -> Tuple[Dict[object, float], Set[object]]:
+        '''
+        Fetch every distinct station once and add its value to the aggregator of each region
+        it belongs to.
+        '''
+        fetched, reused = self._fetch_values(self._stations, tick)
+
+        for region in self.regions.values():
+            values, region_reused = self._station_values(fetched, reused, region.keys)
+            if values:
+                with self._lock:
+                    region.aggregator.add_tick(tick.name, values, region_reused)
+
+        return self._station_values(fetched, reused)
+
+
+    def set_sampling_mode(self, mode: str) -> None:
+        if mode != STATION_MODE:
+            raise ValueError(f"{self.__class__.__name__} only supports the '{STATION_MODE}' sampling mode")
+        super().set_sampling_mode(mode)
+
+
+    def clean_up(self):
+        '''
+        Clean up the object and the aggregators of the regions.
+        '''
+        super().clean_up()
+        for region in self.regions.values():
+            region.aggregator.reset()
@@ -0,0 +1,133 @@
+import time
+from threading import Condition, Lock
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket limiting the request rate to the API.
+
+    Tokens are added at a constant rate up to the burst size and every request takes one.
+    Requests are served in arrival order: when the bucket is empty a request reserves the
+    next token and waits for it. Share one instance between analyzers to put all of them
+    under the same budget.
+
+    Attributes:
+        rate (float): Tokens added per second
+        burst (float): Maximum number of tokens kept
+
+    Args:
+        rate (float): Requests per second
+        burst (float, optional): Requests allowed at once after an idle period. Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+
+        if rate <= 0:
+            raise ValueError("rate can not be zero or negative")
+        if burst is not None and burst < 1:
+            raise ValueError("burst can not be less than one")
+
+        self.rate  = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+
+        self.__tokens  = self.burst
+        self.__updated = time.monotonic()
+        self.__lock    = Lock()
+
+
+    def reserve(self) -> float:
+        """
+        Take a token, reserving a future one if the bucket is empty.
+
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= 1
+            return max(0.0, -self.__tokens / self.rate)
+
+
+    def acquire(self) -> None:
+        '''
+        Block until a token is available.
+        '''
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """
+    An AIMD limit on the number of requests in flight.
+
+    Works like a semaphore whose size follows the health of the API: each healthy response
+    (fast and not throttled) grows the limit by 1/limit, about one extra slot per round of
+    requests, and a 429, a 5xx, a timeout or a slow response halves it. Decreases are at
+    most one per cooldown so a burst of failures from the same round counts once.
+
+    Attributes:
+        limit (float): Current limit, between minimum and maximum
+        in_flight (int): Requests currently holding a slot
+
+    Args:
+        initial (int, optional): Starting limit. Defaults to 8.
+        minimum (int, optional): Lowest limit. Defaults to 1.
+        maximum (int, optional): Highest limit, the thread pool is sized to it. Defaults to 64.
+        latency_target (float, optional): Responses slower than this many seconds count as unhealthy. Defaults to 2.
+        backoff (float, optional): Factor applied to the limit on an unhealthy response. Defaults to 0.5.
+        cooldown (float, optional): Minimum seconds between two decreases. Defaults to latency_target.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=64, latency_target=2.0, backoff=0.5, cooldown=None):
+
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("limits must satisfy 1 <= minimum <= initial <= maximum")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff must be between 0 and 1")
+
+        self.minimum        = minimum
+        self.maximum        = maximum
+        self.latency_target = latency_target
+        self.backoff        = backoff
+        self.cooldown       = cooldown if cooldown is not None else latency_target
+
+        self.limit     = float(initial)
+        self.in_flight = 0
+
+        self.__last_decrease = float('-inf')
+        self.__condition     = Condition()
+
+
+    def acquire(self) -> None:
+        '''
+        Block until the number of requests in flight is below the limit.
+        '''
+        with self.__condition:
+            while self.in_flight >= int(self.limit):
+                self.__condition.wait()
+            self.in_flight += 1
+
+
+    def release(self, healthy: bool, latency: float) -> None:
+        '''
+        Free a slot and adapt the limit to the outcome of the request.
+
+        Args:
+            healthy (bool): False if the request was throttled, failed upstream or timed out
+            latency (float): Seconds the request took
+        '''
+        with self.__condition:
+            self.in_flight -= 1
+
+            if healthy and latency <= self.latency_target:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self.__last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.__last_decrease = now
+
+            self.__condition.notify_all()
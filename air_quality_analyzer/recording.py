@@ -0,0 +1,332 @@
+import gzip
+import json
+import sys
+import time
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from .analyzer import CalculateAveragePM25
+from .scheduler import QUEUE, Tick
+from .transport import HTTPTransport
+
+
+FAST_INTERVAL = 1e-6 # seconds between ticks when replaying as fast as possible
+
+def request_key(url: str) -> str:
+    """
+    The part of an API URL a recording is keyed on: path and query without the host and
+    the token, so a run recorded against api.waqi.info replays against any API base.
+
+    Returns:
+        str: e.g. "/feed/geo:48.1;-123.2/"
+    """
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name != 'token']
+    return parts.path + ('?' + urlencode(query, safe=',;:@') if query else '')
+
+
+def read_recording(path: str) -> Iterator[Dict]:
+    """
+    The records of a recording file in the order they were written. A record cut short at
+    the end of the file (the recording process was killed) is skipped.
+
+    Args:
+        path (str): Recording file written by ResponseRecorder
+
+    Returns:
+        Iterator[Dict]: "run", "response" and "tick" records, see ResponseRecorder
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                yield json.loads(line)
+        except EOFError: # last gzip member not closed
+            pass
+
+
+class ResponseRecorder:
+    """
+    A transport that records every API response it passes on into a compressed,
+    append-only file, to replay a run later with ReplayTransport.
+
+    The file is a gzip stream of JSON lines, one record per line:
+
+        {"kind": "run", "t": ..., "settings": {...}}                  record_run, once per run
+        {"kind": "response", "t": ..., "url": ..., "status": ..., "retry_after": ..., "body": ...}
+        {"kind": "tick", "t": ..., "index": ...}                      after every tick of a recorded run
+
+    t is the Unix time of the record, url is the request_key of the request. Every open
+    appends a new gzip member, so one file can hold many runs and sessions. Records are
+    flushed after every tick and on close; a killed process loses at most the records of
+    its last tick. Requests failing without a response (timeouts, connection errors) are
+    not recorded. Stations found in a station cache are not requested, so not recorded:
+    record with refresh_stations=True for a run that replays on its own.
+
+        recorder = ResponseRecorder("run.jsonl.gz")
+        analyzer.set_transport(recorder)
+        recorder.record_run(analyzer)
+        analyzer.start_sampling(blocking=True)
+        recorder.close()
+
+    Attributes:
+        path (str): The recording file
+        responses (int): Responses recorded by this instance
+
+    Args:
+        path (str): File to append to, created if missing
+        transport (HTTPTransport, optional): Transport sending the requests. Defaults to a new HTTPTransport.
+    """
+
+    def __init__(self, path: str, transport: HTTPTransport = None):
+
+        self.path      = path
+        self.responses = 0
+
+        self.__transport = transport if transport is not None else HTTPTransport()
+        self.__owns_transport = transport is None
+        self.__file     = gzip.open(path, 'at', encoding='utf-8')
+        self.__lock     = Lock()
+        self.__recorded = set() # ids of the analyzers whose ticks are recorded
+
+
+    def __write(self, record: Dict, flush: bool = False) -> None:
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__file.write(line)
+            if record['kind'] == 'response':
+                self.responses += 1
+            if flush:
+                self.__file.flush()
+
+
+    def get(self, url: str):
+        """
+        Send a GET request through the wrapped transport and record its response.
+
+        Returns:
+            requests.Response: The response object
+        """
+        response = self.__transport.get(url)
+        self.__write({'kind': 'response', 't': time.time(), 'url': request_key(url),
+                      'status': response.status_code, 'retry_after': response.headers.get('Retry-After'),
+                      'body': response.text})
+        return response
+
+
+    def record_run(self, analyzer: CalculateAveragePM25) -> None:
+        """
+        Record the settings of an analyzer's next run and mark its ticks, so replay_analyzer
+        can run it again. Call before start_sampling, once per run.
+
+        Args:
+            analyzer (CalculateAveragePM25): The analyzer using this recorder as its transport
+        """
+        self.__write({'kind': 'run', 't': time.time(), 'settings': {
+            'bbox': [analyzer.latitude_1, analyzer.longitude_1, analyzer.latitude_2, analyzer.longitude_2],
+            'sampling_period': analyzer._sampling_period,
+            'sampling_rate': analyzer._sampling_rate,
+            'sampling_mode': analyzer.sampling_mode,
+            'thread_cnt': analyzer.thread_cnt,
+            'tiling': None if analyzer.tiling is None else list(analyzer.tiling),
+        }}, flush=True)
+
+        if id(analyzer) not in self.__recorded:
+            self.__recorded.add(id(analyzer))
+            analyzer.add_tick_callback(self.__tick)
+
+
+    def __tick(self, tick: Tick, values) -> None:
+        self.__write({'kind': 'tick', 't': time.time(), 'index': tick.index}, flush=True)
+
+
+    def resize(self, pool_size: int) -> None:
+        self.__transport.resize(pool_size)
+
+
+    def close(self) -> None:
+        '''
+        Finish the file and close the transport if the recorder created it.
+        '''
+        with self.__lock:
+            if not self.__file.closed:
+                self.__file.close()
+        if self.__owns_transport:
+            self.__transport.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayResponse:
+    """
+    A recorded response, with the parts of requests.Response the analyzer reads.
+    """
+
+    def __init__(self, status_code: int, text: str, retry_after: str = None):
+        self.status_code = status_code
+        self.text        = text
+        self.headers     = {'Retry-After': retry_after} if retry_after is not None else {}
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ReplayTransport:
+    """
+    A transport answering requests with the responses of a recording instead of the API.
+
+    Responses are replayed per URL (host and token ignored) in the order they were
+    recorded. Once the recorded responses of a URL are used up, the last one is repeated,
+    so extra requests (retries, hedges, a longer run) still get an answer. URLs absent
+    from the recording get a 404. No network is used, give it to any analyzer with
+    set_transport, e.g. to benchmark the aggregation path deterministically.
+
+    Attributes:
+        path (str): The recording file
+        run (int): Index of the replayed run, None for every response of the file
+        settings (Dict): Settings of the replayed run, see ResponseRecorder.record_run; None
+            for a whole file or a file without run records
+        ticks (int): Number of ticks recorded in the replayed run
+        requests (int): Requests answered
+        misses (int): Requests for URLs absent from the recording
+
+    Args:
+        path (str): Recording file written by ResponseRecorder
+        run (int, optional): Index of the run to replay, negative from the end (-1 is the
+            last run). Defaults to None (all the responses of the file).
+    """
+
+    def __init__(self, path: str, run: int = None):
+
+        self.path     = path
+        self.run      = run
+        self.settings = None
+        self.ticks    = 0
+        self.requests = 0
+        self.misses   = 0
+
+        self.__responses = defaultdict(deque) # request key -> recorded responses, oldest first
+        self.__lock      = Lock()
+
+        loose, runs = self.__runs(read_recording(path))
+        if run is None:
+            records = loose + [record for _, run_records in runs for record in run_records]
+        elif -len(runs) <= run < len(runs):
+            self.settings, records = runs[run][0]['settings'], runs[run][1]
+        else:
+            raise ValueError(f"{path} has no run {run}")
+
+        for record in records:
+            if record['kind'] == 'response':
+                self.__responses[record['url']].append(record)
+            elif record['kind'] == 'tick':
+                self.ticks += 1
+
+
+    @staticmethod
+    def __runs(records: Iterator[Dict]) -> Tuple[List[Dict], List[Tuple[Dict, List[Dict]]]]:
+        '''
+        The records written before any run record, and the runs as (run record, records).
+        '''
+        loose, runs = [], []
+        for record in records:
+            if record['kind'] == 'run':
+                runs.append((record, []))
+            else:
+                (runs[-1][1] if runs else loose).append(record)
+        return loose, runs
+
+
+    def get(self, url: str) -> ReplayResponse:
+        """
+        The next recorded response of a URL.
+
+        Returns:
+            ReplayResponse: The response, a 404 if the URL was not recorded
+        """
+        with self.__lock:
+            self.requests += 1
+            responses = self.__responses.get(request_key(url))
+            if not responses:
+                self.misses += 1
+                return ReplayResponse(404, '{"status": "error", "data": "Not recorded"}')
+            record = responses.popleft() if len(responses) > 1 else responses[0]
+        return ReplayResponse(record['status'], record['body'], record.get('retry_after'))
+
+
+    def resize(self, pool_size: int) -> None:
+        pass
+
+
+    def close(self) -> None:
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def replay_analyzer(path: str, speed: float = 1.0, run: int = -1) -> CalculateAveragePM25:
+    """
+    An analyzer set up like a recorded run and answered by a ReplayTransport, to sample the
+    run again offline. It runs the recorded number of ticks at the recorded sampling rate
+    times speed; with speed None the ticks run back to back, as fast as possible.
+
+        analyzer = replay_analyzer("run.jsonl.gz", speed=None)
+        analyzer.start_sampling(blocking=True)
+
+    Args:
+        path (str): Recording file written by ResponseRecorder
+        speed (float, optional): Playback speed, 1 for real time. Defaults to 1.
+        run (int, optional): Index of the run to replay, negative from the end. Defaults to -1 (the last one).
+
+    Returns:
+        CalculateAveragePM25: The analyzer, not started
+
+    Raises:
+        ValueError: If the recording has no such run, e.g. it was written without record_run
+    """
+    if speed is not None and speed <= 0:
+        raise ValueError("speed can not be zero or negative")
+
+    transport = ReplayTransport(path, run)
+    settings = transport.settings
+    if settings is None: # run=None, or no run record to take the settings from
+        raise ValueError(f"{path} has no run settings to replay, give a ReplayTransport to an analyzer instead")
+    rate = 60 / FAST_INTERVAL if speed is None else settings['sampling_rate'] * speed
+    if transport.ticks:
+        period = transport.ticks / rate
+    elif settings['sampling_period'] is not None:
+        period = settings['sampling_period'] * settings['sampling_rate'] / rate
+    else:
+        raise ValueError(f"run {run} of {path} has no ticks to replay")
+
+    analyzer = CalculateAveragePM25(*settings['bbox'], sampling_period=period, sampling_rate=rate,
+                                    transport=transport)
+    analyzer.set_token("replay")
+    analyzer.set_sampling_mode(settings['sampling_mode'])
+    analyzer.thread_cnt = settings['thread_cnt']
+    if settings.get('tiling') is not None: # recorded tile queries are only answered for the same tiles
+        analyzer.set_tiling(*settings['tiling'])
+    if speed is None: # every tick is overdue, queue them all instead of skipping them
+        analyzer.set_overrun_policy(QUEUE, max_backlog=sys.maxsize)
+    return analyzer
@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+
+class ResponseCache:
+    """
+    Single-flight request coalescing with a short-lived LRU cache of decoded API responses.
+
+    Concurrent fetches of the same URL share one in-flight call: the first caller sends the
+    request, the others wait for its result. Successful responses are then kept for ttl
+    seconds, so ticks of overlapping analyzers or regions that ask for the same station at
+    nearly the same time get one request between them. Failed fetches (None) are not
+    cached, the next caller tries again. Share one instance between analyzers to coalesce
+    their requests.
+
+    Attributes:
+        hits (int): Fetches answered from the cache
+        misses (int): Fetches that sent a request
+        coalesced (int): Fetches that waited for a request already in flight
+
+    Args:
+        ttl (float, optional): Seconds a response is reused, 0 to only coalesce. Defaults to 30.
+        max_entries (int, optional): Responses kept, least recently used first out. Defaults to 1024.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 1024):
+
+        if ttl < 0:
+            raise ValueError("ttl can not be negative")
+        if max_entries <= 0:
+            raise ValueError("max_entries can not be zero or negative")
+
+        self.ttl         = ttl
+        self.max_entries = max_entries
+
+        self.hits      = 0
+        self.misses    = 0
+        self.coalesced = 0
+
+        self.__entries   = OrderedDict() # url -> (expiry, data), least recently used first
+        self.__in_flight = {}            # url -> Future
+        self.__lock      = Lock()
+
+
+    def fetch(self, url: str, loader: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Get the response of a URL from the cache, from a request already in flight, or by
+        calling loader.
+
+        Args:
+            url (str): Full URL including the query string, the cache key
+            loader (Callable[[], Optional[Dict]]): Sends the request, returns the decoded JSON or None
+
+        Returns:
+            Dict: The response or None if the request failed
+        """
+        with self.__lock:
+            entry = self.__entries.get(url)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.__entries.move_to_end(url)
+                    self.hits += 1
+                    return entry[1]
+                del self.__entries[url]
+
+            future = self.__in_flight.get(url)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                future = self.__in_flight[url] = Future()
+                self.misses += 1
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            data = loader()
+        except BaseException as exc:
+            with self.__lock:
+                del self.__in_flight[url]
+            future.set_exception(exc)
+            raise
+
+        with self.__lock:
+            del self.__in_flight[url]
+            if data is not None and self.ttl > 0:
+                self.__entries[url] = (time.monotonic() + self.ttl, data)
+                self.__entries.move_to_end(url)
+                while len(self.__entries) > self.max_entries:
+                    self.__entries.popitem(last=False)
+        future.set_result(data)
+        return data
+
+
+    def clear(self) -> None:
+        '''
+        Drop all the cached responses. Requests in flight are not affected.
+        '''
+        with self.__lock:
+            self.__entries.clear()
+
+
+    def stats(self) -> Dict:
+        """
+        Cache statistics.
+
+        Returns:
+            Dict: hits, misses, coalesced, entries and hit_ratio (hits and coalesced over all fetches)
+        """
+        with self.__lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'entries': len(self.__entries),
+                'hit_ratio': (self.hits + self.coalesced) / total if total else None,
+            }
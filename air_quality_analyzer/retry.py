@@ -0,0 +1,133 @@
+import random
+from threading import Lock
+
+from .aggregator import P2Quantile
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class RetryPolicy:
+    """
+    When and how long to wait before sending a failed API request again.
+
+    Only transient failures are retried: connection errors, timeouts and the retry_statuses
+    responses. All WAQI calls are GETs, so sending them twice is safe. Waits grow
+    exponentially and are fully jittered (a random time between 0 and the backoff) so
+    workers that failed together do not retry together. A Retry-After header of a
+    throttled response is used as the minimum wait.
+
+    Args:
+        max_attempts (int, optional): Attempts including the first one. Defaults to 3.
+        base_delay (float, optional): Backoff of the first retry in seconds. Defaults to 0.2.
+        max_delay (float, optional): Maximum backoff in seconds. Defaults to 5.
+        retry_statuses (Tuple[int], optional): Status codes to retry. Defaults to 429 and 5xx gateway errors.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.2, max_delay=5.0, retry_statuses=RETRY_STATUSES):
+
+        if max_attempts < 1:
+            raise ValueError("max_attempts can not be less than one")
+        if base_delay < 0 or max_delay < base_delay:
+            raise ValueError("delays must satisfy 0 <= base_delay <= max_delay")
+
+        self.max_attempts   = max_attempts
+        self.base_delay     = base_delay
+        self.max_delay      = max_delay
+        self.retry_statuses = tuple(retry_statuses)
+
+
+    def retry_status(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+
+    def retry_exception(self, exc: Exception) -> bool:
+        from requests.exceptions import ConnectionError, Timeout # only called once a request failed
+        return isinstance(exc, (ConnectionError, Timeout))
+
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        Seconds to wait before the next attempt.
+
+        Args:
+            attempt (int): Number of attempts already made, starting at 1
+            retry_after (float, optional): Wait asked for by the API
+
+        Returns:
+            float: The jittered backoff, at least retry_after
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+
+class HedgePolicy:
+    """
+    When to send a duplicate of a slow API request.
+
+    Tracks the latency of successful requests and, once min_samples are known, allows a
+    hedge for a request still running after the current latency quantile. Whichever of the
+    two responses arrives first is used. Hedges are limited to max_ratio of all requests so
+    a slow API does not get twice the load.
+
+    Args:
+        quantile (float, optional): Latency quantile after which a request is hedged. Defaults to 0.95.
+        min_samples (int, optional): Requests to observe before hedging. Defaults to 20.
+        min_delay (float, optional): Never hedge before this many seconds. Defaults to 0.05.
+        max_ratio (float, optional): Maximum hedges per request sent. Defaults to 0.1.
+    """
+
+    def __init__(self, quantile=0.95, min_samples=20, min_delay=0.05, max_ratio=0.1):
+
+        if not 0 <= max_ratio <= 1:
+            raise ValueError("max_ratio must be between 0 and 1")
+
+        self.quantile    = quantile
+        self.min_samples = min_samples
+        self.min_delay   = min_delay
+        self.max_ratio   = max_ratio
+
+        self.requests = 0
+        self.hedges   = 0
+
+        self.__latency = P2Quantile(quantile)
+        self.__samples = 0
+        self.__lock    = Lock()
+
+
+    def observe(self, latency: float) -> None:
+        '''
+        Record the latency of a successful request.
+        '''
+        with self.__lock:
+            self.__latency.add(latency)
+            self.__samples += 1
+
+
+    def hedge_delay(self) -> float | None:
+        """
+        Count a new request and get how long to wait for it before hedging.
+
+        Returns:
+            float: Seconds, or None if the request should not be hedged
+        """
+        with self.__lock:
+            self.requests += 1
+            if self.__samples < max(1, self.min_samples):
+                return None
+            return max(self.min_delay, self.__latency.value)
+
+
+    def try_hedge(self) -> bool:
+        """
+        Take a hedge from the budget.
+
+        Returns:
+            bool: False if hedging now would exceed max_ratio
+        """
+        with self.__lock:
+            if self.hedges + 1 > self.max_ratio * self.requests:
+                return False
+            self.hedges += 1
+            return True
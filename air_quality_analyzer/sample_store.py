@@ -0,0 +1,292 @@
+import json
+import math
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import compress, islice
+from threading import Lock
+from typing import Dict, Hashable, Iterable, Iterator, NamedTuple, Tuple
+
+from .aggregator import RunningStats
+from .stations import BBox
+
+
+# Column names and array typecodes, in row order
+COLUMNS = (
+    ('timestamp', 'd'), # float64, Unix seconds
+    ('station',   'q'), # int64, station id
+    ('lat',       'f'), # float32
+    ('lon',       'f'), # float32
+    ('pm25',      'f'), # float32
+)
+NO_STATION = -1 # stations without a numeric id
+META_FILE  = "store.json"
+
+class Sample(NamedTuple):
+    timestamp: float
+    station: int
+    lat: float
+    lon: float
+    pm25: float
+
+
+class SampleStore:
+    """
+    An append-only on-disk history of raw samples in a columnar layout.
+
+    Every column is a file of packed machine values in one directory: timestamp, station
+    id, lat, lon and pm25, see COLUMNS. Appends go to the end of each file. Reads map the
+    files into memory and go through typed memory views, so aggregates over millions of
+    rows do not build a Python object per row. A row counts once all its columns are
+    written, a partly written row (e.g. after a crash) is dropped when the writer opens the
+    store.
+
+    Time-range lookups are binary searches as long as rows were appended in time order,
+    which is the case for rows written tick after tick. Appending older rows (a backfill)
+    is allowed and switches lookups to scans. One process writes, any number can read:
+    readers open the store with readonly=True and see the complete rows written when they
+    opened it, without touching the files.
+
+    Args:
+        path (str): Directory of the store, created if missing unless readonly
+        readonly (bool, optional): Open an existing store for reading only. Defaults to False.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+
+        self.path     = path
+        self.readonly = readonly
+        if readonly and not os.path.exists(os.path.join(path, META_FILE)):
+            raise FileNotFoundError(f"{path} is not a sample store")
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+
+        self.__lock   = Lock()
+        self.__sorted = True # rows are in time order
+        self.__last   = -math.inf
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('columns') != dict(COLUMNS) or meta.get('byteorder') != sys.byteorder:
+                raise ValueError(f"{path} has an incompatible column layout")
+            self.__sorted = meta.get('sorted', True)
+        else:
+            self.__write_meta()
+
+        if not readonly:
+            for name, _ in COLUMNS:
+                open(self.__file(name), 'ab').close()
+
+        # the complete rows, the writer may be in the middle of an append
+        self.__rows = min(self.__size(name) // array(code).itemsize for name, code in COLUMNS)
+        if not readonly: # drop the columns of a partly written last row
+            for name, code in COLUMNS:
+                with open(self.__file(name), 'r+b') as f:
+                    f.truncate(self.__rows * array(code).itemsize)
+
+        if self.__rows:
+            with self.columns() as columns:
+                self.__last = max(columns['timestamp']) if not self.__sorted else columns['timestamp'][-1]
+
+
+    def __file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+    def __size(self, name: str) -> int:
+        try:
+            return os.path.getsize(self.__file(name))
+        except FileNotFoundError: # a reader of a store whose writer has not created it yet
+            return 0
+
+
+    def __write_meta(self) -> None:
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump({'columns': dict(COLUMNS), 'byteorder': sys.byteorder, 'sorted': self.__sorted}, f)
+
+
+    def __len__(self) -> int:
+        return self.__rows
+
+
+    @property
+    def time_ordered(self) -> bool:
+        '''
+        True while the rows were appended in time order.
+        '''
+        return self.__sorted
+
+
+    def append(self, timestamp: float, values: Dict[Hashable, float],
+               coords: Dict[Hashable, Tuple[float, float]]) -> int:
+        """
+        Append the values of one tick.
+
+        Args:
+            timestamp (float): Unix time of the tick
+            values (Dict[Hashable, float]): PM2.5 value by station id
+            coords (Dict[Hashable, Tuple[float, float]]): (lat, lon) by station id. Stations
+                missing from it get NaN coordinates, unless their id is a (lat, lon) pair.
+
+        Returns:
+            int: Number of rows written
+        """
+        rows = []
+        for station, value in values.items():
+            lat, lon = coords.get(station) or (station if isinstance(station, tuple) else (math.nan, math.nan))
+            rows.append((timestamp, station if isinstance(station, int) else NO_STATION, lat, lon, value))
+        return self.append_rows(rows)
+
+
+    def append_rows(self, rows: Iterable[Tuple[float, int, float, float, float]]) -> int:
+        """
+        Append rows of (timestamp, station, lat, lon, pm25), e.g. to backfill history.
+
+        Returns:
+            int: Number of rows written
+
+        Raises:
+            ValueError: If the store is opened read-only
+        """
+        if self.readonly:
+            raise ValueError(f"{self.path} is opened read-only")
+        columns = [array(code) for _, code in COLUMNS]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+        timestamps = columns[0]
+        if not timestamps:
+            return 0
+
+        with self.__lock:
+            for (name, _), column in zip(COLUMNS, columns):
+                with open(self.__file(name), 'ab') as f:
+                    column.tofile(f)
+            self.__rows += len(timestamps)
+
+            ordered = timestamps[0] >= self.__last and all(a <= b for a, b in zip(timestamps, timestamps[1:]))
+            self.__last = max(self.__last, max(timestamps))
+            if self.__sorted and not ordered:
+                self.__sorted = False
+                self.__write_meta()
+
+        return len(timestamps)
+
+
+    @contextmanager
+    def columns(self) -> Iterator[Dict[str, memoryview]]:
+        """
+        Memory-mapped typed views of all the rows by column name, valid inside the with
+        block. Rows appended meanwhile are not included.
+
+            with store.columns() as columns:
+                total = sum(columns['pm25'])
+        """
+        with self.__lock:
+            rows = self.__rows
+
+        maps, views, columns = [], [], {}
+        try:
+            for name, code in COLUMNS:
+                if rows == 0:
+                    columns[name] = memoryview(array(code))
+                    continue
+                with open(self.__file(name), 'rb') as f:
+                    maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                views.append(memoryview(maps[-1]))
+                views.append(views[-1][:rows * array(code).itemsize])
+                columns[name] = views[-1].cast(code)
+            yield columns
+        finally:
+            for view in list(columns.values()) + views[::-1]:
+                view.release()
+            for m in maps:
+                m.close()
+
+
+    def __row_range(self, timestamps: memoryview, start: float | None, end: float | None) -> Tuple[int, int]:
+        if not self.__sorted:
+            return 0, len(timestamps)
+        lo = 0 if start is None else bisect_left(timestamps, start)
+        hi = len(timestamps) if end is None else bisect_left(timestamps, end)
+        return lo, max(lo, hi)
+
+
+    def __selector(self, columns: Dict[str, memoryview], lo: int, hi: int, start: float | None,
+                   end: float | None, bbox: BBox | None) -> Iterator[bool] | None:
+        '''
+        Row filter over lo:hi, None when every row of the range matches.
+        '''
+        time_filter = not self.__sorted and (start is not None or end is not None)
+        if not time_filter and bbox is None:
+            return None
+
+        start = -math.inf if start is None else start
+        end   = math.inf if end is None else end
+        if bbox is None:
+            return (start <= ts < end for ts in islice(columns['timestamp'], lo, hi))
+
+        south, north = sorted((bbox[0], bbox[2]))
+        west, east   = sorted((bbox[1], bbox[3]))
+        return (start <= ts < end and south <= lat <= north and west <= lon <= east
+                for ts, lat, lon in zip(*(islice(columns[name], lo, hi) for name in ('timestamp', 'lat', 'lon'))))
+
+
+    def query(self, start: float = None, end: float = None, bbox: BBox = None) -> Iterator[Sample]:
+        """
+        Rows in a time range and a bounding box, in storage order.
+
+        Args:
+            start (float, optional): First Unix time included. Defaults to the first row.
+            end (float, optional): Unix time excluded. Defaults to after the last row.
+            bbox (Tuple[float, float, float, float], optional): lat1, lng1, lat2, lng2, corners
+                included. Defaults to everywhere.
+
+        Returns:
+            Iterator[Sample]: Matching rows
+        """
+        with self.columns() as columns:
+            lo, hi = self.__row_range(columns['timestamp'], start, end)
+            selector = self.__selector(columns, lo, hi, start, end, bbox)
+            rows = range(lo, hi) if selector is None else compress(range(lo, hi), selector)
+            for i in rows:
+                yield Sample(*(columns[name][i] for name, _ in COLUMNS))
+
+
+    def stats(self, start: float = None, end: float = None, bbox: BBox = None) -> Dict:
+        """
+        Count, mean, variance, min and max of the PM2.5 values in a time range and a bounding
+        box, see query for the arguments. Values are summed from the mapped column without
+        a Python object per row when no row filter is needed.
+
+        Returns:
+            Dict: count, mean, variance, min and max, like RunningStats.as_dict
+        """
+        with self.columns() as columns:
+            lo, hi = self.__row_range(columns['timestamp'], start, end)
+            selector = self.__selector(columns, lo, hi, start, end, bbox)
+            if selector is not None:
+                return _summarize(array('f', compress(islice(columns['pm25'], lo, hi), selector))).as_dict()
+            with columns['pm25'][lo:hi] as values:
+                return _summarize(values).as_dict()
+
+
+def _summarize(values) -> RunningStats:
+    '''
+    RunningStats of a buffer of values, with the two-pass variance.
+    '''
+    stats = RunningStats()
+    if not len(values):
+        return stats
+    stats.count = len(values)
+    stats.mean  = math.fsum(values) / stats.count
+    stats._m2   = math.fsum((value - stats.mean) ** 2 for value in values)
+    stats.min   = min(values)
+    stats.max   = max(values)
+    return stats
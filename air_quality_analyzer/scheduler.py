@@ -0,0 +1,189 @@
+import logging
+import math
+import time
+from threading import Thread, Event
+from typing import Callable, Optional, Tuple
+
+
+IDLE = 'IDLE'
+
+# Overrun policies, what to do with the ticks whose deadline passed while a tick was running
+SKIP     = 'skip'     # drop them, continue with the next tick on schedule
+COALESCE = 'coalesce' # fire one tick for all of them right away
+QUEUE    = 'queue'    # fire them back to back, at most max_backlog of them
+OVERRUN_POLICIES = (SKIP, COALESCE, QUEUE)
+
+class Tick:
+    """
+    One firing of the scheduler.
+
+    Attributes:
+        index (int): Position in the schedule, 0 for the first tick
+        name (str): Tick name with its offset from the start of the run, e.g. "Tick-12s"
+        deadline (float): time.monotonic() value the tick was due at
+        state (str): Sampling state of the tick, set by the analyzer
+        late (int): Station fetches dropped because they missed the tick's time limit
+    """
+
+    __slots__ = ('index', 'name', 'deadline', 'state', 'late')
+
+    def __init__(self, index: int, interval: float, deadline: float):
+        self.index    = index
+        self.name     = f"Tick-{index * interval:g}s"
+        self.deadline = deadline
+        self.state    = IDLE
+        self.late     = 0
+
+
+def sampling_interval(sampling_rate: float) -> float:
+    """
+    Seconds between two ticks for a rate given in samples per minute.
+    """
+    return 60 / sampling_rate
+
+
+def tick_count(sampling_period: Optional[float], sampling_rate: float) -> Optional[int]:
+    """
+    Number of ticks of a run, None for an open-ended run.
+
+    Args:
+        sampling_period (float): Run duration in minutes, None to run until stopped
+        sampling_rate (float): Samples per minute
+    """
+    if sampling_period is None:
+        return None
+    # the epsilon keeps float noise (e.g. 0.1 * 30 = 3.0000000000000004) from adding a tick
+    return max(0, math.ceil(sampling_period * sampling_rate - 1e-9))
+
+
+def next_index(start: float, interval: float, index: int, now: float) -> int:
+    """
+    Index of the next tick whose deadline is not in the past. Deadlines are absolute
+    (start + index * interval), so a late tick never shifts the ones after it, and ticks
+    whose deadline passed while the previous one was running are skipped.
+    """
+    return max(index + 1, math.ceil((now - start) / interval))
+
+
+def after_tick(start: float, interval: float, index: int, now: float, overrun: str = SKIP,
+               max_backlog: int = 1) -> Tuple[int, int]:
+    """
+    Index of the tick to fire after tick index finished at now, following an overrun policy.
+
+    Args:
+        start (float): Time of the first deadline
+        interval (float): Seconds between two ticks
+        index (int): Index of the tick that just finished
+        now (float): Current time, on the same clock as start
+        overrun (str, optional): SKIP, COALESCE or QUEUE. Defaults to SKIP.
+        max_backlog (int, optional): Most overdue ticks kept by QUEUE. Defaults to 1.
+
+    Returns:
+        Tuple[int, int]: Index of the next tick and the number of ticks dropped
+    """
+    following = next_index(start, interval, index, now)
+    missed = following - index - 1
+    if missed <= 0:
+        return index + 1, 0
+    if overrun == COALESCE: # the latest overdue tick stands for all of them
+        return following - 1, missed - 1
+    if overrun == QUEUE:
+        if missed > max_backlog: # keep the most recent ones
+            return following - max_backlog, missed - max_backlog
+        return index + 1, 0
+    return following, missed
+
+
+class TickScheduler(Thread):
+    """
+    A single thread firing a callback at fixed intervals, with monotonic deadlines.
+
+    Ticks run on the scheduler thread one after the other, so the number of threads and
+    the memory used do not depend on the length of the run. Intervals can be any positive
+    number of seconds, including fractions of a second. Ticks never overlap: when one runs
+    past the deadline of the next ones, the overrun policy decides which of those still fire.
+
+    Attributes:
+        interval (float): Seconds between two ticks
+        count (int): Number of ticks to fire, None to fire until cancelled
+        lag (float): Seconds the last tick fired after its deadline
+        skipped (int): Number of ticks dropped because the previous tick overran
+
+    Args:
+        interval (float): Seconds between two ticks
+        callback (Callable[[Tick], None]): Called on the scheduler thread for every tick
+        count (int, optional): Number of ticks to fire. Defaults to None (until cancelled).
+        name (str, optional): Thread name. Defaults to "Scheduler".
+        on_finish (Callable[[TickScheduler], None], optional): Called on the scheduler thread
+            once the last tick ran or the scheduler was cancelled. Defaults to None.
+        overrun (str, optional): Overrun policy, SKIP, COALESCE or QUEUE. Defaults to SKIP.
+        max_backlog (int, optional): Most overdue ticks fired back to back by QUEUE. Defaults to 1.
+        logger (logging.Logger, optional): Logger of the overrun warnings. Defaults to the
+            "TickScheduler" logger.
+    """
+
+    def __init__(self, interval: float, callback: Callable[[Tick], None], count: Optional[int] = None,
+                 name: str = "Scheduler", on_finish: Optional[Callable[['TickScheduler'], None]] = None,
+                 overrun: str = SKIP, max_backlog: int = 1, logger: Optional[logging.Logger] = None):
+
+        super().__init__(name=name)
+
+        if interval <= 0:
+            raise ValueError("interval can not be zero or negative")
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError(f"overrun must be one of {OVERRUN_POLICIES}")
+        if max_backlog < 1:
+            raise ValueError("max_backlog can not be less than one")
+
+        self.logger   = logger if logger is not None else logging.getLogger(self.__class__.__name__)
+        self.interval = interval
+        self.count    = count
+        self.lag      = 0.0
+        self.skipped  = 0
+
+        self.overrun     = overrun
+        self.max_backlog = max_backlog
+
+        self.__callback  = callback
+        self.__on_finish = on_finish
+        self.__stopped   = Event()
+
+
+    def run(self):
+        try:
+            self.__fire()
+        finally:
+            if self.__on_finish is not None:
+                self.__on_finish(self)
+
+
+    def __fire(self):
+        start = time.monotonic()
+        index = 0
+
+        while self.count is None or index < self.count:
+            deadline = start + index * self.interval
+            if self.__stopped.wait(max(0.0, deadline - time.monotonic())):
+                return
+
+            self.lag = time.monotonic() - deadline
+            self.__callback(Tick(index, self.interval, deadline))
+
+            following, dropped = after_tick(start, self.interval, index, time.monotonic(),
+                                            self.overrun, self.max_backlog)
+            if dropped:
+                self.skipped += dropped
+                self.logger.warning(f"tick {index} overran, skipping {dropped} tick(s).")
+            index = following
+
+
+    def cancel(self) -> None:
+        '''
+        Stop firing ticks. A tick that is already running is not interrupted.
+        '''
+        self.__stopped.set()
+
+
+    @property
+    def cancelled(self) -> bool:
+        return self.__stopped.is_set()
@@ -0,0 +1,285 @@
+import math
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing.connection import Connection, wait
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from .aggregator import RunningStats, TickResult
+from .analyzer import CalculateAveragePM25, STATION_MODE
+from .freshness import FreshnessTracker
+from .ratelimit import TokenBucket
+from .scheduler import Tick, sampling_interval
+from .stations import Station
+
+
+# Pipe protocol, fixed size little-endian messages. An empty message stops the worker.
+TICK_REQUEST = struct.Struct('<qdd')     # tick index, interval, deadline (time.monotonic(), shared by the processes)
+TICK_REPLY   = struct.Struct('<qddddqq') # count, mean, m2, min, max, reused values, late stations
+
+READY_TIMEOUT = 60 # seconds for the workers to start
+STOP_TIMEOUT  = 1  # seconds for idle workers to exit
+
+def _shard_worker(conn: Connection, stations: List[Station], settings: Dict) -> None:
+    '''
+    Main function of a worker process: fetch the shard on every tick request and reply
+    with the tick's summary.
+    '''
+    analyzer = CalculateAveragePM25(0, 0, 0, 0, sampling_period=None)
+    analyzer.logger.setLevel(settings['log_level'])
+    analyzer.set_token(settings['token'])
+    analyzer.set_api_base(settings['api_base'])
+    analyzer.set_retry_policy(settings['retry_policy'])
+    analyzer.set_tick_timeout(settings['tick_timeout'])
+    analyzer.thread_cnt = settings['thread_cnt']
+    if settings['rate'] is not None:
+        analyzer.set_rate_limiter(TokenBucket(*settings['rate']))
+    if settings['freshness'] is not None:
+        analyzer.set_freshness_tracker(FreshnessTracker(*settings['freshness']))
+
+    try:
+        conn.send_bytes(b'') # ready
+        while message := conn.recv_bytes():
+            tick = Tick(*TICK_REQUEST.unpack(message))
+            values, reused = analyzer._station_values(*analyzer._fetch_values(stations, tick))
+
+            stats = RunningStats()
+            for value in values.values():
+                stats.add(value)
+            low, high = (stats.min, stats.max) if stats.count else (math.nan, math.nan)
+            conn.send_bytes(TICK_REPLY.pack(stats.count, stats.mean, stats._m2, low, high, len(reused), tick.late))
+    except (EOFError, OSError, KeyboardInterrupt): # the parent is gone
+        pass
+    finally:
+        analyzer.clean_up()
+        conn.close()
+
+
+class ShardedAnalyzer(CalculateAveragePM25):
+    """
+    Samples with a pool of worker processes, each fetching a shard of the stations.
+
+    Stations are discovered in this process, then dealt out to the workers round-robin.
+    Every worker runs its own pooled fetch loop (thread_cnt threads, its own HTTP session),
+    so JSON decoding and logging are spread over cores instead of sharing one GIL. On every
+    tick the workers reply with the count, mean, variance, min and max of their shard over
+    a pipe, never the values, and the summaries are merged into the aggregator with
+    StreamingAggregator.add_stats.
+
+    Since no values reach this process: per station statistics, quantiles and the sample
+    store are not available, tick callbacks get the tick's merged RunningStats instead of
+    the values, and request metrics stay in the workers (tick metrics are reported). The
+    token, API base, retry policy, tick timeout, thread count and freshness settings are
+    copied to the workers; a rate limiter is split evenly between them. Only the 'station'
+    sampling mode is supported. A worker that dies leaves its shard out of the following ticks.
+
+    Attributes:
+        processes (int): Number of worker processes
+
+    Args:
+        latitude_1, longitude_1, latitude_2, longitude_2, sampling_period, sampling_rate,
+            transport, station_cache, aggregator: See CalculateAveragePM25
+        processes (int, optional): Number of worker processes. Defaults to the CPU count.
+        start_method (str, optional): multiprocessing start method of the workers. Defaults to "spawn".
+    """
+
+    def __init__(self, latitude_1, longitude_1, latitude_2, longitude_2, sampling_period=5, sampling_rate=1,
+                 transport=None, station_cache=None, aggregator=None, processes=None, start_method="spawn"):
+
+        if processes is not None and processes < 1:
+            raise ValueError("processes can not be less than one")
+
+        super().__init__(latitude_1, longitude_1, latitude_2, longitude_2, sampling_period, sampling_rate,
+                         transport=transport, station_cache=station_cache, aggregator=aggregator)
+
+        self.processes      = processes or os.cpu_count() or 1
+        self.__context      = multiprocessing.get_context(start_method)
+        self.__workers      = [] # (process, connection) of the live workers
+        self.__workers_lock = Lock()
+
+
+    def __settings(self) -> Dict:
+        '''
+        The worker analyzer settings, picklable.
+        '''
+        shards = min(self.processes, len(self._stations))
+        rate = None
+        if self.rate_limiter is not None:
+            rate = (self.rate_limiter.rate / shards, max(1.0, self.rate_limiter.burst / shards))
+        freshness = None
+        if self.freshness is not None:
+            freshness = (self.freshness.update_interval, self.freshness.publish_delay,
+                         self.freshness.recheck, self.freshness.smoothing)
+        return {
+            'token': self.TOKEN,
+            'api_base': self.api_base,
+            'retry_policy': self.retry_policy,
+            'tick_timeout': self.tick_timeout,
+            'thread_cnt': self.thread_cnt,
+            'log_level': self.logger.getEffectiveLevel(),
+            'rate': rate,
+            'freshness': freshness,
+        }
+
+
+    def _prepare_run(self) -> bool:
+        '''
+        Start one worker per shard and wait until all of them are ready.
+        '''
+        shards = min(self.processes, len(self._stations))
+        settings = self.__settings()
+        workers = []
+        for shard in range(shards):
+            parent_conn, child_conn = self.__context.Pipe()
+            process = self.__context.Process(target=_shard_worker, name=f"{self.__class__.__name__}-worker-{shard}",
+                                             args=(child_conn, self._stations[shard::shards], settings), daemon=True)
+            process.start()
+            child_conn.close()
+            workers.append((process, parent_conn))
+
+        with self.__workers_lock:
+            self.__workers = workers
+
+        try:
+            for _, conn in workers:
+                if not conn.poll(READY_TIMEOUT):
+                    raise TimeoutError(f"worker not ready within {READY_TIMEOUT}s")
+                conn.recv_bytes()
+        except (EOFError, OSError) as exc:
+            self.logger.error(f"Worker processes failed to start: {exc}")
+            self.__stop_workers()
+            return False
+
+        self.logger.info(f"{shards} worker processes started.")
+        return True
+
+
+    def _collect_tick(self, tick: Tick) -> Tuple[RunningStats, int]:
+        '''
+        Ask every worker for its shard's summary and merge them.
+
+        Returns:
+            Tuple[RunningStats, int]: Summary of the tick's values and the number of reused values
+        '''
+        with self.__workers_lock:
+            workers = list(self.__workers)
+
+        request = TICK_REQUEST.pack(tick.index, sampling_interval(self._sampling_rate), tick.deadline)
+        pending = {}
+        for process, conn in workers:
+            try:
+                conn.send_bytes(request)
+                pending[conn] = process
+            except OSError:
+                self.__drop_worker(process, conn)
+
+        merged, reused, late = RunningStats(), 0, 0
+        while pending:
+            try:
+                ready = wait(list(pending))
+            except OSError: # the workers were stopped
+                break
+            for conn in ready:
+                process = pending.pop(conn)
+                try:
+                    count, mean, m2, low, high, shard_reused, shard_late = TICK_REPLY.unpack(conn.recv_bytes())
+                except (EOFError, OSError):
+                    self.__drop_worker(process, conn)
+                    continue
+                merged.merge(_running_stats(count, mean, m2, low, high))
+                reused += shard_reused
+                late   += shard_late
+
+        if late:
+            tick.late += late
+            if self.metrics is not None:
+                self.metrics.stations_late(late)
+        return merged, reused
+
+
+    def _record_tick(self, tick: Tick, sampled_at: float, results: RunningStats, reused: int) -> int:
+        if not results.count:
+            return 0
+        with self._lock:
+            self.aggregator.add_stats(tick.name, results, reused)
+        return results.count
+
+
+    def _tick_result(self, tick: Tick, results: RunningStats) -> TickResult:
+        with self._lock:
+            windows = {seconds: self.aggregator.window_stats(seconds)
+                       for seconds in getattr(self.aggregator, 'windows', ())}
+        return TickResult(tick.name, tick.index, tick.state, {}, results.as_dict(), windows, tick.late)
+
+
+    def __drop_worker(self, process, conn: Connection) -> None:
+        self.logger.error(f"{process.name} is gone, its stations are left out.")
+        with self.__workers_lock:
+            if (process, conn) in self.__workers:
+                self.__workers.remove((process, conn))
+        conn.close()
+
+
+    def __stop_workers(self, graceful: bool = False) -> None:
+        '''
+        Stop the worker processes. Graceful: ask them to exit and give them STOP_TIMEOUT
+        seconds together, then terminate the ones still busy with a tick. Otherwise they
+        are terminated right away, their running tick is abandoned anyway.
+        '''
+        with self.__workers_lock:
+            workers, self.__workers = self.__workers, []
+        if not workers:
+            return
+
+        if graceful:
+            for _, conn in workers:
+                try:
+                    conn.send_bytes(b'')
+                except OSError:
+                    pass
+            deadline = time.monotonic() + STOP_TIMEOUT
+            pending = [process.sentinel for process, _ in workers]
+            while pending and (remaining := deadline - time.monotonic()) > 0:
+                for sentinel in wait(pending, remaining):
+                    pending.remove(sentinel)
+
+        for process, _ in workers:
+            if process.is_alive():
+                process.terminate()
+        for process, conn in workers:
+            process.join()
+            conn.close()
+
+
+    def _finish_run(self, future, cancelled: bool = False) -> None:
+        if future is self._future: # a restarted run has its own workers
+            self.__stop_workers(graceful=not cancelled)
+        super()._finish_run(future, cancelled)
+
+
+    def set_sample_store(self, sample_store) -> None:
+        if sample_store is not None:
+            raise ValueError(f"{self.__class__.__name__} does not collect the values a sample store needs")
+
+
+    def set_sampling_mode(self, mode: str) -> None:
+        if mode != STATION_MODE:
+            raise ValueError(f"{self.__class__.__name__} only supports the '{STATION_MODE}' sampling mode")
+        super().set_sampling_mode(mode)
+
+
+    def clean_up(self):
+        '''
+        Clean up the object and stop the worker processes.
+        '''
+        self.__stop_workers()
+        super().clean_up()
+
+
+def _running_stats(count: int, mean: float, m2: float, low: float, high: float) -> RunningStats:
+    stats = RunningStats()
+    if count:
+        stats.count, stats.mean, stats._m2, stats.min, stats.max = count, mean, m2, low, high
+    return stats
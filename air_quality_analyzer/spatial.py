@@ -0,0 +1,258 @@
+import math
+import numpy as np
+from typing import NamedTuple, Tuple
+
+from .sample_store import COLUMNS, SampleStore
+from .stations import BBox
+
+
+class GridStats(NamedTuple):
+    """
+    Per-cell statistics of a regular latitude/longitude grid. Arrays have shape
+    (rows, cols), row 0 is the southern edge and column 0 the western edge. Empty cells
+    hold 0 in count and NaN elsewhere.
+    """
+    bbox: Tuple[float, float, float, float] # south, west, north, east
+    count: np.ndarray
+    mean: np.ndarray
+    variance: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+
+
+class SpatialAggregator:
+    """
+    Vectorized spatial averages of (lat, lon, value) samples with NumPy.
+
+    The plain mean of all the samples leans toward dense station clusters. This engine
+    bins the samples on a regular grid, so each covered cell weighs the same whatever its
+    number of stations (gridded_mean), or spreads the stations over the grid with inverse
+    distance weighting (idw_mean). All the work is done on arrays, without a Python loop
+    over samples. Needs numpy (pip install '.[spatial]').
+
+    Attributes:
+        lat, lon, value (np.ndarray): The samples, float64
+        time (np.ndarray): Unix time of the samples, or None
+
+    Args:
+        lat (array-like): Latitudes of the samples
+        lon (array-like): Longitudes of the samples
+        value (array-like): PM2.5 values of the samples
+        time (array-like, optional): Unix times of the samples. Defaults to None.
+    """
+
+    def __init__(self, lat, lon, value, time=None):
+
+        self.lat   = np.asarray(lat, dtype=np.float64)
+        self.lon   = np.asarray(lon, dtype=np.float64)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.time  = None if time is None else np.asarray(time, dtype=np.float64)
+
+        if not (self.lat.shape == self.lon.shape == self.value.shape) or self.lat.ndim != 1:
+            raise ValueError("lat, lon and value must be one dimensional arrays of the same length")
+        if self.time is not None and self.time.shape != self.lat.shape:
+            raise ValueError("time must have the same length as the samples")
+
+        # samples without coordinates or value can not be placed
+        known = np.isfinite(self.lat) & np.isfinite(self.lon) & np.isfinite(self.value)
+        if not known.all():
+            self.__keep(known)
+
+
+    def __keep(self, mask: np.ndarray) -> None:
+        self.lat, self.lon, self.value = self.lat[mask], self.lon[mask], self.value[mask]
+        if self.time is not None:
+            self.time = self.time[mask]
+
+
+    @classmethod
+    def from_store(cls, store: SampleStore, start: float = None, end: float = None,
+                   bbox: BBox = None) -> 'SpatialAggregator':
+        """
+        Load the samples of a SampleStore in a time range and a bounding box, filtered on
+        the mapped columns so only the matching rows are copied.
+
+        Args:
+            store (SampleStore): The store to read
+            start (float, optional): First Unix time included. Defaults to the first row.
+            end (float, optional): Unix time excluded. Defaults to after the last row.
+            bbox (Tuple[float, float, float, float], optional): lat1, lng1, lat2, lng2, edges
+                included. Defaults to everywhere.
+        """
+        with store.columns() as columns:
+            mapped = {name: np.frombuffer(columns[name], dtype=code) for name, code in COLUMNS}
+            mask = np.ones(len(mapped['pm25']), dtype=bool)
+            if start is not None:
+                mask &= mapped['timestamp'] >= start
+            if end is not None:
+                mask &= mapped['timestamp'] < end
+            if bbox is not None:
+                south, west, north, east = _bounds(bbox)
+                mask &= (mapped['lat'] >= south) & (mapped['lat'] <= north)
+                mask &= (mapped['lon'] >= west) & (mapped['lon'] <= east)
+            samples = cls(mapped['lat'][mask], mapped['lon'][mask], mapped['pm25'][mask], mapped['timestamp'][mask])
+            del mapped, mask # the mapped columns must be released before the with block ends
+        return samples
+
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+
+    def between(self, start: float = None, end: float = None) -> 'SpatialAggregator':
+        '''
+        The samples with start <= time < end.
+        '''
+        if self.time is None:
+            raise ValueError("the samples have no time")
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.time >= start
+        if end is not None:
+            mask &= self.time < end
+        return SpatialAggregator(self.lat[mask], self.lon[mask], self.value[mask], self.time[mask])
+
+
+    def mean(self) -> float | None:
+        '''
+        Plain mean of all the samples, what CalculateAveragePM25 reports.
+        '''
+        return float(self.value.mean()) if len(self) else None
+
+
+    def __cells(self, rows: int, cols: int, bbox: BBox | None) -> Tuple[Tuple[float, float, float, float], np.ndarray, np.ndarray]:
+        '''
+        Bounds of the grid, flat cell index of the samples inside it and their mask.
+        '''
+        if rows <= 0 or cols <= 0:
+            raise ValueError("rows and cols must be positive")
+
+        if bbox is None:
+            if not len(self):
+                raise ValueError("a bbox is needed without samples")
+            bbox = (self.lat.min(), self.lon.min(), self.lat.max(), self.lon.max())
+        south, west, north, east = _bounds(bbox)
+
+        inside = (self.lat >= south) & (self.lat <= north) & (self.lon >= west) & (self.lon <= east)
+        # samples on the north or east edge go to the last row or column
+        row = np.minimum(((self.lat[inside] - south) / max(north - south, 1e-12) * rows).astype(np.intp), rows - 1)
+        col = np.minimum(((self.lon[inside] - west) / max(east - west, 1e-12) * cols).astype(np.intp), cols - 1)
+        return (south, west, north, east), row * cols + col, inside
+
+
+    def grid(self, rows: int, cols: int, bbox: BBox = None) -> GridStats:
+        """
+        Count, mean, variance, min and max of the samples in every cell of a grid.
+
+        Args:
+            rows (int): Number of cells along the latitude
+            cols (int): Number of cells along the longitude
+            bbox (Tuple[float, float, float, float], optional): lat1, lng1, lat2, lng2 of the
+                grid. Defaults to the bounds of the samples.
+
+        Returns:
+            GridStats: Per-cell arrays of shape (rows, cols)
+        """
+        bounds, cell, inside = self.__cells(rows, cols, bbox)
+        values, size = self.value[inside], rows * cols
+
+        count = np.bincount(cell, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(cell, weights=values, minlength=size) / count
+            deviation = values - mean[cell] # two passes, no cancellation on large values
+            variance = np.bincount(cell, weights=deviation * deviation, minlength=size) / (count - 1)
+        variance[count < 2] = np.nan
+
+        low  = np.full(size, np.inf)
+        high = np.full(size, -np.inf)
+        np.minimum.at(low, cell, values)
+        np.maximum.at(high, cell, values)
+        low[count == 0] = high[count == 0] = np.nan
+
+        shape = (rows, cols)
+        return GridStats(bounds, count.reshape(shape), mean.reshape(shape), variance.reshape(shape),
+                         low.reshape(shape), high.reshape(shape))
+
+
+    def gridded_mean(self, rows: int, cols: int, bbox: BBox = None) -> float | None:
+        """
+        Mean of the cell means of a grid: every covered cell weighs the same, a sample
+        weighs the inverse of the number of samples in its cell (declustering).
+
+        Returns:
+            float: Density-weighted mean, None without samples in the grid
+        """
+        means = self.grid(rows, cols, bbox).mean
+        covered = ~np.isnan(means)
+        return float(means[covered].mean()) if covered.any() else None
+
+
+    def station_means(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Mean value of every distinct location, e.g. one station over many ticks.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: lat, lon, mean and count
+        """
+        locations, location, count = np.unique(np.column_stack((self.lat, self.lon)), axis=0,
+                                               return_inverse=True, return_counts=True)
+        location = location.reshape(-1)
+        mean = np.bincount(location, weights=self.value, minlength=len(count)) / count
+        return locations[:, 0], locations[:, 1], mean, count
+
+
+    def idw_mean(self, rows: int, cols: int, bbox: BBox = None, power: float = 2,
+                 batch_size: int = 1 << 20) -> float | None:
+        """
+        Regional mean of an inverse distance weighted surface: the station means are
+        interpolated at the centre of every cell of a grid, then the cells are averaged.
+        Distances are equirectangular, accurate at the scale of a region.
+
+        Args:
+            rows (int): Number of cells along the latitude
+            cols (int): Number of cells along the longitude
+            bbox (Tuple[float, float, float, float], optional): lat1, lng1, lat2, lng2 of the
+                grid. Defaults to the bounds of the samples.
+            power (float, optional): Power of the inverse distance. Defaults to 2.
+            batch_size (int, optional): Cell-station distances computed at once, bounds the
+                memory used. Defaults to 1M.
+
+        Returns:
+            float: Mean of the interpolated cells, None without samples
+        """
+        if not len(self):
+            return None
+        if rows <= 0 or cols <= 0:
+            raise ValueError("rows and cols must be positive")
+
+        south, west, north, east = _bounds(bbox) if bbox is not None else \
+            (self.lat.min(), self.lon.min(), self.lat.max(), self.lon.max())
+        lat, lon, mean, _ = self.station_means()
+
+        cell_lat = south + (np.arange(rows) + 0.5) * (north - south) / rows
+        cell_lon = west + (np.arange(cols) + 0.5) * (east - west) / cols
+        cell_lat, cell_lon = (a.reshape(-1) for a in np.meshgrid(cell_lat, cell_lon, indexing='ij'))
+
+        scale = math.cos(math.radians((south + north) / 2)) # longitude degrees shrink with the latitude
+        surface = np.empty(len(cell_lat))
+        step = max(1, batch_size // len(lat))
+        for first in range(0, len(cell_lat), step):
+            part = slice(first, first + step)
+            weights = np.subtract.outer(cell_lat[part], lat)
+            weights *= weights
+            dx = np.subtract.outer(cell_lon[part] * scale, lon * scale)
+            dx *= dx
+            weights += dx
+            np.maximum(weights, 1e-18, out=weights) # a station on a cell centre dominates it
+            if power == 2:
+                np.reciprocal(weights, out=weights)
+            else:
+                np.power(weights, -power / 2, out=weights) # weights hold squared distances
+            surface[part] = weights @ mean / weights.sum(axis=1)
+        return float(surface.mean())
+
+
+def _bounds(bbox: BBox) -> Tuple[float, float, float, float]:
+    south, north = sorted((float(bbox[0]), float(bbox[2])))
+    west, east   = sorted((float(bbox[1]), float(bbox[3])))
+    return south, west, north, east
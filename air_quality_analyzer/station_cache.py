@@ -0,0 +1,185 @@
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from .stations import BBox, Station
+
+
+DEFAULT_TTL = 24 * 60 * 60 # station sets barely change within a day
+
+class StationCache:
+    """
+    A TTL based cache of discovered station lists keyed by bounding box.
+
+    Entries live in an in-memory LRU and, if a directory is given, in one JSON file per
+    bounding box so short-lived processes can share discovery results. Any two corner
+    orderings of the same box map to the same entry.
+
+    Attributes:
+        ttl (float): Seconds an entry stays valid
+        max_entries (int): Maximum number of bounding boxes kept in memory
+        path (str): Directory of the on-disk store or None for memory only
+
+    Args:
+        ttl (float, optional): Seconds an entry stays valid. Defaults to one day.
+        max_entries (int, optional): Maximum number of entries kept in memory. Defaults to 128.
+        path (str, optional): Directory for the on-disk store, created if missing. Defaults to None.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=128, path=None):
+
+        if ttl <= 0:
+            raise ValueError("ttl can not be zero or negative")
+        if max_entries <= 0:
+            raise ValueError("max_entries can not be zero or negative")
+
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self.path        = path
+
+        self.__entries = OrderedDict() # key -> (stored_at, stations)
+        self.__lock    = Lock()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+
+    @staticmethod
+    def key(latitude_1: float, longitude_1: float, latitude_2: float, longitude_2: float) -> str:
+        """
+        Normalize a bounding box into a cache key.
+
+        Returns:
+            str: "south,west,north,east" rounded to 6 decimals (~0.1m)
+        """
+        south, north = sorted((float(latitude_1), float(latitude_2)))
+        west, east   = sorted((float(longitude_1), float(longitude_2)))
+        return ",".join(f"{v:.6f}" for v in (south, west, north, east))
+
+
+    def __file(self, key: str) -> str:
+        return os.path.join(self.path, f"stations_{key}.json")
+
+
+    def __load(self, key: str) -> Tuple[float, list] | None:
+        """
+        Read an entry from the on-disk store.
+
+        Returns:
+            Tuple[float, list]: (stored_at, stations) or None if missing or unreadable
+        """
+        try:
+            with open(self.__file(key)) as f:
+                data = json.load(f)
+            return data['stored_at'], [Station(*st) for st in data['stations']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+    def __dump(self, key: str, stored_at: float, stations: list) -> None:
+        """
+        Write an entry to the on-disk store atomically, readers never see a partial file.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'stored_at': stored_at, 'stations': stations}, f)
+            os.replace(tmp, self.__file(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    def get(self, bbox: BBox) -> Optional[List[Station]]:
+        """
+        Get the cached station list of a bounding box.
+
+        Args:
+            bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2
+
+        Returns:
+            List[Station]: Stations if cached and not expired, None otherwise
+        """
+        key = self.key(*bbox)
+        now = time.time()
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self.__entries.move_to_end(key)
+                    return list(entry[1])
+                del self.__entries[key]
+
+        if self.path is None:
+            return None
+
+        entry = self.__load(key)
+        if entry is None or now - entry[0] >= self.ttl:
+            return None
+
+        with self.__lock:
+            self.__remember(key, entry)
+        return list(entry[1])
+
+
+    def put(self, bbox: BBox, stations: List[Station]) -> None:
+        """
+        Store the station list of a bounding box.
+
+        Args:
+            bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2
+            stations (List[Station]): Discovered stations
+        """
+        key = self.key(*bbox)
+        entry = (time.time(), list(stations))
+
+        with self.__lock:
+            self.__remember(key, entry)
+
+        if self.path is not None:
+            self.__dump(key, *entry)
+
+
+    def __remember(self, key: str, entry: Tuple[float, list]) -> None:
+        '''
+        Insert into the in-memory LRU, evicting the least recently used entry. Lock must be held.
+        '''
+        self.__entries[key] = entry
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+
+
+    def invalidate(self, bbox: BBox = None) -> None:
+        '''
+        Drop the entry of a bounding box, or every entry if no box is given.
+
+        Args:
+            bbox (Tuple[float, float, float, float], optional): lat1, lng1, lat2, lng2
+        '''
+        with self.__lock:
+            if bbox is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(self.key(*bbox), None)
+
+        if self.path is None:
+            return
+
+        if bbox is None:
+            files = [os.path.join(self.path, f) for f in os.listdir(self.path)
+                     if f.startswith("stations_") and f.endswith(".json")]
+        else:
+            files = [self.__file(self.key(*bbox))]
+
+        for f in files:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
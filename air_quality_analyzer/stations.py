@@ -0,0 +1,111 @@
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+
+BBox = Tuple[float, float, float, float]
+
+class Station(NamedTuple):
+    """
+    A monitoring station found by the Map Query API.
+
+    Attributes:
+        lat (float): Latitude of the station
+        lon (float): Longitude of the station
+        uid (int): WAQI station id, None if the API did not return one
+        aqi (float): AQI reported for the station by the map query, None if it had no usable value
+    """
+    lat: float
+    lon: float
+    uid: Optional[int] = None
+    aqi: Optional[float] = None
+
+
+class Tiling(NamedTuple):
+    """
+    How to split a bounding box into map queries.
+
+    Attributes:
+        rows (int): Number of tiles along the latitude
+        cols (int): Number of tiles along the longitude
+        max_depth (int): How many times a truncated tile may be split again
+        station_limit (int): A tile returning at least this many stations is considered
+            truncated by the API and is split into rows x cols sub tiles
+    """
+    rows: int = 2
+    cols: int = 2
+    max_depth: int = 2
+    station_limit: int = 1000
+
+
+def split_bounds(bbox: BBox, rows: int, cols: int) -> List[BBox]:
+    """
+    Split a bounding box into a rows x cols grid of tiles.
+
+    Args:
+        bbox (Tuple[float, float, float, float]): lat1, lng1, lat2, lng2 in any corner order
+        rows (int): Number of tiles along the latitude
+        cols (int): Number of tiles along the longitude
+
+    Returns:
+        List[Tuple[float, float, float, float]]: Tiles as (south, west, north, east)
+    """
+    if rows <= 0 or cols <= 0:
+        raise ValueError("rows and cols can not be zero or negative")
+
+    south, north = sorted((bbox[0], bbox[2]))
+    west, east   = sorted((bbox[1], bbox[3]))
+    lat_step = (north - south) / rows
+    lng_step = (east - west) / cols
+
+    tiles = []
+    for r in range(rows):
+        for c in range(cols):
+            # use the real edges for the last row/column so rounding never loses a sliver
+            tile_north = north if r == rows - 1 else south + (r + 1) * lat_step
+            tile_east  = east if c == cols - 1 else west + (c + 1) * lng_step
+            tiles.append((south + r * lat_step, west + c * lng_step, tile_north, tile_east))
+    return tiles
+
+
+def is_truncated(stations: List[Station], tiling: Tiling, depth: int) -> bool:
+    """
+    Check if a tile's result looks truncated and may still be split.
+
+    Args:
+        stations (List[Station]): Stations returned for the tile
+        tiling (Tiling): Tiling configuration
+        depth (int): How many times the tile's parents were split, 0 for the top level grid
+
+    Returns:
+        bool: True if the tile should be split into sub tiles
+    """
+    return len(stations) >= tiling.station_limit and depth < tiling.max_depth
+
+
+def station_key(station: Station):
+    """
+    Identity of a station: its uid, or its coordinates if it has no uid.
+    """
+    return station.uid if station.uid is not None else (station.lat, station.lon)
+
+
+def merge_stations(station_lists: Iterable[List[Station]]) -> List[Station]:
+    """
+    Merge the stations of several tiles, dropping stations found in more than one tile.
+
+    Stations are identified by uid, or by coordinates if they have no uid.
+
+    Args:
+        station_lists (Iterable[List[Station]]): Stations of each tile
+
+    Returns:
+        List[Station]: Unique stations in first seen order
+    """
+    seen = set()
+    merged = []
+    for stations in station_lists:
+        for station in stations:
+            key = station_key(station)
+            if key not in seen:
+                seen.add(key)
+                merged.append(station)
+    return merged
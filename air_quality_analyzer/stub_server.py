@@ -0,0 +1,287 @@
+"""
+A local stand-in for the WAQI API, for benchmarks and tests of the real sampling path.
+
+Serves the map bounds query, the geolocalized feed and the feed by uid for a fixed set
+of generated stations, with configurable latency, error and throttling rates and
+payload size. Point an analyzer at it with set_api_base(server.base_url).
+
+    python -m air_quality_analyzer.stub_server --stations 500 --latency 0.05 --port 8000
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .stations import Station
+
+
+DEFAULT_BOUNDS = (48.0, -123.5, 49.5, -122.0) # south, west, north, east
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+
+        if url.path == "/stats":
+            return self.__reply(200, server.stats())
+
+        server.count('requests')
+        delay = server.latency_sample()
+        if delay:
+            time.sleep(delay)
+
+        outcome = server.outcome()
+        if outcome == 429:
+            server.count('throttled')
+            return self.__reply(429, {"status": "error", "data": "Too Many Requests"}, {"Retry-After": "1"})
+        if outcome == 500:
+            server.count('errors')
+            return self.__reply(500, {"status": "error", "data": "Internal Server Error"})
+
+        if url.path == "/v2/map/bounds":
+            server.count('map')
+            try:
+                bbox = tuple(float(v) for v in parse_qs(url.query)['latlng'][0].split(','))
+            except (KeyError, ValueError):
+                return self.__reply(200, {"status": "error", "data": "Invalid bounds"})
+            return self.__reply(200, server.map_body(bbox))
+
+        if url.path.startswith("/feed/"):
+            server.count('feed')
+            station = server.lookup(url.path[len("/feed/"):].rstrip('/'))
+            if station is None:
+                return self.__reply(200, {"status": "error", "data": "Unknown station"})
+            return self.__reply(200, server.feed_body(station))
+
+        self.__reply(404, {"status": "error", "data": "Not Found"})
+
+
+    def __reply(self, status: int, body: Dict, headers: Dict = None) -> None:
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError): # the client gave up, e.g. a tick timeout
+            self.close_connection = True
+
+
+    def log_message(self, *args):
+        pass
+
+
+class WAQIStubServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server answering like api.waqi.info for generated stations.
+
+    Stations are spread at random over bounds and keep their uid, position and PM2.5 value
+    for the life of the server. Every request is delayed by a lognormal latency with the
+    given median, then fails with a 500 or a 429 (with Retry-After) at the given rates. The
+    map query returns at most station_limit stations, like the real API.
+
+    GET /stats returns the request counters without counting itself.
+
+    Attributes:
+        stations (List[Station]): The generated stations
+        base_url (str): URL to give to CalculateAveragePM25.set_api_base
+
+    Args:
+        stations (int, optional): Number of stations. Defaults to 100.
+        bounds (Tuple[float, float, float, float], optional): south, west, north, east of the
+            stations. Defaults to the Vancouver area.
+        latency (float, optional): Median response delay in seconds. Defaults to 0.
+        latency_sigma (float, optional): Shape of the lognormal delay, 0 for a constant delay. Defaults to 0.
+        error_rate (float, optional): Share of requests answered with a 500. Defaults to 0.
+        throttle_rate (float, optional): Share of requests answered with a 429. Defaults to 0.
+        payload_size (int, optional): Minimum size in bytes of a feed response, padded with a
+            forecast like the real feeds. Defaults to 0 (no padding).
+        station_limit (int, optional): Maximum stations per map query. Defaults to 1000.
+        seed (int, optional): Seed of the stations and of the random outcomes. Defaults to 0.
+        address (Tuple[str, int], optional): Address to listen on. Defaults to a free local port.
+    """
+
+    daemon_threads     = True
+    request_queue_size = 1024 # accept every concurrent connection of a benchmark at once
+
+    def __init__(self, stations=100, bounds=DEFAULT_BOUNDS, latency=0.0, latency_sigma=0.0, error_rate=0.0,
+                 throttle_rate=0.0, payload_size=0, station_limit=1000, seed=0, address=("127.0.0.1", 0)):
+
+        if not 0 <= error_rate + throttle_rate <= 1:
+            raise ValueError("error_rate + throttle_rate must be between 0 and 1")
+
+        super().__init__(address, _StubHandler)
+
+        self.latency       = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate    = error_rate
+        self.throttle_rate = throttle_rate
+        self.payload_size  = payload_size
+        self.station_limit = station_limit
+
+        self.__random   = random.Random(seed)
+        self.__lock     = Lock()
+        self.__counters = dict.fromkeys(('requests', 'map', 'feed', 'errors', 'throttled'), 0)
+        self.__thread   = None
+
+        south, west, north, east = bounds
+        self.stations = [Station(self.__random.uniform(south, north), self.__random.uniform(west, east),
+                                 uid, round(self.__random.uniform(5, 80), 1))
+                         for uid in range(1, stations + 1)]
+        self.__by_uid = {st.uid: st for st in self.stations}
+
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self) -> 'WAQIStubServer':
+        '''
+        Serve requests on a background thread.
+        '''
+        self.__thread = Thread(target=self.serve_forever, name=self.__class__.__name__, daemon=True)
+        self.__thread.start()
+        return self
+
+
+    def stop(self) -> None:
+        if self.__thread is not None:
+            self.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.server_close()
+
+
+    def __enter__(self) -> 'WAQIStubServer':
+        return self.start()
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+    def count(self, counter: str) -> None:
+        with self.__lock:
+            self.__counters[counter] += 1
+
+
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__counters)
+
+
+    def latency_sample(self) -> float:
+        if not self.latency:
+            return 0.0
+        if not self.latency_sigma:
+            return self.latency
+        with self.__lock:
+            return self.latency * math.exp(self.__random.gauss(0, self.latency_sigma))
+
+
+    def outcome(self) -> int:
+        '''
+        Status code of the next response: 500, 429 or 200.
+        '''
+        with self.__lock:
+            draw = self.__random.random()
+        if draw < self.error_rate:
+            return 500
+        if draw < self.error_rate + self.throttle_rate:
+            return 429
+        return 200
+
+
+    def lookup(self, feed: str) -> Station | None:
+        """
+        Station of a feed path: "@<uid>" or "geo:<lat>;<lon>" (the nearest station).
+        """
+        try:
+            if feed.startswith('@'):
+                return self.__by_uid.get(int(feed[1:]))
+            if feed.startswith('geo:'):
+                lat, lon = (float(v) for v in feed[4:].split(';'))
+                return min(self.stations, key=lambda st: (st.lat - lat) ** 2 + (st.lon - lon) ** 2, default=None)
+        except ValueError:
+            pass
+        return None
+
+
+    def map_body(self, bbox: Tuple[float, float, float, float]) -> Dict:
+        south, north = sorted((bbox[0], bbox[2]))
+        west, east   = sorted((bbox[1], bbox[3]))
+        found = [st for st in self.stations if south <= st.lat <= north and west <= st.lon <= east]
+        return {"status": "ok", "data": [
+            {"lat": st.lat, "lon": st.lon, "uid": st.uid, "aqi": str(round(st.aqi)),
+             "station": {"name": f"Station {st.uid}", "time": self.__measured_at()}}
+            for st in found[:self.station_limit]]}
+
+
+    def feed_body(self, station: Station) -> Dict:
+        data = {
+            "aqi": round(station.aqi),
+            "idx": station.uid,
+            "city": {"geo": [station.lat, station.lon], "name": f"Station {station.uid}"},
+            "iaqi": {"pm25": {"v": station.aqi}},
+            "time": {"iso": self.__measured_at()},
+        }
+        padding = self.payload_size - len(json.dumps(data))
+        if padding > 0:
+            data["forecast"] = {"daily": {"pm25": self.__forecast(padding)}}
+        return {"status": "ok", "data": data}
+
+
+    def __forecast(self, size: int) -> List[Dict]:
+        entry = {"avg": 25, "day": "2024-01-01", "max": 40, "min": 10}
+        return [entry] * -(-size // (len(json.dumps(entry)) + 2)) # rounded up, the size is a minimum
+
+
+    def __measured_at(self) -> str:
+        # stations publish on the hour
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return now.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="median delay in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="lognormal shape of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=0, help="minimum feed response size in bytes")
+    parser.add_argument("--station-limit", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    server = WAQIStubServer(args.stations, latency=args.latency, latency_sigma=args.latency_sigma,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                            payload_size=args.payload_size, station_limit=args.station_limit,
+                            seed=args.seed, address=(args.host, args.port))
+    print(server.base_url, flush=True) # first line of the output, read by the benchmarks
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from threading import Lock
+from typing import TYPE_CHECKING, Tuple, Type
+
+if TYPE_CHECKING:
+    import requests
+
+
+DEFAULT_CONNECT_TIMEOUT = 3.05 # slightly above a multiple of 3s, the default TCP retransmit window
+DEFAULT_READ_TIMEOUT    = 10
+
+class HTTPTransport:
+    """
+    A pooled, keep-alive HTTP session for WAQI API calls.
+
+    Every request made through the same transport reuses the already open TCP/TLS
+    connections to api.waqi.info instead of doing a fresh handshake per station. A single
+    transport can be shared between several analyzers, in that case the pool should be
+    sized to the total number of concurrent workers.
+
+    Attributes:
+        pool_size (int): Maximum number of connections kept alive per host
+        timeout (Tuple[float, float]): (connect, read) timeouts in seconds used for every request
+
+    Args:
+        pool_size (int, optional): Maximum number of connections kept alive per host. Defaults to 8.
+        connect_timeout (float, optional): Seconds to wait for a connection. Defaults to 3.05.
+        read_timeout (float, optional): Seconds to wait between bytes of a response. Defaults to 10.
+    """
+
+    def __init__(self, pool_size=8, connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+
+        if pool_size <= 0:
+            raise ValueError("pool_size can not be zero or negative")
+
+        self.pool_size = pool_size
+        self.timeout   = (connect_timeout, read_timeout)
+
+        self.__lock    = Lock()
+        self.__session = self.__build_session(pool_size)
+
+
+    def __build_session(self, pool_size: int) -> 'requests.Session':
+        """
+        Create a session with a connection pool mounted for both http and https.
+
+        Args:
+            pool_size (int): Maximum number of connections kept alive per host
+
+        Returns:
+            requests.Session: The configured session
+        """
+        import requests # imported on first use, it takes longer to import than the rest of the package
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # block=False: extra workers still get a (non pooled) connection instead of waiting
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+    def get(self, url: str) -> 'requests.Response':
+        """
+        Send a GET request over the pooled session.
+
+        Args:
+            url (str): Full URL including the query string
+
+        Returns:
+            requests.Response: The response object
+
+        Raises:
+            requests.exceptions.RequestException: On connection errors and timeouts
+        """
+        return self.__session.get(url, timeout=self.timeout)
+
+
+    def resize(self, pool_size: int) -> None:
+        '''
+        Resize the connection pool. Open connections of the old pool are closed.
+
+        Args:
+            pool_size (int): New maximum number of connections kept alive per host
+        '''
+        if pool_size <= 0:
+            raise ValueError("pool_size can not be zero or negative")
+
+        with self.__lock:
+            if pool_size == self.pool_size:
+                return
+            old_session = self.__session
+            self.__session = self.__build_session(pool_size)
+            self.pool_size = pool_size
+        old_session.close()
+
+
+    def close(self) -> None:
+        '''
+        Close all pooled connections.
+        '''
+        self.__session.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def request_errors() -> Tuple[Type[Exception], ...]:
+    """
+    Exceptions of failed requests (connection errors, timeouts...) raised by transports,
+    for except clauses. requests is only imported when one is raised.
+    """
+    from requests.exceptions import RequestException
+    return (RequestException,)
@@ -0,0 +1,54 @@
+"""
+Per-response decode time of station feeds: the json module, orjson (if installed), and the
+analyzer's decoders (ResponseDecoder decodes whole bodies, FeedDecoder only the fields
+the analyzer reads).
+
+Feeds are generated by the local WAQI stand-in, padded with a forecast to --sizes bytes
+like the real feeds (a few KB each).
+
+    python benchmarks/bench_decode.py --sizes 0 2048 8192 32768
+"""
+import argparse
+import json
+import timeit
+
+from air_quality_analyzer.decoding import FeedDecoder, ResponseDecoder, orjson
+from air_quality_analyzer.metrics import UID_ENDPOINT
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+
+def feed_bodies(sizes):
+    server = WAQIStubServer(stations=1)
+    try:
+        for size in sizes:
+            server.payload_size = size
+            yield json.dumps(server.feed_body(server.stations[0])).encode()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 2048, 8192, 32768], help="feed sizes in bytes")
+    parser.add_argument("--number", type=int, default=5000, help="decodes per measurement")
+    args = parser.parse_args()
+
+    decoders = {"json": json.loads}
+    if orjson is not None:
+        decoders["orjson"] = orjson.loads
+    decoders["ResponseDecoder"] = lambda body: ResponseDecoder().decode(body, UID_ENDPOINT)
+    decoders["FeedDecoder"] = lambda body: FeedDecoder().decode(body, UID_ENDPOINT)
+
+    print(f"{'bytes':>8} " + " ".join(f"{name:>16}" for name in decoders) + "   (us per response)")
+    for body in feed_bodies(args.sizes):
+        full = json.loads(body)['data']
+        slim = FeedDecoder().decode(body, UID_ENDPOINT)['data']
+        assert all(slim[key] == full[key] for key in ('idx', 'iaqi', 'time')), "FeedDecoder disagrees with json"
+
+        times = [min(timeit.repeat(lambda: decode(body), number=args.number, repeat=3)) / args.number * 1e6
+                 for decode in decoders.values()]
+        print(f"{len(body):>8} " + " ".join(f"{t:>16.2f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
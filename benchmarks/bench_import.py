@@ -0,0 +1,44 @@
+"""
+Cold import time of the package modules, each measured in fresh interpreters with
+python -X importtime, and the heavy dependencies a plain import loads.
+
+    python benchmarks/bench_import.py --runs 10 air_quality_analyzer.analyzer air_quality_analyzer.sharded
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+HEAVY = ("requests", "urllib3", "asyncio", "http.server", "aiohttp", "numpy")
+
+def import_time(module):
+    '''
+    Cumulative import time of module in microseconds and the heavy modules it loaded.
+    '''
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    for line in reversed(run.stderr.splitlines()):
+        _, _, cumulative, name = (part.strip() for part in line.replace(":", "|", 1).split("|"))
+        if name == module:
+            return int(cumulative), run.stdout.split()
+    raise RuntimeError(f"{module} not found in the import times")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["air_quality_analyzer.analyzer"])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'module':<40} {'median ms':>10} {'min ms':>8}   heavy modules loaded")
+    for module in args.modules:
+        times, loaded = [], []
+        for _ in range(args.runs):
+            cumulative, loaded = import_time(module)
+            times.append(cumulative / 1000)
+        print(f"{module:<40} {statistics.median(times):>10.1f} {min(times):>8.1f}   {' '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
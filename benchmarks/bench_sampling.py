@@ -0,0 +1,210 @@
+"""
+Throughput and latency of CalculateAveragePM25.start_sampling against the local WAQI stand-in.
+
+For every combination of station count and thread count, starts the stand-in server in a
+separate process (so its threads and memory are not measured), runs a blocking sampling
+run of --ticks ticks and reports feed requests per second, per-tick wall time quantiles,
+peak thread count and peak RSS of this process. Results are saved as JSON; pass an earlier
+file with --baseline to print the change of every metric.
+
+    python benchmarks/bench_sampling.py --stations 100 500 --threads 8 32 --latency 0.02 -o results.json
+    python benchmarks/bench_sampling.py --stations 100 500 --threads 8 32 --latency 0.02 --baseline results.json
+
+With --processes N the stations are sharded over N worker processes (ShardedAnalyzer),
+threads are then per worker and the thread count and RSS are of this process only.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.scheduler import Tick
+from air_quality_analyzer.sharded import ShardedAnalyzer
+
+
+class TickTimer:
+    '''
+    Records the wall time of every tick from its RUNNING to its DONE or FAILED state.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tick_started = {}
+        self.tick_times   = []
+
+    def _set_state(self, tick_state: str, tick: Tick):
+        if tick_state == self.RUNNING:
+            self.tick_started[tick.name] = time.perf_counter()
+        elif tick.name in self.tick_started:
+            self.tick_times.append(time.perf_counter() - self.tick_started.pop(tick.name))
+        super()._set_state(tick_state, tick)
+
+
+class TimedAnalyzer(TickTimer, CalculateAveragePM25):
+    pass
+
+
+class TimedShardedAnalyzer(TickTimer, ShardedAnalyzer):
+    pass
+
+
+class ResourceMonitor(threading.Thread):
+    '''
+    Samples the thread count and RSS of this process until stopped.
+    '''
+
+    def __init__(self, period=0.005):
+        super().__init__(daemon=True)
+        self.period      = period
+        self.max_threads = 0
+        self.max_rss     = 0
+        self.__stopped   = threading.Event()
+
+    def run(self):
+        while not self.__stopped.wait(self.period):
+            self.max_threads = max(self.max_threads, threading.active_count() - 1) # without the monitor
+            self.max_rss     = max(self.max_rss, rss_bytes())
+
+    def stop(self):
+        self.__stopped.set()
+        self.join()
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError): # not Linux, fall back to the peak of the process
+        import resource # Unix only
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def quantile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else None
+
+
+def start_server(args, stations):
+    command = [sys.executable, "-m", "air_quality_analyzer.stub_server", "--stations", str(stations),
+               "--latency", str(args.latency), "--latency-sigma", str(args.latency_sigma),
+               "--error-rate", str(args.error_rate), "--throttle-rate", str(args.throttle_rate),
+               "--payload-size", str(args.payload_size)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def run_case(args, stations, thread_cnt):
+    process, base_url = start_server(args, stations)
+    try:
+        # ticks back to back: a tick that overruns its interval makes the scheduler skip ahead
+        rate = 60 / args.interval
+        if args.processes:
+            analyzer = TimedShardedAnalyzer(48.0, -123.5, 49.5, -122.0, args.ticks / rate, rate,
+                                            processes=args.processes)
+        else:
+            analyzer = TimedAnalyzer(48.0, -123.5, 49.5, -122.0, args.ticks / rate, rate)
+        analyzer.set_token("benchmark")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(base_url)
+        analyzer.thread_cnt = thread_cnt
+
+        monitor = ResourceMonitor()
+        monitor.start()
+        before = requests.get(base_url + "/stats").json()
+        started = time.perf_counter()
+        analyzer.start_sampling(blocking=True)
+        elapsed = time.perf_counter() - started
+        after = requests.get(base_url + "/stats").json()
+        monitor.stop()
+    finally:
+        process.terminate()
+        process.wait()
+
+    ticks = analyzer.tick_times
+    feeds = after['feed'] - before['feed']
+    return {
+        "stations": stations,
+        "thread_cnt": thread_cnt,
+        "processes": args.processes,
+        "ticks": len(ticks),
+        "state": analyzer.sampling_status(),
+        "requests": after['requests'] - before['requests'],
+        "requests_per_sec": feeds / sum(ticks) if ticks else None,
+        "tick_p50_ms": quantile(ticks, 0.50) * 1000 if ticks else None,
+        "tick_p95_ms": quantile(ticks, 0.95) * 1000 if ticks else None,
+        "tick_p99_ms": quantile(ticks, 0.99) * 1000 if ticks else None,
+        "elapsed_s": elapsed,
+        "peak_threads": monitor.max_threads,
+        "peak_rss_mb": monitor.max_rss / 2 ** 20,
+        "samples": analyzer.aggregator.count,
+    }
+
+
+METRICS = ("requests_per_sec", "tick_p50_ms", "tick_p95_ms", "tick_p99_ms", "peak_threads", "peak_rss_mb")
+
+def compare(results, baseline):
+    previous = {(r['stations'], r['thread_cnt'], r.get('processes', 0)): r for r in baseline['results']}
+    for result in results:
+        old = previous.get((result['stations'], result['thread_cnt'], result['processes']))
+        if old is None:
+            continue
+        changes = []
+        for metric in METRICS:
+            if old.get(metric) and result.get(metric) is not None:
+                changes.append(f"{metric} {(result[metric] / old[metric] - 1) * 100:+.1f}%")
+        print(f"{result['stations']:>6} stations {result['thread_cnt']:>4} threads: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--threads", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between ticks")
+    parser.add_argument("--latency", type=float, default=0.02, help="median server delay in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal shape of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--payload-size", type=int, default=2048)
+    parser.add_argument("--processes", type=int, default=0, help="worker processes, 0 to sample in this process")
+    parser.add_argument("-o", "--output", help="JSON file to save the results to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    logging.getLogger("TickScheduler").setLevel(logging.ERROR) # overrun warnings are expected here
+
+    results = []
+    print(f"{'stations':>8} {'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'threads':>7} {'RSS MB':>7}")
+    for stations in args.stations:
+        for thread_cnt in args.threads:
+            result = run_case(args, stations, thread_cnt)
+            results.append(result)
+            print(f"{stations:>8} {thread_cnt:>7} {result['requests_per_sec'] or 0:>8.0f} "
+                  f"{result['tick_p50_ms'] or 0:>8.1f} {result['tick_p95_ms'] or 0:>8.1f} "
+                  f"{result['tick_p99_ms'] or 0:>8.1f} {result['peak_threads']:>7} {result['peak_rss_mb']:>7.1f}")
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
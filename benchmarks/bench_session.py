@@ -0,0 +1,73 @@
+"""
+Per-tick latency of station lookups with module level requests.get vs a pooled HTTPTransport.
+
+Runs against a local keep-alive HTTP server standing in for api.waqi.info, so the numbers
+only show the connection setup overhead (no TLS here, the saving against the real API is bigger).
+
+    python benchmarks/bench_session.py --stations 300 --ticks 5
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import requests
+
+from air_quality_analyzer.transport import HTTPTransport
+
+
+FEED = json.dumps({"status": "ok", "data": {"iaqi": {"pm25": {"v": 25.0}}}}).encode()
+
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(FEED)))
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_tick(get, base_url, stations, thread_cnt):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=thread_cnt) as executor:
+        list(executor.map(lambda i: get(f"{base_url}/feed/geo:{i};{i}/?token=x").json(), range(stations)))
+    return time.perf_counter() - start
+
+
+def bench(name, get, base_url, stations, ticks, thread_cnt):
+    times = [run_tick(get, base_url, stations, thread_cnt) for _ in range(ticks)]
+    print(f"{name:<16} mean {statistics.mean(times) * 1000:8.1f} ms/tick   min {min(times) * 1000:8.1f} ms/tick")
+    return statistics.mean(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{args.stations} stations, {args.threads} threads, {args.ticks} ticks")
+    no_pool = bench("requests.get", requests.get, base_url, args.stations, args.ticks, args.threads)
+    with HTTPTransport(pool_size=args.threads) as transport:
+        pooled = bench("HTTPTransport", transport.get, base_url, args.stations, args.ticks, args.threads)
+    print(f"speedup: {no_pool / pooled:.2f}x")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 from air_quality_analyzer.analyzer import CalculateAveragePM25
+import logging
 import time
 
+# the package only logs, showing its messages is up to the application
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+
 my_obj = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 5) # victoria to vancouver
 
 my_obj.set_token("token_here")
@@ -9,12 +13,9 @@ my_obj.set_token("token_here")
 # Running in non-blocking fashion
 my_obj.start_sampling()
 
-run = True
-while run:
-    time.sleep(10)
+# wake up as soon as the run is over instead of polling the status
+while not my_obj.wait(timeout=10):
     print("sampling status: ", my_obj.sampling_status())
-    if my_obj.sampling_status() == my_obj.DONE:
-        run = False
 
 print("sampling status: ", my_obj.sampling_status())
 print("pm25 avg:", my_obj.avg_pm25_all_sites())
@@ -29,6 +30,13 @@ print("pm25 avg:", my_obj.avg_pm25_all_sites())
 
 ###################################################
 
+# reacting to every tick and to the end of the run
+my_obj.add_tick_callback(lambda tick, values: print(tick.name, tick.state, len(values), "stations"))
+my_obj.start_sampling()
+print("pm25 avg:", my_obj.future.result())
+
+###################################################
+
 # stopping in the middle
 my_obj.start_sampling()
 
@@ -0,0 +1,88 @@
+import random
+import statistics
+import unittest
+from air_quality_analyzer.aggregator import RunningStats, P2Quantile, RollingWindow, StreamingAggregator
+
+class TestAggregator(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.values = [rng.gauss(30, 8) for _ in range(5000)]
+
+    def test_running_stats(self):
+        """Test online statistics match the exact ones"""
+        stats = RunningStats()
+        for value in self.values:
+            stats.add(value)
+        self.assertEqual(stats.count, len(self.values))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(self.values))
+        self.assertAlmostEqual(stats.variance, statistics.variance(self.values))
+        self.assertEqual(stats.min, min(self.values))
+        self.assertEqual(stats.max, max(self.values))
+
+    def test_merge(self):
+        """Test merging two halves equals adding everything to one"""
+        left, right = RunningStats(), RunningStats()
+        for value in self.values[:1234]:
+            left.add(value)
+        for value in self.values[1234:]:
+            right.add(value)
+        left.merge(right)
+        self.assertAlmostEqual(left.mean, statistics.fmean(self.values))
+        self.assertAlmostEqual(left.variance, statistics.variance(self.values))
+
+    def test_quantiles(self):
+        """Test P-square estimates are close to the exact quantiles"""
+        for p in (0.5, 0.95):
+            estimator = P2Quantile(p)
+            for value in self.values:
+                estimator.add(value)
+            exact = statistics.quantiles(self.values, n=100)[int(p * 100) - 1]
+            self.assertAlmostEqual(estimator.value, exact, delta=0.5)
+
+    def test_breakdowns(self):
+        """Test per station and per tick statistics and the tick history bound"""
+        aggregator = StreamingAggregator(quantiles=(0.5,), tick_history=2)
+        aggregator.add_tick("Timer-0s", {1: 10.0, 2: 20.0})
+        aggregator.add_tick("Timer-60s", {1: 30.0})
+        aggregator.add_tick("Timer-120s", {2: 40.0})
+
+        self.assertEqual(aggregator.count, 4)
+        self.assertEqual(aggregator.mean(), 25.0)
+        self.assertEqual(aggregator.station_stats(1)['mean'], 20.0)
+        self.assertEqual(aggregator.tick_stats("Timer-120s")['max'], 40.0)
+        self.assertIsNone(aggregator.tick_stats("Timer-0s"))
+        self.assertIn('p50', aggregator.stats())
+
+        aggregator.reset()
+        self.assertIsNone(aggregator.mean())
+    def test_rolling_window(self):
+        """Test window statistics match the exact ones of the batches still in the window"""
+        window = RollingWindow(10)
+        batches = [self.values[i:i + 50] for i in range(0, 1000, 50)]
+        for t, batch in enumerate(batches):
+            stats = RunningStats()
+            for value in batch:
+                stats.add(value)
+            window.add(stats, now=t)
+
+        kept = [v for batch in batches[-10:] for v in batch]
+        stats = window.as_dict(now=19.5)
+        self.assertEqual(stats['ticks'], 10)
+        self.assertEqual(stats['count'], len(kept))
+        self.assertAlmostEqual(stats['mean'], statistics.mean(kept))
+        self.assertAlmostEqual(stats['variance'], statistics.variance(kept))
+        self.assertEqual((stats['min'], stats['max']), (min(kept), max(kept)))
+
+        self.assertEqual(window.as_dict(now=100)['count'], 0)
+        self.assertIsNone(window.as_dict(now=100)['mean'])
+
+    def test_aggregator_windows(self):
+        aggregator = StreamingAggregator(windows=(60, 300))
+        aggregator.add_tick("t0", {1: 10.0, 2: 20.0})
+        self.assertEqual(aggregator.window_stats(60)['mean'], 15.0)
+        self.assertEqual(aggregator.window_stats(300)['ticks'], 1)
+        with self.assertRaises(KeyError):
+            aggregator.window_stats(900)
+
+if __name__ == '__main__':
+    unittest.main()
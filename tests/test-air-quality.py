@@ -1,3 +1,4 @@
+import json
 import unittest
 from unittest.mock import patch, Mock
 import time
@@ -39,19 +40,18 @@ class TestAirQualityAnalyzer(unittest.TestCase):
     def test_initial_state(self):
         """Test initial state of the analyzer"""
         self.assertEqual(self.analyzer.state, self.analyzer.STOPPED)
-        self.assertEqual(self.analyzer.pm25data, [])
+        self.assertEqual(self.analyzer.aggregator.count, 0)
         self.assertEqual(self.analyzer.sampling_status(), self.analyzer.STOPPED)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_state_transitions_success(self, mock_get):
         """Test state transitions for successful execution"""
 
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.side_effect = [
+        mock_get.side_effect = [Mock(status_code=200, content=json.dumps(body).encode()) for body in (
             self.map_api_response,
             self.station_api_response,
             self.station_api_response
-        ]
+        )]
 
         # Start sampling (non-blocking)
         self.analyzer.start_sampling(blocking=False)
@@ -64,22 +64,22 @@ class TestAirQualityAnalyzer(unittest.TestCase):
         time.sleep(2)
         self.assertEqual(self.analyzer.sampling_status(), self.analyzer.DONE)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_state_transitions_failure(self, mock_get):
         """Test state transitions when API fails"""
 
         # Mock failed API response
         mock_get.return_value.status_code = 404
-        mock_get.return_value.json.return_value = {"status": "error", "message": "Not found"}
+        mock_get.return_value.content = json.dumps({"status": "error", "message": "Not found"}).encode()
 
         self.analyzer.start_sampling(blocking=True)
         self.assertEqual(self.analyzer.sampling_status(), self.analyzer.FAILED)
 
     def test_stop_sampling(self):
         """Test stopping the sampling process"""
-        with patch('requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_get.return_value.status_code = 200
-            mock_get.return_value.json.return_value = self.map_api_response
+            mock_get.return_value.content = json.dumps(self.map_api_response).encode()
 
             # Start sampling
             self.analyzer.start_sampling(blocking=False)
@@ -88,17 +88,36 @@ class TestAirQualityAnalyzer(unittest.TestCase):
             # Stop sampling
             self.analyzer.stop_sampling()
             self.assertEqual(self.analyzer.sampling_status(), self.analyzer.STOPPED)
-            self.assertEqual(self.analyzer.pm25data, [])
+            self.assertEqual(self.analyzer.aggregator.count, 0)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_no_stations_found(self, mock_get):
         """Test behavior when no stations are found"""
         mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {"status": "ok", "data": []}
+        mock_get.return_value.content = json.dumps({"status": "ok", "data": []}).encode()
 
         self.analyzer.start_sampling(blocking=True)
         self.assertEqual(self.analyzer.sampling_status(), self.analyzer.DONE)
 
+    @patch('requests.Session.get')
+    def test_uid_feed_and_dedup(self, mock_get):
+        """Test stations with a uid are fetched by uid and one station is counted once per tick"""
+        mock_get.side_effect = [Mock(status_code=200, content=json.dumps(body).encode()) for body in (
+            {"status": "ok", "data": [{"lat": 48, "lon": -123.3, "uid": 7}, {"lat": 48.1, "lon": -123.2},
+                                      {"lat": 48.2, "lon": -123.1}, {"lat": 48, "lon": -123.3, "uid": 7}]},
+            # both coordinates without a uid resolve to the same nearest station
+            {"status": "ok", "data": {"idx": 9, "iaqi": {"pm25": {"v": 10.0}}}},
+            {"status": "ok", "data": {"idx": 9, "iaqi": {"pm25": {"v": 10.0}}}},
+            {"status": "ok", "data": {"idx": 7, "iaqi": {"pm25": {"v": 40.0}}}},
+        )]
+
+        self.analyzer.start_sampling(blocking=True)
+
+        urls = [call.args[0] for call in mock_get.call_args_list[1:]]
+        self.assertEqual(len(urls), 3)
+        self.assertEqual(sum("feed/@7/" in url for url in urls), 1)
+        self.assertEqual(self.analyzer.avg_pm25_all_sites(), 25.0)
+
     def test_invalid_token(self):
         """Test behavior with invalid token"""
         analyzer = CalculateAveragePM25(35.6892, 51.3890, 35.7272, 51.4258)
@@ -115,10 +134,10 @@ class TestAirQualityAnalyzer(unittest.TestCase):
         
         # Test after completion
         self.analyzer.state = self.analyzer.DONE
-        self.analyzer.pm25data = [25.0, 30.0, 35.0]
+        self.analyzer.aggregator.add_tick("Timer-0s", {1: 25.0, 2: 30.0, 3: 35.0})
         self.assertEqual(self.analyzer.avg_pm25_all_sites(), 30.0)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_api_timeout_handling(self, mock_get):
         mock_get.side_effect = requests.exceptions.Timeout("Connection timed out")
         
@@ -127,9 +146,9 @@ class TestAirQualityAnalyzer(unittest.TestCase):
 
     def test_state_consistency(self):
         """Test state consistency across multiple stops and starts"""
-        with patch('requests.get') as mock_get:
+        with patch('requests.Session.get') as mock_get:
             mock_get.return_value.status_code = 200
-            mock_get.return_value.json.return_value = self.map_api_response
+            mock_get.return_value.content = json.dumps(self.map_api_response).encode()
             
             # Start and stop multiple times
             self.analyzer.start_sampling(blocking=False)
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest.mock import patch
+
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.freshness import FreshnessTracker
+from air_quality_analyzer.ratelimit import AdaptiveConcurrency
+from air_quality_analyzer.response_cache import ResponseCache
+from air_quality_analyzer.retry import HedgePolicy, RetryPolicy
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+try:
+    import aiohttp
+    from air_quality_analyzer.async_analyzer import AsyncCalculateAveragePM25
+except ImportError:
+    aiohttp = None
+
+
+class WAQIServer(ThreadingHTTPServer):
+    request_queue_size = 128 # all concurrent connections are accepted at once
+
+
+class WAQIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path.startswith("/map"):
+            body = {"status": "ok", "data": [{"lat": 48 + i / 100, "lon": -123} for i in range(20)]}
+        else:
+            body = {"status": "ok", "data": {"iaqi": {"pm25": {"v": 25.0}}}}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncAirQualityAnalyzer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIServer(("127.0.0.1", 0), WAQIHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.patches = [
+            patch('air_quality_analyzer.analyzer.MAP_API', base + "/map?{lat1}{lng1}{lat2}{lng2}{token}"),
+            patch('air_quality_analyzer.analyzer.GEO_API', base + "/feed/geo:{lat};{lon}/?token={token}"),
+        ]
+        for p in cls.patches:
+            p.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for p in cls.patches:
+            p.stop()
+        cls.server.shutdown()
+
+    def make_analyzer(self, **kwargs):
+        analyzer = AsyncCalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1, **kwargs)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        return analyzer
+
+    def test_blocking_run(self):
+        """Test a blocking run collects every station and ends DONE"""
+        async def run():
+            analyzer = self.make_analyzer(concurrency=5)
+            await analyzer.start_sampling(blocking=True)
+            return analyzer
+
+        analyzer = asyncio.run(run())
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(analyzer.aggregator.count, 20)
+        self.assertEqual(analyzer.avg_pm25_all_sites(), 25.0)
+
+    def test_wait_and_stop(self):
+        """Test state transitions with wait() and stop_sampling()"""
+        async def run():
+            analyzer = self.make_analyzer()
+            await analyzer.start_sampling()
+            self.assertEqual(analyzer.sampling_status(), analyzer.STOPPED)
+            await asyncio.sleep(0.5)
+            self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+
+            await analyzer.stop_sampling()
+            self.assertEqual(analyzer.sampling_status(), analyzer.STOPPED)
+            self.assertEqual(analyzer.aggregator.count, 0)
+
+        asyncio.run(run())
+
+    def test_wait_timeout_and_await(self):
+        """Test wait(timeout) and awaiting the analyzer for the run average"""
+        async def run():
+            analyzer = AsyncCalculateAveragePM25(48, -123, 49, -122, sampling_period=0.05, sampling_rate=60)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            await analyzer.start_sampling()
+            self.assertFalse(await analyzer.wait(0.1))
+            return await analyzer
+
+        self.assertEqual(asyncio.run(run()), 25.0)
+
+    def test_streaming_ticks(self):
+        """Test ticks are yielded by async for as they complete"""
+        async def run():
+            analyzer = AsyncCalculateAveragePM25(48, -123, 49, -122, sampling_period=0.01, sampling_rate=600)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            await analyzer.start_sampling()
+            return [result async for result in analyzer.ticks()]
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0].stats['count'], 20)
+
+    def test_sub_second_ticks(self):
+        """Test ticks faster than one per second all run on the scheduler task"""
+        async def run():
+            analyzer = AsyncCalculateAveragePM25(48, -123, 49, -122, sampling_period=0.01, sampling_rate=600)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            await analyzer.start_sampling(blocking=True)
+            return analyzer
+
+        analyzer = asyncio.run(run())
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(len(analyzer.aggregator.per_tick), 6)
+
+    def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            AsyncCalculateAveragePM25(48, -123, 49, -122, concurrency=0)
+
+    def test_unsupported_settings(self):
+        """Test the settings the asyncio analyzer would ignore are refused"""
+        analyzer = AsyncCalculateAveragePM25(48, -123, 49, -122)
+        for setter, value in ((analyzer.set_concurrency_limiter, AdaptiveConcurrency()),
+                              (analyzer.set_retry_policy, RetryPolicy()),
+                              (analyzer.set_hedge_policy, HedgePolicy()),
+                              (analyzer.set_freshness_tracker, FreshnessTracker()),
+                              (analyzer.set_response_cache, ResponseCache())):
+            with self.assertRaises(ValueError):
+                setter(value)
+            setter(None)
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncOverrun(unittest.TestCase):
+    def test_tick_timeout_and_stop(self):
+        """Test late stations are cancelled at the tick's time limit and stop_sampling(timeout)"""
+        async def run():
+            analyzer = AsyncCalculateAveragePM25(48, -123.5, 49.5, -122, sampling_period=None, sampling_rate=60,
+                                                 concurrency=1)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_tick_timeout(0.75)
+            ticks = []
+            analyzer.add_tick_callback(lambda tick, values: ticks.append((tick.late, len(values))))
+            await analyzer.start_sampling()
+            await asyncio.sleep(1.2) # second tick waiting for its stations
+
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await analyzer.stop_sampling(timeout=0.1)
+            self.assertLess(loop.time() - started, 0.4)
+            self.assertTrue(analyzer.future.cancelled())
+            return ticks
+
+        with WAQIStubServer(stations=3, latency=0.5) as server:
+            self.assertEqual(asyncio.run(run()), [(2, 1)])
+
+    def test_restart_mid_tick(self):
+        """Test a run restarted during a tick does not get the values or state of the old tick"""
+        async def run():
+            analyzer = AsyncCalculateAveragePM25(48, -123.5, 49.5, -122, sampling_period=None, sampling_rate=60)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            await analyzer.start_sampling()
+            await asyncio.sleep(0.1) # first tick waiting for its stations
+
+            await analyzer.start_sampling()
+            self.assertEqual(analyzer.aggregator.count, 0)
+            self.assertTrue(all(count >= 0 for count in analyzer._tick_states.values()))
+            await asyncio.sleep(0.5)
+            counts = analyzer.aggregator.count, analyzer._tick_states['RUNNING'], analyzer._tick_states['DONE']
+            await analyzer.stop_sampling()
+            return counts
+
+        with WAQIStubServer(stations=5, latency=0.3) as server:
+            self.assertEqual(asyncio.run(run()), (5, 0, 1))
+
+    def test_sampling_modes(self):
+        """Test every sampling mode samples the same values as the threaded analyzer"""
+        def setup(analyzer, mode):
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_sampling_mode(mode)
+            return analyzer
+
+        async def run(mode):
+            analyzer = setup(AsyncCalculateAveragePM25(48, -123.5, 49.5, -122, 1, 1), mode)
+            await analyzer.start_sampling(blocking=True)
+            return analyzer
+
+        with WAQIStubServer(stations=5) as server:
+            for mode in ('station', 'map', 'hybrid'):
+                threaded = setup(CalculateAveragePM25(48, -123.5, 49.5, -122, 1, 1), mode)
+                threaded.start_sampling(blocking=True)
+                analyzer = asyncio.run(run(mode))
+                self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+                self.assertEqual(analyzer.aggregator.count, threaded.aggregator.count)
+                self.assertAlmostEqual(analyzer.avg_pm25_all_sites(), threaded.avg_pm25_all_sites())
+
+    def test_prepare_run(self):
+        """Test a run whose preparation fails ends FAILED without a tick"""
+        class Unprepared(AsyncCalculateAveragePM25):
+            def _prepare_run(self):
+                return False
+
+        async def run():
+            analyzer = Unprepared(48, -123.5, 49.5, -122, 1, 1)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            await analyzer.start_sampling(blocking=True)
+            return analyzer
+
+        with WAQIStubServer(stations=5) as server:
+            analyzer = asyncio.run(run())
+            self.assertEqual(server.stats()['feed'], 0)
+        self.assertEqual(analyzer.sampling_status(), analyzer.FAILED)
+        self.assertEqual(analyzer._tick_states['DONE'] + analyzer._tick_states['FAILED'], 0)
+        self.assertTrue(analyzer.future.done())
+
+if __name__ == '__main__':
+    unittest.main()
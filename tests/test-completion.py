@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import unittest
+from air_quality_analyzer.aggregator import StreamingAggregator
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestCompletion(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIStubServer(stations=10).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def make_analyzer(self, period=0.05, rate=60):
+        analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, period, rate)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(self.server.base_url)
+        return analyzer
+
+    def test_wait_and_future(self):
+        """Test wait(timeout), the run future and callbacks"""
+        analyzer = self.make_analyzer()
+        ticks, done = [], threading.Event()
+        analyzer.add_tick_callback(lambda tick, values: ticks.append((tick.name, tick.state, len(values))))
+        analyzer.add_done_callback(lambda future: done.set())
+        self.assertTrue(analyzer.wait(0)) # nothing started
+
+        analyzer.start_sampling()
+        self.assertFalse(analyzer.wait(0.1))
+        self.assertTrue(analyzer.wait(10))
+        self.assertTrue(done.wait(1))
+
+        expected = sum(st.aqi for st in self.server.stations) / 10
+        self.assertAlmostEqual(analyzer.future.result(), expected)
+        self.assertEqual(ticks, [("Tick-0s", "DONE", 10), ("Tick-1s", "DONE", 10), ("Tick-2s", "DONE", 10)])
+
+    def test_streaming_ticks(self):
+        """Test tick results are yielded as they complete, with rolling windows and partial averages"""
+        analyzer = self.make_analyzer()
+        analyzer.set_aggregator(StreamingAggregator(windows=(60,)))
+        analyzer.start_sampling()
+
+        results = []
+        for result in analyzer.ticks(timeout=10):
+            results.append(result)
+            self.assertIsNotNone(analyzer.avg_pm25_all_sites(partial=True))
+
+        expected = sum(st.aqi for st in self.server.stations) / 10
+        self.assertEqual([r.name for r in results], ["Tick-0s", "Tick-1s", "Tick-2s"])
+        self.assertEqual([r.windows[60]['count'] for r in results], [10, 20, 30])
+        self.assertAlmostEqual(results[0].stats['mean'], expected)
+        self.assertEqual(results[0].state, analyzer.DONE)
+        self.assertEqual(list(analyzer.ticks()), []) # the run is over
+
+    def test_await(self):
+        """Test the analyzer can be awaited for the run result"""
+        analyzer = self.make_analyzer(period=0.01)
+
+        async def run():
+            analyzer.start_sampling()
+            return await analyzer
+
+        self.assertIsNotNone(asyncio.run(run()))
+
+    def test_stop_and_failure(self):
+        """Test a stopped run cancels its future and a failed start resolves it"""
+        analyzer = self.make_analyzer(period=1)
+        analyzer.start_sampling()
+        future = analyzer.future
+        analyzer.stop_sampling()
+        self.assertTrue(future.cancelled())
+
+        analyzer.TOKEN = ""
+        analyzer.start_sampling()
+        self.assertTrue(analyzer.wait(0))
+        self.assertIsNone(analyzer.future.result())
+        self.assertEqual(analyzer.sampling_status(), analyzer.FAILED)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+from air_quality_analyzer.daemon import SamplingDaemon, build_analyzer, main
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class TestSamplingDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIStubServer(stations=6, bounds=(48.0, -123.5, 49.5, -122.0)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "daemon.sock")
+        analyzer = build_analyzer([('west', (48.0, -123.5, 49.5, -122.75)), ('east', (48.0, -122.75, 49.5, -122.0))],
+                                  sampling_rate=600, windows=(60,))
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(self.server.base_url)
+        self.daemon = SamplingDaemon(analyzer, port=0, unix_socket=self.socket_path, restart_delay=0.1)
+
+    def tearDown(self):
+        self.daemon.stop()
+        shutil.rmtree(self.directory)
+
+    def get(self, path, connection=None):
+        connection = connection or http.client.HTTPConnection("127.0.0.1", self.daemon.port)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def wait_ticks(self, count):
+        for _ in range(100):
+            last_tick = self.get("/status")[1]['last_tick']
+            if last_tick is not None and last_tick['index'] >= count - 1:
+                return
+            time.sleep(0.05)
+        self.fail("no tick published")
+
+    def test_serves_snapshots(self):
+        """Test averages, stations and status are served over HTTP without requests upstream"""
+        self.daemon.start()
+        self.wait_ticks(3)
+
+        status, averages = self.get("/averages")
+        self.assertEqual(status, 200)
+        self.assertEqual(set(averages['regions']), {'west', 'east'})
+        self.assertEqual(averages['all']['stats']['count'] % 6, 0)
+        self.assertIn('60', averages['all']['windows'])
+
+        status, stations = self.get("/stations/west")
+        self.assertEqual(status, 200)
+        self.assertTrue(all(st['pm25'] is not None for st in stations['stations']))
+        self.assertEqual(len(stations['stations']) + len(self.get("/stations/east")[1]['stations']), 6)
+
+        status, body = self.get("/status")
+        self.assertTrue(body['sampling'])
+        self.assertEqual(body['stations'], 6)
+        self.assertEqual(self.get("/unknown")[0], 404)
+
+        requests = self.server.stats()['requests']
+        connection = http.client.HTTPConnection("127.0.0.1", self.daemon.port)
+        for _ in range(50): # one keep-alive connection
+            self.get("/averages/east", connection)
+        self.assertLess(self.server.stats()['requests'] - requests, 50)
+
+    def test_unix_socket(self):
+        """Test the same snapshots are served over the Unix socket"""
+        self.daemon.start()
+        self.wait_ticks(1)
+        status, body = self.get("/averages/east", _UnixConnection(self.socket_path))
+        self.assertEqual(status, 200)
+        self.assertEqual(body['region'], 'east')
+
+    def test_stop(self):
+        """Test stop ends sampling and closes the endpoints"""
+        self.daemon.start()
+        self.wait_ticks(1)
+        self.daemon.stop()
+        self.assertFalse(self.daemon.analyzer._sampling_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+        with self.assertRaises(OSError):
+            self.get("/status")
+
+    def test_restart(self):
+        """Test a failed run is started again after the restart delay"""
+        self.daemon.analyzer.set_api_base("http://127.0.0.1:1") # nothing listens there
+        self.daemon.start()
+        time.sleep(0.5)
+        status, body = self.get("/status")
+        self.assertEqual(body['state'], 'FAILED')
+        self.assertGreater(self.daemon.runs, 1)
+
+    def test_station_without_uid(self):
+        """Test a station the map query gives no uid is served with its value"""
+        class NoUidServer(WAQIStubServer):
+            def map_body(self, bbox):
+                body = super().map_body(bbox)
+                for station in body['data']:
+                    if station['uid'] == 1:
+                        del station['uid']
+                return body
+
+        with NoUidServer(stations=6, bounds=(48.0, -123.5, 49.5, -122.0)) as server:
+            self.daemon.analyzer.set_api_base(server.base_url)
+            self.daemon.start()
+            self.wait_ticks(1)
+            stations = self.get("/stations")[1]['regions']
+            stations = stations['west'] + stations['east']
+            self.assertIn(None, [st['uid'] for st in stations])
+            self.assertTrue(all(st['pm25'] is not None for st in stations))
+
+    def test_command_line(self):
+        with self.assertRaises(SystemExit):
+            main(["--token", "x"]) # no region
+        with self.assertRaises(SystemExit):
+            main(["--token", "x", "--region", "west=48,-123.5,49.5"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch, Mock
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.decoding import FeedDecoder, ResponseDecoder
+from air_quality_analyzer.metrics import MAP_ENDPOINT, UID_ENDPOINT
+
+FEED = {"status": "ok", "data": {
+    "aqi": 42, "idx": 7,
+    "attributions": [{"url": "https://example.org", "name": "Example"}],
+    "city": {"geo": [48.4, -123.3], "name": "Victoria"},
+    "iaqi": {"co": {"v": 1.2}, "pm25": {"v": 25.5}, "t": {"v": -1}},
+    "time": {"s": "2024-01-01 10:00:00", "tz": "-08:00", "v": 1704103200, "iso": "2024-01-01T10:00:00-08:00"},
+    "forecast": {"daily": {"pm25": [{"avg": 25, "day": "2024-01-01", "max": 40, "min": 10}] * 50}},
+}}
+
+class TestFeedDecoder(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1)
+        self.analyzer.set_logger_level('critical')
+
+    def test_feed_fields(self):
+        """Test only the fields the analyzer reads are decoded, with the same values"""
+        data = FeedDecoder().decode(json.dumps(FEED).encode(), UID_ENDPOINT)
+        self.assertEqual(set(data['data']), {'idx', 'iaqi', 'time'})
+        for extract in (self.analyzer._extract_pm25, self.analyzer._extract_station_id,
+                        self.analyzer._extract_measured_at):
+            self.assertEqual(extract(data), extract(FEED))
+
+    def test_full_decode(self):
+        """Test error responses, feeds without iaqi, small bodies and map queries are decoded in full"""
+        decoder = FeedDecoder()
+        error = {"status": "error", "data": "Unknown station", "padding": "x" * 2000}
+        no_iaqi = {"status": "ok", "data": {"idx": 7, "forecast": FEED["data"]["forecast"]}}
+        small = {"status": "ok", "data": {"idx": 7, "iaqi": {"pm25": {"v": 3}}, "city": {"name": "A"}}}
+        deep = {"status": "ok", "data": {"debug": {"a": [{"b": {"c": [{"d": 1}]}}]}, **FEED["data"]}}
+        for body, endpoint in ((error, UID_ENDPOINT), (no_iaqi, UID_ENDPOINT), (small, UID_ENDPOINT),
+                               (deep, UID_ENDPOINT), (FEED, MAP_ENDPOINT)):
+            self.assertEqual(decoder.decode(json.dumps(body).encode(), endpoint), body)
+        self.assertEqual(ResponseDecoder().decode(json.dumps(FEED).encode(), UID_ENDPOINT), FEED)
+
+    def test_nested_keys(self):
+        """Test keys of the same name in nested objects are not mistaken for the ones of data"""
+        decoder = FeedDecoder()
+        feed = json.loads(json.dumps(FEED))
+        feed['data']['city'].update({"time": {"s": "2020-01-01 00:00:00", "v": 0}, "idx": 99, "status": "x"})
+        feed['data']['attributions'][0]['iaqi'] = {"pm25": {"v": 999}}
+        feed['data']['forecast']['daily']['time'] = {"v": 0}
+        feed = {"debug": {"time": {"v": 1}, "data": {"idx": 5}}, **feed}
+
+        data = decoder.decode(json.dumps(feed).encode(), UID_ENDPOINT)
+        self.assertEqual(data['data'], {key: FEED['data'][key] for key in ('idx', 'iaqi', 'time')})
+        for extract in (self.analyzer._extract_pm25, self.analyzer._extract_station_id,
+                        self.analyzer._extract_measured_at):
+            self.assertEqual(extract(data), extract(FEED))
+
+    def test_invalid_json(self):
+        for decoder in (ResponseDecoder(), FeedDecoder()):
+            with self.assertRaises(ValueError):
+                decoder.decode(b"<html>Bad Gateway</html>", UID_ENDPOINT)
+
+    @patch('requests.Session.get')
+    def test_invalid_response_fails_the_request(self, mock_get):
+        """Test a body that is not JSON fails its request without stopping the run"""
+        mock_get.return_value = Mock(status_code=200, content=b"<html>Bad Gateway</html>")
+        self.analyzer.set_token("test_token")
+        self.analyzer.start_sampling(blocking=True)
+        self.assertEqual(self.analyzer.sampling_status(), self.analyzer.FAILED)
+
+    def test_import_side_effects(self):
+        """Test importing the analyzer neither configures logging nor imports requests"""
+        code = ("import logging, sys, air_quality_analyzer.analyzer; "
+                "print(len(logging.getLogger().handlers), 'requests' in sys.modules, 'asyncio' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['0', 'False', 'False'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch, Mock
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.freshness import FreshnessTracker
+
+MAP_RESPONSE = {"status": "ok", "data": [{"lat": 48, "lon": -123.377021, "uid": 1}]}
+
+def station_response(measured_at):
+    iso = datetime.fromtimestamp(measured_at, timezone.utc).isoformat()
+    return {"status": "ok", "data": {"idx": 1, "iaqi": {"pm25": {"v": 25.0}}, "time": {"iso": iso}}}
+
+class TestFreshness(unittest.TestCase):
+    def test_prediction(self):
+        """Test the next fetch is due after the measurement interval and rechecked when late"""
+        tracker = FreshnessTracker(update_interval=3600, publish_delay=300, recheck=60)
+        self.assertTrue(tracker.due('a', now=0))
+        self.assertIsNone(tracker.last('a'))
+
+        tracker.record('a', 1, 25.0, measured_at=0, now=100)
+        self.assertEqual(tracker.last('a'), (1, 25.0))
+        self.assertFalse(tracker.due('a', now=3000))
+        self.assertTrue(tracker.due('a', now=3900))
+
+        # the same measurement again: the station is late, check it every recheck seconds
+        tracker.record('a', 1, 25.0, measured_at=0, now=3900)
+        self.assertFalse(tracker.due('a', now=3950))
+        self.assertTrue(tracker.due('a', now=3960))
+
+    def test_interval_follows_measurements(self):
+        """Test a station publishing more often than expected is fetched more often"""
+        tracker = FreshnessTracker(update_interval=3600, publish_delay=0, smoothing=1)
+        tracker.record('a', 1, 25.0, measured_at=0, now=0)
+        tracker.record('a', 1, 26.0, measured_at=600, now=600)
+        self.assertTrue(tracker.due('a', now=1200))
+
+    def test_failed_fetch_is_due(self):
+        """Test a station is fetched again after a failed request"""
+        tracker = FreshnessTracker()
+        tracker.record('a', 1, 25.0, measured_at=0, now=0)
+        tracker.record('a', 1, None, measured_at=None, now=1)
+        self.assertTrue(tracker.due('a', now=2))
+        self.assertIsNone(tracker.last('a'))
+
+    @patch('requests.Session.get')
+    def test_unchanged_stations_are_reused(self, mock_get):
+        """Test stations are not requested again before their next measurement"""
+        mock_get.side_effect = [Mock(status_code=200, content=json.dumps(MAP_RESPONSE).encode()),
+                                Mock(status_code=200, content=json.dumps(station_response(time.time())).encode())]
+
+        analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 0.05, 60)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_freshness_tracker(FreshnessTracker())
+        analyzer.start_sampling(blocking=True)
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(analyzer.aggregator.count, 3)
+        self.assertEqual(analyzer.aggregator.reused, 2)
+        self.assertEqual(analyzer.aggregator.tick_stats("Tick-0s")['reused'], 0)
+        self.assertEqual(analyzer.avg_pm25_all_sites(), 25.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import requests
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.metrics import MetricsRegistry, MetricsExporter, MAP_ENDPOINT, UID_ENDPOINT
+from air_quality_analyzer.retry import RetryPolicy
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestMetrics(unittest.TestCase):
+    def test_registry(self):
+        """Test counters, gauges and histograms are rendered in the Prometheus format"""
+        registry = MetricsRegistry(latency_buckets=(0.1, 1))
+        registry.request_started(UID_ENDPOINT)
+        registry.request_finished(UID_ENDPOINT, 429, 0.05)
+        registry.request_started(UID_ENDPOINT)
+        registry.request_finished(UID_ENDPOINT, None, 2.0)
+        registry.tick_finished('DONE', 1.5, 0.01, 10)
+
+        text = registry.render()
+        self.assertIn('air_quality_requests_total{endpoint="uid",status="429"} 1', text)
+        self.assertIn('air_quality_requests_total{endpoint="uid",status="error"} 1', text)
+        self.assertIn('air_quality_throttled_total{endpoint="uid"} 1', text)
+        self.assertIn('air_quality_requests_in_flight{endpoint="uid"} 0', text)
+        self.assertIn('air_quality_request_duration_seconds_bucket{endpoint="uid",le="0.1"} 1', text)
+        self.assertIn('air_quality_request_duration_seconds_bucket{endpoint="uid",le="+Inf"} 2', text)
+        self.assertIn('air_quality_request_duration_seconds_count{endpoint="uid"} 2', text)
+        self.assertIn('air_quality_tick_values 10', text)
+        self.assertIn('# TYPE air_quality_tick_duration_seconds histogram', text)
+
+        registry.reset()
+        self.assertEqual(registry.render(), "\n")
+
+    def test_sampling_run(self):
+        """Test a run reports requests, retries, stations and ticks, and the exporter serves them"""
+        registry = MetricsRegistry()
+        with WAQIStubServer(stations=20, throttle_rate=0.2, seed=3) as server:
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 1, 1)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_retry_policy(RetryPolicy(max_attempts=10, base_delay=0.001, max_delay=0.001))
+            analyzer.set_metrics(registry)
+            analyzer.start_sampling(blocking=True)
+
+        counters = registry.snapshot()['counters']
+        retries = sum(v for (name, _), v in counters.items() if name == 'retries_total')
+        throttled = sum(v for (name, _), v in counters.items() if name == 'throttled_total')
+        self.assertGreater(throttled, 0)
+        self.assertEqual(retries, throttled)
+        self.assertEqual(counters[('station_fetches_total', (('result', 'ok'),))], 20)
+        self.assertEqual(counters[('ticks_total', (('state', 'DONE'),))], 1)
+        self.assertEqual(counters[('requests_total', (('endpoint', MAP_ENDPOINT), ('status', '200')))], 1)
+        self.assertEqual(registry.snapshot()['gauges'][('requests_in_flight', (('endpoint', UID_ENDPOINT),))], 0)
+
+        exporter = MetricsExporter(registry, port=0, host="127.0.0.1")
+        try:
+            response = requests.get(f"http://127.0.0.1:{exporter.port}/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('air_quality_ticks_total{state="DONE"} 1', response.text)
+        finally:
+            exporter.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from air_quality_analyzer.multi_region import MultiRegionAnalyzer
+from air_quality_analyzer.ratelimit import TokenBucket
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+def inside(station, bbox):
+    return bbox[0] <= station.lat <= bbox[2] and bbox[1] <= station.lon <= bbox[3]
+
+class TestMultiRegion(unittest.TestCase):
+    def test_overlapping_regions(self):
+        """Test stations shared by regions are fetched once and counted in every region"""
+        regions = {"west": (48.0, -123.5, 49.5, -122.5), "east": (48.0, -123.0, 49.5, -122.0)}
+        with WAQIStubServer(stations=60, seed=7) as server:
+            analyzer = MultiRegionAnalyzer(regions, sampling_period=1, sampling_rate=1,
+                                           rate_limiter=TokenBucket(rate=1000))
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.start_sampling(blocking=True)
+            stats = server.stats()
+
+        west = [st for st in server.stations if inside(st, regions["west"])]
+        east = [st for st in server.stations if inside(st, regions["east"])]
+        both = {st.uid for st in west} | {st.uid for st in east}
+        self.assertTrue(set(st.uid for st in west) & set(st.uid for st in east)) # regions overlap
+
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(stats['map'], 2)
+        self.assertEqual(stats['feed'], len(both))
+        self.assertEqual(analyzer.region_aggregator("west").count, len(west))
+        self.assertEqual(analyzer.region_aggregator("east").count, len(east))
+        self.assertEqual(analyzer.aggregator.count, len(both))
+        self.assertAlmostEqual(analyzer.avg_pm25("west"), sum(st.aqi for st in west) / len(west))
+
+    def test_configuration(self):
+        with self.assertRaises(ValueError):
+            MultiRegionAnalyzer({})
+        analyzer = MultiRegionAnalyzer({"a": (48, -123, 49, -122)})
+        with self.assertRaises(ValueError):
+            analyzer.set_sampling_mode('map')
+        analyzer.add_region("b", (47, -124, 48, -123))
+        analyzer.remove_region("a")
+        self.assertEqual(list(analyzer.regions), ["b"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.metrics import MetricsRegistry
+from air_quality_analyzer.retry import RetryPolicy
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestOverrun(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIStubServer(stations=3, latency=0.5).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def make_analyzer(self, period=0.05, rate=60):
+        analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, period, rate)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(self.server.base_url)
+        analyzer.thread_cnt = 1
+        return analyzer
+
+    def test_tick_timeout(self):
+        """Test stations missing the tick's time limit are dropped and counted as late"""
+        analyzer = self.make_analyzer()
+        registry = MetricsRegistry()
+        analyzer.set_metrics(registry)
+        analyzer.set_tick_timeout(0.75)
+        ticks = []
+        analyzer.add_tick_callback(lambda tick, values: ticks.append((tick.late, len(values))))
+
+        started = time.monotonic()
+        analyzer.start_sampling()
+        self.assertTrue(analyzer.wait(10))
+
+        self.assertLess(time.monotonic() - started, 3.5)
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(ticks, [(2, 1)] * 3)
+        self.assertEqual(registry.snapshot()['counters'][('station_fetches_total', (('result', 'late'),))], 6)
+
+    def test_late_ticks_thread_bound(self):
+        """Test late ticks reuse the run's fetch pool and skip stations still answering"""
+        with WAQIStubServer(stations=6, latency=1.0) as server:
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, None, 240)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_tick_timeout(0.1)
+            analyzer.thread_cnt = 3
+            analyzer._stations = list(server.stations)
+            baseline = threading.active_count()
+            threads = []
+            analyzer.add_tick_callback(lambda tick, values: threads.append(threading.active_count()))
+
+            analyzer.start_sampling()
+            time.sleep(2.5)
+            analyzer.stop_sampling()
+
+            self.assertGreaterEqual(len(threads), 5)
+            self.assertLessEqual(max(threads), baseline + analyzer.thread_cnt + 1 + 6) # pool, scheduler, stub handlers
+            self.assertLessEqual(server.stats()['feed'], 3 * 3) # at most thread_cnt requests a second
+
+    def test_tick_timeout_retries(self):
+        """Test a retry whose backoff ends past the tick's time limit is not made"""
+        with WAQIStubServer(stations=3, throttle_rate=1.0) as server: # 429 with a Retry-After of 1s
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 0.01, 60)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_retry_policy(RetryPolicy(max_attempts=5))
+            analyzer.set_tick_timeout(0.5)
+            analyzer._stations = list(server.stations) # discovery would be throttled too
+
+            analyzer.start_sampling(blocking=True)
+            time.sleep(1.5) # a retry would have been sent by now
+            self.assertEqual(analyzer.sampling_status(), analyzer.FAILED)
+            self.assertEqual(server.stats()['requests'], 3)
+
+    def test_stop_timeout(self):
+        """Test stop_sampling(timeout) returns in time and drops the abandoned tick"""
+        analyzer = self.make_analyzer(period=None)
+        ticks = []
+        analyzer.add_tick_callback(lambda tick, values: ticks.append(tick))
+        analyzer.start_sampling()
+        time.sleep(0.2) # first tick waiting for its stations
+
+        started = time.monotonic()
+        analyzer.stop_sampling(timeout=0.2)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(analyzer.sampling_status(), analyzer.STOPPED)
+        self.assertTrue(analyzer.future.cancelled())
+        self.assertTrue(analyzer.wait(0))
+
+        time.sleep(1.6) # the abandoned tick ends without touching the stopped run
+        self.assertEqual(ticks, [])
+        self.assertEqual(analyzer.sampling_status(), analyzer.STOPPED)
+        self.assertEqual(analyzer.aggregator.count, 0)
+
+    def test_overrun_warning_level(self):
+        """Test the scheduler's overrun warnings follow the analyzer's logger level"""
+        analyzer = self.make_analyzer(period=None, rate=240) # ticks of 1.5s every 0.25s
+        with self.assertNoLogs(level='WARNING'):
+            analyzer.start_sampling()
+            time.sleep(2)
+            analyzer.stop_sampling()
+
+    def test_invalid_settings(self):
+        analyzer = self.make_analyzer()
+        with self.assertRaises(ValueError):
+            analyzer.set_overrun_policy('drop')
+        with self.assertRaises(ValueError):
+            analyzer.set_overrun_policy('queue', max_backlog=0)
+        with self.assertRaises(ValueError):
+            analyzer.set_tick_timeout(0)
+
+if __name__ == '__main__':
+    unittest.main()
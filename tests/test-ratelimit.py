@@ -0,0 +1,70 @@
+import json
+import time
+import unittest
+from unittest.mock import patch, Mock
+from concurrent.futures import ThreadPoolExecutor
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.ratelimit import TokenBucket, AdaptiveConcurrency
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        """Test requests beyond the burst are spaced at the bucket rate"""
+        bucket = TokenBucket(rate=50, burst=5)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: bucket.acquire(), range(15)))
+        self.assertGreaterEqual(time.monotonic() - start, 10 / 50 - 0.02)
+
+    def test_reserve(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def test_aimd(self):
+        """Test the limit grows on healthy responses and halves on throttling"""
+        limiter = AdaptiveConcurrency(initial=4, minimum=1, maximum=6, cooldown=0)
+        for _ in range(40):
+            limiter.acquire()
+            limiter.release(True, 0.01)
+        self.assertEqual(limiter.limit, 6)
+
+        limiter.acquire()
+        limiter.release(False, 0.01)
+        self.assertEqual(limiter.limit, 3)
+
+        limiter.acquire()
+        limiter.release(True, 10) # slow responses count as unhealthy
+        self.assertEqual(limiter.limit, 1.5)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_blocks_at_limit(self):
+        limiter = AdaptiveConcurrency(initial=1, maximum=1)
+        limiter.acquire()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(limiter.acquire)
+            time.sleep(0.05)
+            self.assertFalse(future.done())
+            limiter.release(True, 0.01)
+            future.result(1)
+
+    @patch('requests.Session.get')
+    def test_analyzer_backs_off_on_429(self, mock_get):
+        """Test throttled responses shrink the analyzer's concurrency"""
+        map_response = Mock(status_code=200, content=json.dumps({
+            "status": "ok", "data": [{"lat": 48 + i / 100, "lon": -123, "uid": i} for i in range(20)]}).encode())
+        mock_get.side_effect = lambda url, **kwargs: map_response if "map/bounds" in url else Mock(status_code=429)
+
+        analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_rate_limiter(TokenBucket(rate=1000))
+        analyzer.set_concurrency_limiter(AdaptiveConcurrency(initial=8, maximum=16))
+        self.assertEqual(analyzer.thread_cnt, 16)
+
+        analyzer.start_sampling(blocking=True)
+        self.assertEqual(analyzer.sampling_status(), analyzer.FAILED)
+        self.assertLess(analyzer.concurrency_limiter.limit, 8)
+
+if __name__ == '__main__':
+    unittest.main()
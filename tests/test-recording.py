@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.recording import (ResponseRecorder, ReplayTransport, read_recording,
+                                            replay_analyzer, request_key)
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestRecording(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIStubServer(stations=3).start()
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, "run.jsonl.gz")
+
+        analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 0.05, 60)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(cls.server.base_url)
+        with ResponseRecorder(cls.path) as recorder:
+            analyzer.set_transport(recorder)
+            recorder.record_run(analyzer)
+            analyzer.start_sampling(blocking=True)
+        cls.average = analyzer.aggregator.mean()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        shutil.rmtree(cls.directory)
+
+    def test_recorded_records(self):
+        """Test a run is recorded as its settings, every response and a mark per tick"""
+        records = list(read_recording(self.path))
+        kinds = [record['kind'] for record in records]
+        self.assertEqual(kinds[0], 'run')
+        self.assertEqual(kinds.count('response'), 1 + 3 * 3)
+        self.assertEqual(kinds.count('tick'), 3)
+        self.assertEqual(records[0]['settings']['sampling_rate'], 60)
+        self.assertTrue(all('token' not in record.get('url', '') for record in records))
+
+    def test_replay_as_fast_as_possible(self):
+        """Test a replay gives the recorded average without a request to the API"""
+        requests = self.server.stats()['requests']
+        analyzer = replay_analyzer(self.path, speed=None)
+        analyzer.set_logger_level('critical')
+
+        started = time.monotonic()
+        analyzer.start_sampling(blocking=True)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(analyzer.aggregator.count, 9)
+        self.assertAlmostEqual(analyzer.aggregator.mean(), self.average)
+        self.assertEqual(self.server.stats()['requests'], requests)
+
+    def test_replay_speed(self):
+        """Test a replay at 10x runs the recorded ticks on a tenth of the interval"""
+        analyzer = replay_analyzer(self.path, speed=10)
+        analyzer.set_logger_level('critical')
+        ticks = []
+        analyzer.add_tick_callback(lambda tick, values: ticks.append(time.monotonic()))
+
+        analyzer.start_sampling(blocking=True)
+        self.assertEqual(len(ticks), 3)
+        self.assertAlmostEqual(ticks[-1] - ticks[0], 0.2, delta=0.15)
+        self.assertAlmostEqual(analyzer.aggregator.mean(), self.average)
+
+    def test_replay_tiled_run(self):
+        """Test a run discovering stations by tiles replays with the same tiles"""
+        tiled = os.path.join(self.directory, "tiled.jsonl.gz")
+        for mode in ('map', 'hybrid'):
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 0.05, 60)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(self.server.base_url)
+            analyzer.set_sampling_mode(mode)
+            analyzer.set_tiling(rows=2, cols=3)
+            with ResponseRecorder(tiled) as recorder:
+                analyzer.set_transport(recorder)
+                recorder.record_run(analyzer)
+                analyzer.start_sampling(blocking=True)
+
+            replay = replay_analyzer(tiled, speed=None)
+            replay.set_logger_level('critical')
+            replay.start_sampling(blocking=True)
+            self.assertEqual(replay.tiling, analyzer.tiling)
+            self.assertEqual(replay.sampling_status(), replay.DONE)
+            self.assertEqual(replay.aggregator.count, analyzer.aggregator.count)
+            self.assertAlmostEqual(replay.aggregator.mean(), analyzer.aggregator.mean())
+
+    def test_replay_transport(self):
+        """Test responses are replayed per url in order and the last one is repeated"""
+        transport = ReplayTransport(self.path, run=0)
+        self.assertEqual(transport.ticks, 3)
+        station = self.server.stations[0]
+        url = f"http://elsewhere/feed/@{station.uid}/?token=other"
+        bodies = [transport.get(url).json() for _ in range(5)]
+        self.assertEqual(bodies[0]['data']['iaqi']['pm25']['v'], station.aqi)
+        self.assertEqual(bodies[3], bodies[4])
+        self.assertEqual(transport.get("http://elsewhere/feed/@999/").status_code, 404)
+        self.assertEqual(transport.misses, 1)
+        with self.assertRaises(ValueError):
+            ReplayTransport(self.path, run=1)
+
+    def test_replay_without_run_record(self):
+        """Test replaying a recording without run settings fails clearly"""
+        with self.assertRaises(ValueError):
+            replay_analyzer(self.path, run=None)
+        loose = os.path.join(self.directory, "loose.jsonl.gz")
+        with ResponseRecorder(loose) as recorder:
+            recorder.get(self.server.base_url + "/v2/map/bounds?latlng=48,-123.5,49.5,-122&networks=all")
+        with self.assertRaises(ValueError):
+            replay_analyzer(loose)
+
+    def test_truncated_recording(self):
+        """Test a recording cut short is read up to its last complete record"""
+        truncated = os.path.join(self.directory, "truncated.jsonl.gz")
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(truncated, 'wb') as f:
+            f.write(data[:len(data) * 2 // 3])
+        records = list(read_recording(truncated))
+        self.assertGreater(len(records), 0)
+        self.assertLess(len(records), 1 + 9 + 3)
+
+    def test_request_key(self):
+        self.assertEqual(request_key("https://api.waqi.info/v2/map/bounds?latlng=1,2,3,4&networks=all&token=x"),
+                         "/v2/map/bounds?latlng=1,2,3,4&networks=all")
+
+if __name__ == '__main__':
+    unittest.main()
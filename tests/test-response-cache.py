@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.response_cache import ResponseCache
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestResponseCache(unittest.TestCase):
+    def test_single_flight(self):
+        """Test concurrent fetches of one URL share a single call"""
+        cache = ResponseCache(ttl=0)
+        calls, release = [], threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return {"status": "ok"}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(cache.fetch, "url", loader) for _ in range(8)]
+            while cache.stats()['coalesced'] < 7:
+                time.sleep(0.01)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"status": "ok"}] * 8)
+        self.assertEqual(cache.stats()['entries'], 0) # ttl 0 only coalesces
+
+    def test_ttl_and_lru(self):
+        """Test responses expire, the cache is bounded and failures are not cached"""
+        cache = ResponseCache(ttl=0.05, max_entries=2)
+        self.assertEqual(cache.fetch("a", lambda: 1), 1)
+        self.assertEqual(cache.fetch("a", lambda: 2), 1)
+        time.sleep(0.06)
+        self.assertEqual(cache.fetch("a", lambda: 3), 3)
+
+        cache.fetch("b", lambda: 1)
+        cache.fetch("c", lambda: 1)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.fetch("a", lambda: 4), 4) # evicted
+
+        self.assertIsNone(cache.fetch("d", lambda: None))
+        self.assertEqual(cache.fetch("d", lambda: 5), 5)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        with self.assertRaises(ZeroDivisionError):
+            cache.fetch("e", lambda: 1 / 0)
+        self.assertEqual(cache.fetch("e", lambda: 6), 6)
+
+    def test_shared_between_analyzers(self):
+        """Test two analyzers over the same box send each request once"""
+        cache = ResponseCache(ttl=30)
+        with WAQIStubServer(stations=20) as server:
+            analyzers = []
+            for _ in range(2):
+                analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 1, 1)
+                analyzer.set_token("test_token")
+                analyzer.set_logger_level('critical')
+                analyzer.set_api_base(server.base_url)
+                analyzer.set_response_cache(cache)
+                analyzers.append(analyzer)
+
+            for analyzer in analyzers:
+                analyzer.start_sampling()
+            for analyzer in analyzers:
+                self.assertTrue(analyzer.wait(10))
+            stats = server.stats()
+
+        self.assertEqual(stats['map'], 1)
+        self.assertEqual(stats['feed'], 20)
+        for analyzer in analyzers:
+            self.assertEqual(analyzer.aggregator.count, 20)
+        self.assertEqual(cache.stats()['misses'], 21)
+
+if __name__ == '__main__':
+    unittest.main()
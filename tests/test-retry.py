@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch, Mock
+import requests
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.retry import RetryPolicy, HedgePolicy
+
+MAP_RESPONSE = {"status": "ok", "data": [{"lat": 48, "lon": -123.377021, "uid": 1}]}
+STATION_RESPONSE = {"status": "ok", "data": {"idx": 1, "iaqi": {"pm25": {"v": 25.0}}}}
+
+def ok(body):
+    return Mock(status_code=200, content=json.dumps(body).encode())
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1)
+        self.analyzer.set_token("test_token")
+        self.analyzer.set_logger_level('critical')
+
+    def test_delay(self):
+        """Test backoff is jittered, capped and at least Retry-After"""
+        policy = RetryPolicy(base_delay=0.1, max_delay=1)
+        for attempt in range(1, 10):
+            self.assertLessEqual(policy.delay(attempt), min(1, 0.1 * 2 ** (attempt - 1)))
+        self.assertGreaterEqual(policy.delay(1, retry_after=0.5), 0.5)
+        self.assertTrue(policy.retry_status(503))
+        self.assertFalse(policy.retry_status(404))
+        self.assertTrue(policy.retry_exception(requests.exceptions.Timeout()))
+        self.assertFalse(policy.retry_exception(requests.exceptions.InvalidURL()))
+
+    @patch('requests.Session.get')
+    def test_transient_errors_are_retried(self, mock_get):
+        mock_get.side_effect = [ok(MAP_RESPONSE), Mock(status_code=503), requests.exceptions.ConnectionError(),
+                                ok(STATION_RESPONSE)]
+        self.analyzer.set_retry_policy(RetryPolicy(max_attempts=3, base_delay=0.01))
+        self.analyzer.start_sampling(blocking=True)
+
+        self.assertEqual(mock_get.call_count, 4)
+        self.assertEqual(self.analyzer.sampling_status(), self.analyzer.DONE)
+        self.assertEqual(self.analyzer.avg_pm25_all_sites(), 25.0)
+
+    @patch('requests.Session.get')
+    def test_client_errors_are_not_retried(self, mock_get):
+        mock_get.side_effect = [ok(MAP_RESPONSE), Mock(status_code=404)]
+        self.analyzer.set_retry_policy(RetryPolicy(max_attempts=3, base_delay=0.01))
+        self.analyzer.start_sampling(blocking=True)
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(self.analyzer.sampling_status(), self.analyzer.FAILED)
+
+class TestHedging(unittest.TestCase):
+    def test_budget(self):
+        policy = HedgePolicy(min_samples=1, max_ratio=0.5)
+        self.assertIsNone(policy.hedge_delay()) # no latency known yet
+        policy.observe(0.1)
+        self.assertEqual(policy.hedge_delay(), 0.1)
+        self.assertTrue(policy.try_hedge())
+        self.assertFalse(policy.try_hedge())
+
+    @patch('requests.Session.get')
+    def test_slow_request_is_hedged(self, mock_get):
+        """Test a duplicate of a slow station request answers first"""
+        calls = []
+        lock = threading.Lock()
+        def fake_get(url, **kwargs):
+            if "map/bounds" in url:
+                return ok(MAP_RESPONSE)
+            with lock:
+                calls.append(url)
+                first = len(calls) == 1
+            if first:
+                time.sleep(1)
+            return ok(STATION_RESPONSE)
+        mock_get.side_effect = fake_get
+
+        policy = HedgePolicy(min_samples=5, min_delay=0.01, max_ratio=1)
+        for _ in range(5):
+            policy.observe(0.05)
+
+        analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_hedge_policy(policy)
+
+        start = time.monotonic()
+        analyzer.start_sampling(blocking=True)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(policy.hedges, 1)
+        self.assertEqual(analyzer.avg_pm25_all_sites(), 25.0)
+
+        time.sleep(1) # the dropped request finishes, the run's pools are shut down
+        self.assertEqual([thread.name for thread in threading.enumerate()
+                          if thread.name.startswith(analyzer.__class__.__name__)], [])
+
+if __name__ == '__main__':
+    unittest.main()
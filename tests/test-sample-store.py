@@ -0,0 +1,112 @@
+import math
+import os
+import tempfile
+import unittest
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.sample_store import SampleStore, Sample, NO_STATION
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestSampleStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "samples")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fill(self, store):
+        # 10 ticks of 3 stations, one outside the box (49.0, -122.0)
+        coords = {1: (48.5, -123.0), 2: (48.6, -123.1), (49.0, -122.0): None}
+        for tick in range(10):
+            store.append(1000.0 + tick * 60, {1: 10.0 + tick, 2: 20.0, (49.0, -122.0): 30.0},
+                         {k: v for k, v in coords.items() if v})
+
+    def test_append_and_reopen(self):
+        """Test rows survive reopening, in columns of packed values"""
+        self.fill(SampleStore(self.path))
+        store = SampleStore(self.path)
+        self.assertEqual(len(store), 30)
+        self.assertEqual(os.path.getsize(os.path.join(self.path, "pm25")), 30 * 4)
+
+        rows = list(store.query())
+        self.assertEqual(rows[0], Sample(1000.0, 1, 48.5, -123.0, 10.0))
+        self.assertEqual(rows[2].station, NO_STATION)
+        self.assertEqual((rows[2].lat, rows[2].lon), (49.0, -122.0))
+
+    def test_queries_and_stats(self):
+        """Test time range and bounding box queries and aggregates"""
+        store = SampleStore(self.path)
+        self.fill(store)
+
+        rows = list(store.query(start=1060, end=1180))
+        self.assertEqual({row.timestamp for row in rows}, {1060.0, 1120.0})
+        self.assertEqual(len(list(store.query(bbox=(48, -124, 48.55, -122.9)))), 10)
+
+        stats = store.stats()
+        self.assertEqual(stats['count'], 30)
+        self.assertAlmostEqual(stats['mean'], (sum(10 + t for t in range(10)) + 200 + 300) / 30)
+        self.assertEqual((stats['min'], stats['max']), (10.0, 30.0))
+
+        stats = store.stats(start=1000, end=1300, bbox=(48, -124, 48.55, -122.9))
+        self.assertEqual(stats['count'], 5)
+        self.assertAlmostEqual(stats['mean'], 12.0)
+        self.assertAlmostEqual(stats['variance'], 2.5)
+        self.assertEqual(store.stats(start=5000)['count'], 0)
+
+    def test_backfill(self):
+        """Test older rows appended later are still found"""
+        store = SampleStore(self.path)
+        self.fill(store)
+        store.append_rows([(500.0, 7, 48.5, -123.0, 50.0)])
+        self.assertFalse(store.time_ordered)
+        self.assertFalse(SampleStore(self.path).time_ordered)
+        self.assertEqual(store.stats(end=1000)['mean'], 50.0)
+        self.assertEqual(store.stats(start=1000)['count'], 30)
+
+    def test_partial_row(self):
+        """Test a partly written row is dropped on open"""
+        self.fill(SampleStore(self.path))
+        with open(os.path.join(self.path, "timestamp"), 'ab') as f:
+            f.write(b"\0" * 8)
+        store = SampleStore(self.path)
+        self.assertEqual(len(store), 30)
+        store.append_rows([(2000.0, 1, 48.5, -123.0, 1.0)])
+        self.assertEqual(list(store.query(start=2000))[0].pm25, 1.0)
+
+    def test_reader_during_append(self):
+        """Test a reader opened in the middle of an append leaves the writer's columns alone"""
+        writer = SampleStore(self.path)
+        self.fill(writer)
+        with open(os.path.join(self.path, "timestamp"), 'ab') as f: # first column of the next row
+            f.write(b"\0" * 8)
+        reader = SampleStore(self.path, readonly=True)
+        self.assertEqual(len(reader), 30)
+        self.assertEqual(reader.stats()['count'], 30)
+        self.assertEqual(os.path.getsize(os.path.join(self.path, "timestamp")), 31 * 8)
+        with self.assertRaises(ValueError):
+            reader.append_rows([(2000.0, 1, 48.5, -123.0, 1.0)])
+        with self.assertRaises(FileNotFoundError):
+            SampleStore(os.path.join(self.tmp.name, "missing"), readonly=True)
+
+    def test_analyzer_run(self):
+        """Test a run appends every tick's samples with the station coordinates"""
+        store = SampleStore(self.path)
+        with WAQIStubServer(stations=10) as server:
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 0.05, 60)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.set_sample_store(store)
+            analyzer.start_sampling()
+            self.assertTrue(analyzer.wait(10))
+
+        self.assertEqual(len(store), 30)
+        by_uid = {st.uid: st for st in server.stations}
+        for row in store.query():
+            station = by_uid[row.station]
+            self.assertTrue(math.isclose(row.lat, station.lat, abs_tol=1e-4))
+            self.assertTrue(math.isclose(row.pm25, station.aqi, abs_tol=1e-4))
+        self.assertAlmostEqual(store.stats()['mean'], analyzer.future.result(), places=4)
+
+if __name__ == '__main__':
+    unittest.main()
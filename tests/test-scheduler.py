@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch, Mock
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.scheduler import TickScheduler, tick_count, sampling_interval, after_tick, COALESCE, QUEUE
+
+class TestTickScheduler(unittest.TestCase):
+    def test_tick_count(self):
+        """Test rates that do not divide a minute and rates above 60/min"""
+        self.assertEqual(tick_count(5, 1), 5)
+        self.assertEqual(tick_count(1, 7), 7)
+        self.assertEqual(tick_count(0.1, 30), 3)
+        self.assertEqual(tick_count(2, 0.5), 1)
+        self.assertIsNone(tick_count(None, 1))
+        self.assertEqual(sampling_interval(120), 0.5)
+
+    def test_deadlines(self):
+        """Test sub-second ticks fire on their deadlines without accumulating drift"""
+        fired = []
+        scheduler = TickScheduler(0.05, lambda tick: fired.append((tick, time.monotonic())), count=10)
+        scheduler.start()
+        scheduler.join(2)
+
+        self.assertEqual([tick.index for tick, _ in fired], list(range(10)))
+        self.assertEqual(fired[3][0].name, "Tick-0.15s")
+        for tick, fired_at in fired:
+            self.assertLess(fired_at - tick.deadline, 0.03)
+        self.assertAlmostEqual(fired[-1][0].deadline - fired[0][0].deadline, 0.45)
+
+    def test_open_ended(self):
+        """Test an open-ended scheduler runs until cancelled"""
+        fired = []
+        scheduler = TickScheduler(0.01, fired.append)
+        scheduler.start()
+        time.sleep(0.2)
+        scheduler.cancel()
+        scheduler.join(1)
+        self.assertFalse(scheduler.is_alive())
+        self.assertGreater(len(fired), 5)
+
+    def test_overrun_skips(self):
+        """Test ticks whose deadline passed during a slow tick are skipped"""
+        fired = []
+        def slow(tick):
+            fired.append(tick.index)
+            if tick.index == 0:
+                time.sleep(0.25)
+        scheduler = TickScheduler(0.1, slow, count=5)
+        scheduler.start()
+        scheduler.join(2)
+        self.assertEqual(fired, [0, 3, 4])
+        self.assertEqual(scheduler.skipped, 2)
+
+    def test_overrun_policies(self):
+        """Test which overdue ticks coalesce and queue keep"""
+        # tick 0 ended at 4.5s, ticks 1 to 4 are overdue
+        self.assertEqual(after_tick(0, 1, 0, 4.5), (5, 4))
+        self.assertEqual(after_tick(0, 1, 0, 4.5, COALESCE), (4, 3))
+        self.assertEqual(after_tick(0, 1, 0, 4.5, QUEUE, max_backlog=2), (3, 2))
+        self.assertEqual(after_tick(0, 1, 0, 4.5, QUEUE, max_backlog=10), (1, 0))
+        self.assertEqual(after_tick(0, 1, 0, 0.5, COALESCE), (1, 0))
+
+    def test_overrun_coalesce_and_queue(self):
+        """Test a slow tick is followed by one catch-up tick, or by the queued ones back to back"""
+        for overrun, expected, skipped in ((COALESCE, [0, 2, 3, 4], 1), (QUEUE, [0, 1, 2, 3, 4], 0)):
+            fired = []
+            def slow(tick):
+                fired.append(tick.index)
+                if tick.index == 0:
+                    time.sleep(0.25)
+            scheduler = TickScheduler(0.1, slow, count=5, overrun=overrun, max_backlog=2)
+            scheduler.start()
+            scheduler.join(2)
+            self.assertEqual(fired, expected)
+            self.assertEqual(scheduler.skipped, skipped)
+
+    @patch('requests.Session.get')
+    def test_analyzer_thread_count(self, mock_get):
+        """Test a run with many sub-second ticks uses a constant number of threads"""
+        mock_get.side_effect = lambda url, **kwargs: Mock(status_code=200, content=json.dumps(
+            {"status": "ok", "data": [{"lat": 48, "lon": -123}]} if "map" in url
+            else {"status": "ok", "data": {"iaqi": {"pm25": {"v": 25.0}}}}).encode())
+
+        analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, sampling_period=0.01, sampling_rate=600)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+
+        threads_before = threading.active_count()
+        analyzer.start_sampling()
+        self.assertLessEqual(threading.active_count(), threads_before + 1 + analyzer.thread_cnt)
+        analyzer._scheduler.join(2)
+
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(len(analyzer.aggregator.per_tick), 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+import unittest
+from air_quality_analyzer.aggregator import RunningStats, StreamingAggregator
+from air_quality_analyzer.sharded import ShardedAnalyzer
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestShardedAnalyzer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = WAQIStubServer(stations=10).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def make_analyzer(self, period=0.05, rate=60, processes=2):
+        analyzer = ShardedAnalyzer(48.0, -123.5, 49.5, -122.0, period, rate, processes=processes)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_api_base(self.server.base_url)
+        return analyzer
+
+    def test_sharded_run(self):
+        """Test worker summaries merge into the same statistics as an in-process run"""
+        analyzer = self.make_analyzer()
+        analyzer.set_aggregator(StreamingAggregator(windows=(60,)))
+        analyzer.set_overrun_policy('queue', max_backlog=3) # a slow tick under load does not drop the next ones
+        ticks = []
+        analyzer.add_tick_callback(lambda tick, stats: ticks.append((tick.state, stats.count)))
+        analyzer.start_sampling()
+        self.assertTrue(analyzer.wait(30))
+
+        values = [st.aqi for st in self.server.stations]
+        expected = RunningStats()
+        for value in values * 3:
+            expected.add(value)
+        stats = analyzer.aggregator.stats()
+        self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+        self.assertEqual(stats['count'], 30)
+        self.assertAlmostEqual(analyzer.future.result(), expected.mean)
+        self.assertAlmostEqual(stats['variance'], expected.variance)
+        self.assertEqual((stats['min'], stats['max']), (min(values), max(values)))
+        self.assertEqual(len(analyzer.aggregator.per_tick), 3)
+        self.assertEqual(analyzer.aggregator.window_stats(60)['ticks'], 3)
+        self.assertEqual(ticks, [("DONE", 10)] * 3)
+        self.assertEqual(multiprocessing.active_children(), []) # workers stopped with the run
+
+    def test_stop(self):
+        """Test stopping an open-ended run stops the workers"""
+        analyzer = self.make_analyzer(period=None, processes=3)
+        analyzer.start_sampling()
+        result = next(analyzer.ticks(timeout=30))
+        self.assertEqual(result.stats['count'], 10)
+        analyzer.stop_sampling(timeout=5)
+        self.assertEqual(analyzer.sampling_status(), analyzer.STOPPED)
+        self.assertTrue(analyzer.future.cancelled())
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_stop_timeout(self):
+        """Test stop_sampling(timeout) is bounded while every worker is busy with a tick"""
+        with WAQIStubServer(stations=8, latency=3) as server:
+            analyzer = ShardedAnalyzer(48.0, -123.5, 49.5, -122.0, None, 60, processes=4)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url)
+            analyzer.start_sampling()
+            while analyzer.sampling_status() != analyzer.RUNNING:
+                time.sleep(0.05)
+            time.sleep(0.2)
+
+            started = time.monotonic()
+            analyzer.stop_sampling(timeout=0.1)
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertTrue(analyzer.future.cancelled())
+            self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_restart(self):
+        """Test a run restarted during a tick samples with its own workers"""
+        analyzer = self.make_analyzer(period=None)
+        analyzer.start_sampling()
+        while analyzer.sampling_status() != analyzer.RUNNING:
+            time.sleep(0.01)
+        analyzer.start_sampling()
+        results = analyzer.ticks(timeout=30)
+        self.assertEqual([next(results).stats['count'] for _ in range(2)], [10, 10])
+        analyzer.stop_sampling(timeout=5)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_add_stats(self):
+        """Test merged summaries give the same overall statistics as the values"""
+        by_values, by_stats = StreamingAggregator(), StreamingAggregator()
+        by_values.add_tick("Tick-0s", {1: 10.0, 2: 20.0, 3: 60.0}, reused={3})
+        for part in ((10.0,), (20.0, 60.0)):
+            stats = RunningStats()
+            for value in part:
+                stats.add(value)
+            by_stats.add_stats("Tick-0s", stats, reused=len(part) - 1)
+        self.assertEqual(by_stats.stats()['count'], 3)
+        self.assertAlmostEqual(by_stats.stats()['variance'], by_values.stats()['variance'])
+        self.assertEqual(by_stats.stats()['reused'], 1)
+        self.assertEqual(by_stats.tick_stats("Tick-0s")['count'], 3)
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            ShardedAnalyzer(48, -123, 49, -122, processes=0)
+        analyzer = self.make_analyzer()
+        with self.assertRaises(ValueError):
+            analyzer.set_sampling_mode('map')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+    from air_quality_analyzer.spatial import SpatialAggregator
+except ImportError:
+    np = None
+from air_quality_analyzer.sample_store import SampleStore
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestSpatialAggregator(unittest.TestCase):
+    def setUp(self):
+        # a dense cluster of 9 stations at 40 in the south west cell, one station at 10 in the north east
+        self.lat = [48.1 + 0.01 * (i % 3) for i in range(9)] + [48.9]
+        self.lon = [-123.9 + 0.01 * (i // 3) for i in range(9)] + [-123.1]
+        self.value = [40.0] * 9 + [10.0]
+        self.bbox = (48, -124, 49, -123)
+
+    def test_grid(self):
+        """Test per-cell statistics on a 2x2 grid"""
+        samples = SpatialAggregator(self.lat, self.lon, self.value)
+        grid = samples.grid(2, 2, self.bbox)
+        self.assertEqual(grid.count.tolist(), [[9, 0], [0, 1]])
+        self.assertEqual(grid.mean[0, 0], 40.0)
+        self.assertEqual(grid.variance[0, 0], 0.0)
+        self.assertTrue(np.isnan(grid.mean[0, 1]))
+        self.assertTrue(np.isnan(grid.variance[1, 1]))
+        self.assertEqual((grid.min[1, 1], grid.max[1, 1]), (10.0, 10.0))
+        self.assertEqual(grid.bbox, (48.0, -124.0, 49.0, -123.0))
+
+    def test_weighted_means(self):
+        """Test gridded and IDW means are not pulled toward the dense cluster"""
+        samples = SpatialAggregator(self.lat, self.lon, self.value)
+        self.assertAlmostEqual(samples.mean(), 37.0)
+        self.assertAlmostEqual(samples.gridded_mean(2, 2, self.bbox), 25.0)
+        idw = samples.idw_mean(20, 20, self.bbox)
+        self.assertTrue(10.0 < idw < samples.mean())
+        self.assertAlmostEqual(samples.idw_mean(20, 20, self.bbox, batch_size=7), idw)
+
+    def test_station_means(self):
+        """Test samples of the same location over several ticks are grouped"""
+        samples = SpatialAggregator([48.0, 48.0, 49.0], [-123.0, -123.0, -122.0], [10.0, 20.0, 5.0])
+        lat, lon, mean, count = samples.station_means()
+        self.assertEqual(mean.tolist(), [15.0, 5.0])
+        self.assertEqual(count.tolist(), [2, 1])
+
+    def test_from_store(self):
+        """Test samples are loaded from a sample store with time and box filters"""
+        with tempfile.TemporaryDirectory() as path:
+            store = SampleStore(os.path.join(path, "samples"))
+            self.assertEqual(len(SpatialAggregator.from_store(store)), 0)
+            for tick in range(4):
+                store.append_rows((1000.0 + 60 * tick, i, lat, lon, value)
+                                  for i, (lat, lon, value) in enumerate(zip(self.lat, self.lon, self.value)))
+
+            samples = SpatialAggregator.from_store(store, start=1060, bbox=(48.5, -124, 49, -123))
+            self.assertEqual(len(samples), 3)
+            self.assertEqual(samples.between(end=1180).time.tolist(), [1060.0, 1120.0])
+            self.assertAlmostEqual(SpatialAggregator.from_store(store).gridded_mean(2, 2, self.bbox), 25.0)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            SpatialAggregator([48.0], [-123.0, -122.0], [1.0])
+        samples = SpatialAggregator([48.0, float('nan')], [-123.0, -123.0], [1.0, 2.0])
+        self.assertEqual(len(samples), 1)
+        with self.assertRaises(ValueError):
+            samples.grid(0, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.station_cache import StationCache
+from air_quality_analyzer.stations import Station
+
+BBOX = (48, -123.377021, 49.201088, -122.7613762)
+STATIONS = [Station(48.0, -123.377021, 1), Station(49.201088, -122.7613762, 2)]
+
+class TestStationCache(unittest.TestCase):
+    def test_key_normalization(self):
+        """Test corner order does not change the key"""
+        self.assertEqual(StationCache.key(*BBOX), StationCache.key(49.201088, -122.7613762, 48, -123.377021))
+
+    def test_ttl_expiry(self):
+        cache = StationCache(ttl=60)
+        with patch('air_quality_analyzer.station_cache.time.time', return_value=1000):
+            cache.put(BBOX, STATIONS)
+        with patch('air_quality_analyzer.station_cache.time.time', return_value=1059):
+            self.assertEqual(cache.get(BBOX), STATIONS)
+        with patch('air_quality_analyzer.station_cache.time.time', return_value=1060):
+            self.assertIsNone(cache.get(BBOX))
+
+    def test_lru_eviction(self):
+        cache = StationCache(max_entries=2)
+        cache.put((0, 0, 1, 1), STATIONS)
+        cache.put((1, 1, 2, 2), STATIONS)
+        cache.get((0, 0, 1, 1))
+        cache.put((2, 2, 3, 3), STATIONS)
+        self.assertIsNone(cache.get((1, 1, 2, 2)))
+        self.assertEqual(cache.get((0, 0, 1, 1)), STATIONS)
+
+    def test_disk_store(self):
+        """Test a new cache on the same directory sees stored stations"""
+        with tempfile.TemporaryDirectory() as path:
+            StationCache(path=path).put(BBOX, STATIONS)
+            cache = StationCache(path=path)
+            self.assertEqual(cache.get(BBOX), STATIONS)
+
+            cache.invalidate()
+            self.assertIsNone(StationCache(path=path).get(BBOX))
+
+    @patch('requests.Session.get')
+    def test_analyzer_uses_cache(self, mock_get):
+        """Test a second analyzer skips the map query and refresh_stations forces it"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.content = json.dumps({"status": "ok", "data": []}).encode()
+
+        cache = StationCache()
+        cache.put(BBOX, STATIONS)
+
+        analyzer = CalculateAveragePM25(*BBOX, 1, 1, station_cache=cache)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.start_sampling()
+        analyzer.stop_sampling()
+        self.assertTrue(all('map/bounds' not in call.args[0] for call in mock_get.call_args_list))
+
+        analyzer.start_sampling(refresh_stations=True)
+        self.assertTrue(any('map/bounds' in call.args[0] for call in mock_get.call_args_list))
+        self.assertEqual(cache.get(BBOX), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import re
+import unittest
+from unittest.mock import patch, Mock
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.stations import Station, Tiling, split_bounds, merge_stations
+
+# stations spread over the box, a few of them on the tile borders
+ALL_STATIONS = [{"lat": 48 + i * 0.1, "lon": -124 + i * 0.2, "uid": i} for i in range(11)]
+
+def map_response(url, **kwargs):
+    lat1, lng1, lat2, lng2 = map(float, re.search(r"latlng=([^&]+)", url).group(1).split(","))
+    data = [st for st in ALL_STATIONS if lat1 <= st["lat"] <= lat2 and lng1 <= st["lon"] <= lng2]
+    return Mock(status_code=200, content=json.dumps({"status": "ok", "data": data}).encode())
+
+class TestTiling(unittest.TestCase):
+    def test_split_bounds(self):
+        """Test tiles cover the box edge to edge"""
+        tiles = split_bounds((49, -122, 48, -124), 2, 4)
+        self.assertEqual(len(tiles), 8)
+        self.assertEqual(min(t[0] for t in tiles), 48)
+        self.assertEqual(max(t[2] for t in tiles), 49)
+        self.assertEqual(min(t[1] for t in tiles), -124)
+        self.assertEqual(max(t[3] for t in tiles), -122)
+
+    def test_merge_stations(self):
+        """Test stations found in several tiles are kept once"""
+        merged = merge_stations([[Station(1, 1, 7), Station(2, 2)], [Station(1, 1, 7), Station(2, 2), Station(3, 3, 8)]])
+        self.assertEqual(merged, [Station(1, 1, 7), Station(2, 2), Station(3, 3, 8)])
+
+    @patch('requests.Session.get')
+    def test_adaptive_tiling(self, mock_get):
+        """Test truncated tiles are split and the merged result matches a single query"""
+        mock_get.side_effect = map_response
+
+        analyzer = CalculateAveragePM25(48, -124, 49, -122, 1, 1)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_tiling(rows=2, cols=2, max_depth=3, station_limit=4)
+        stations = analyzer._CalculateAveragePM25__discover_stations()
+
+        self.assertGreater(mock_get.call_count, 4) # at least one tile was split
+        self.assertEqual(sorted(st.uid for st in stations), list(range(11)))
+        self.assertEqual(analyzer.tiling, Tiling(2, 2, 3, 4))
+
+    @patch('requests.Session.get')
+    def test_failed_tile(self, mock_get):
+        """Test discovery fails if one tile fails"""
+        mock_get.side_effect = lambda url, **kwargs: Mock(status_code=500) if "latlng=48.0,-124.0" in url else map_response(url)
+
+        analyzer = CalculateAveragePM25(48, -124, 49, -122, 1, 1)
+        analyzer.set_token("test_token")
+        analyzer.set_logger_level('critical')
+        analyzer.set_tiling(rows=2, cols=2)
+        analyzer.start_sampling(blocking=True)
+        self.assertEqual(analyzer.sampling_status(), analyzer.FAILED)
+
+class TestSamplingModes(unittest.TestCase):
+    def setUp(self):
+        self.map_api_response = {
+            "status": "ok",
+            "data": [
+                {"lat": 48, "lon": -123.377021, "uid": 1, "aqi": "20"},
+                {"lat": 49.201088, "lon": -122.7613762, "uid": 2, "aqi": "-"}
+            ]
+        }
+        self.station_api_response = {"status": "ok", "data": {"iaqi": {"pm25": {"v": 40.0}}}}
+
+        self.analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1)
+        self.analyzer.set_token("test_token")
+        self.analyzer.set_logger_level('critical')
+
+    def fake_get(self, url, **kwargs):
+        body = self.map_api_response if "map/bounds" in url else self.station_api_response
+        return Mock(status_code=200, content=json.dumps(body).encode())
+
+    @patch('requests.Session.get')
+    def test_map_mode(self, mock_get):
+        """Test map mode only sends map queries and skips stations without a value"""
+        mock_get.side_effect = self.fake_get
+        self.analyzer.set_sampling_mode('map')
+        self.analyzer.start_sampling(blocking=True)
+
+        self.assertEqual(self.analyzer.sampling_status(), self.analyzer.DONE)
+        self.assertTrue(all("map/bounds" in call.args[0] for call in mock_get.call_args_list))
+        self.assertEqual(self.analyzer.avg_pm25_all_sites(), 20.0)
+
+    @patch('requests.Session.get')
+    def test_hybrid_mode(self, mock_get):
+        """Test hybrid mode requests the feed of stations without a map value only"""
+        mock_get.side_effect = self.fake_get
+        self.analyzer.set_sampling_mode('hybrid')
+        self.analyzer.start_sampling(blocking=True)
+
+        feeds = [call.args[0] for call in mock_get.call_args_list if "map/bounds" not in call.args[0]]
+        self.assertEqual(len(feeds), 1)
+        self.assertIn("feed/@2/", feeds[0])
+        self.assertEqual(self.analyzer.avg_pm25_all_sites(), 30.0)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            self.analyzer.set_sampling_mode('fast')
+
+if __name__ == '__main__':
+    unittest.main()
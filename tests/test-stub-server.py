@@ -0,0 +1,53 @@
+import unittest
+import requests
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.retry import RetryPolicy
+from air_quality_analyzer.stub_server import WAQIStubServer
+
+class TestStubServer(unittest.TestCase):
+    def test_endpoints(self):
+        """Test map, uid and geo feeds answer like the WAQI API"""
+        with WAQIStubServer(stations=30, station_limit=20, payload_size=4096) as server:
+            map_data = requests.get(server.base_url + "/v2/map/bounds?latlng=48,-123.5,49.5,-122&token=x").json()
+            self.assertEqual(map_data['status'], 'ok')
+            self.assertEqual(len(map_data['data']), 20)
+
+            station = server.stations[0]
+            response = requests.get(f"{server.base_url}/feed/@{station.uid}/?token=x")
+            self.assertGreaterEqual(len(response.content), 4096)
+            self.assertEqual(response.json()['data']['iaqi']['pm25']['v'], station.aqi)
+
+            feed = requests.get(f"{server.base_url}/feed/geo:{station.lat};{station.lon}/?token=x").json()
+            self.assertEqual(feed['data']['idx'], station.uid)
+            self.assertEqual(server.stats()['feed'], 2)
+
+    def test_failures(self):
+        """Test configured error and throttling rates"""
+        with WAQIStubServer(stations=1, throttle_rate=1) as server:
+            response = requests.get(server.base_url + "/feed/@1/")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], "1")
+        with WAQIStubServer(stations=1, error_rate=1) as server:
+            self.assertEqual(requests.get(server.base_url + "/feed/@1/").status_code, 500)
+            self.assertEqual(server.stats()['errors'], 1)
+        with self.assertRaises(ValueError):
+            WAQIStubServer(error_rate=0.6, throttle_rate=0.6)
+
+    def test_sampling_run(self):
+        """Test a real sampling run against the stand-in"""
+        with WAQIStubServer(stations=40, latency=0.001, error_rate=0.05, seed=1) as server:
+            analyzer = CalculateAveragePM25(48.0, -123.5, 49.5, -122.0, 1, 1)
+            analyzer.set_token("test_token")
+            analyzer.set_logger_level('critical')
+            analyzer.set_api_base(server.base_url + "/")
+            analyzer.set_retry_policy(RetryPolicy(max_attempts=5, base_delay=0.001))
+            analyzer.start_sampling(blocking=True)
+
+            self.assertEqual(analyzer.sampling_status(), analyzer.DONE)
+            self.assertEqual(analyzer.aggregator.count, 40)
+            expected = sum(st.aqi for st in server.stations) / 40
+            self.assertAlmostEqual(analyzer.avg_pm25_all_sites(), expected)
+            analyzer.clean_up()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import unittest
+from unittest.mock import patch
+from air_quality_analyzer.analyzer import CalculateAveragePM25
+from air_quality_analyzer.transport import HTTPTransport
+
+class TestHTTPTransport(unittest.TestCase):
+    def setUp(self):
+        self.map_api_response = {
+            "status": "ok",
+            "data": [{"lat": 48, "lon": -123.377021}]
+        }
+
+    def test_pool_size(self):
+        """Test the adapter pool is sized to pool_size"""
+        transport = HTTPTransport(pool_size=16)
+        adapter = transport._HTTPTransport__session.get_adapter('https://api.waqi.info')
+        self.assertEqual(adapter._pool_maxsize, 16)
+
+        transport.resize(4)
+        adapter = transport._HTTPTransport__session.get_adapter('https://api.waqi.info')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        transport.close()
+
+    def test_invalid_pool_size(self):
+        with self.assertRaises(ValueError):
+            HTTPTransport(pool_size=0)
+
+    @patch('requests.Session.get')
+    def test_timeouts_are_sent(self, mock_get):
+        """Test every request carries the configured connect/read timeouts"""
+        mock_get.return_value.status_code = 200
+        transport = HTTPTransport(connect_timeout=1, read_timeout=2)
+        transport.get("https://api.waqi.info/feed/here/")
+        mock_get.assert_called_once_with("https://api.waqi.info/feed/here/", timeout=(1, 2))
+
+    @patch('requests.Session.get')
+    def test_shared_transport(self, mock_get):
+        """Test analyzers given the same transport send requests through it"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.content = json.dumps(self.map_api_response).encode()
+
+        transport = HTTPTransport(connect_timeout=1, read_timeout=2)
+        with patch.object(transport, 'get', wraps=transport.get) as spy:
+            for _ in range(2):
+                analyzer = CalculateAveragePM25(48, -123.377021, 49.201088, -122.7613762, 1, 1, transport=transport)
+                analyzer.set_token("test_token")
+                analyzer.set_logger_level('critical')
+                analyzer.start_sampling()
+                analyzer.stop_sampling()
+            self.assertGreaterEqual(spy.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()